@@ -0,0 +1,199 @@
+# Single-pass multi-brand matching: every alias is compiled into one trie-shaped regular expression
+import random
+import re
+import time
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Union
+
+BrandAliases = Union[Iterable[str], Dict[str, Iterable[str]]]
+
+_WORD_SEPARATOR = re.compile(r"\W+")
+_COMBINING_MARKS = re.compile("[\\u0300-\\u036f]")
+# Stands in for "one or more non-word characters" between the words of a multi-word alias
+_SEPARATOR_SENTINEL = " "
+
+
+class BrandHit(NamedTuple):
+    brand: str
+    alias: str
+    start: int  # character offsets into the original text
+    end: int
+
+
+class BrandStats(NamedTuple):
+    count: int  # occurrences of any alias of the brand
+    first_offset: int  # character offset of the first occurrence
+    rank: int  # 1 for the brand named first in the text, 2 for the next distinct brand, ...
+
+
+def fold_text(text, fold_accents=True):
+    """Casefold `text` and optionally strip accents, so "LÄNSFÖRSÄKRINGAR" matches "Lansforsakringar".
+
+    Returns the folded string and a list mapping each folded position to its original position,
+    or None when positions are unchanged (the common case, including Swedish å/ä/ö).
+    """
+    if text.isascii():
+        return text.lower(), None
+    folded = text.casefold()
+    if fold_accents:
+        folded = _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", folded))
+    if len(folded) == len(text):
+        return folded, None
+
+    # Some character expanded or collapsed (ß -> ss, ligatures, pre-decomposed input): map per character
+    pieces = []
+    positions = []
+    for index, char in enumerate(text):
+        piece = char.casefold()
+        if fold_accents:
+            piece = _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", piece))
+        pieces.append(piece)
+        positions.extend([index] * len(piece))
+    return "".join(pieces), positions
+
+
+def _trie_pattern(node):
+    """Regex for a character trie, sharing common prefixes so the engine never re-reads them."""
+    branches = []
+    for char, child in sorted(node.items()):
+        if char == "":
+            continue
+        head = r"\W+" if char == _SEPARATOR_SENTINEL else re.escape(char)
+        branches.append(head + _trie_pattern(child))
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # An alias ends here but longer ones continue: the greedy optional prefers the longest
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+class BrandMatcher:
+    """Finds every tracked brand and alias in a text in one scan.
+
+    `brands` is either a list of brand names or a mapping from brand name to aliases
+    (tickers, product names, ...). Aliases match whole words only, so "Avanza" does not match
+    inside "Avanzaportfolio", but a trailing genitive "s" is accepted ("Avanzas app"). Words of
+    multi-word aliases may be separated by any punctuation or whitespace ("Trading-212").
+
+    All aliases share one trie, compiled to a single regular expression, so the regex engine
+    reads each response once no matter how many brands are tracked.
+    """
+
+    def __init__(self, brands: BrandAliases, fold_accents=True, allow_genitive_s=True):
+        if not isinstance(brands, dict):
+            brands = {brand: [brand] for brand in brands}
+        self.fold_accents = fold_accents
+        self.brands = list(brands)
+
+        self._aliases = {}
+        trie = {}
+        for brand, aliases in brands.items():
+            for alias in [brand, *aliases]:
+                key = self._alias_key(alias)
+                if not key or key in self._aliases:
+                    continue
+                self._aliases[key] = (brand, alias)
+                node = trie
+                for char in key:
+                    node = node.setdefault(char, {})
+                node[""] = {}
+
+        genitive = "s?" if allow_genitive_s else ""
+        self._pattern = re.compile(r"(?<!\w)(?:" + _trie_pattern(trie) + ")" + genitive + r"(?!\w)") if trie else None
+
+    def _alias_key(self, alias):
+        folded, _ = fold_text(alias.strip(), self.fold_accents)
+        return _WORD_SEPARATOR.sub(_SEPARATOR_SENTINEL, folded).strip(_SEPARATOR_SENTINEL)
+
+    def _lookup(self, matched_text):
+        key = _WORD_SEPARATOR.sub(_SEPARATOR_SENTINEL, matched_text)
+        found = self._aliases.get(key)
+        if found is None and key.endswith("s"):
+            found = self._aliases.get(key[:-1])
+        return found
+
+    def find_all(self, text) -> List[BrandHit]:
+        """Every brand hit in `text` in order of position, longest alias first where they overlap."""
+        if not text or self._pattern is None:
+            return []
+        folded, positions = fold_text(text, self.fold_accents)
+        hits = []
+        for match in self._pattern.finditer(folded):
+            brand, alias = self._lookup(match.group())
+            start, end = match.span()
+            if positions is not None:
+                start, end = positions[start], positions[end - 1] + 1
+            hits.append(BrandHit(brand, alias, start, end))
+        return hits
+
+    def brands_in(self, text):
+        """Set of brands mentioned at least once in `text`."""
+        return {hit.brand for hit in self.find_all(text)}
+
+    def mention_stats(self, text) -> Dict[str, BrandStats]:
+        """Occurrence count, first offset and order of first appearance for each brand in `text`."""
+        return mention_stats(self.find_all(text))
+
+
+def mention_stats(hits) -> Dict[str, BrandStats]:
+    """Per-brand stats from hits in text order, as returned by `BrandMatcher.find_all`."""
+    counts = {}
+    first_offsets = {}
+    for hit in hits:
+        if hit.brand not in counts:
+            counts[hit.brand] = 0
+            first_offsets[hit.brand] = hit.start
+        counts[hit.brand] += 1
+    # Hits come in text order, so insertion order is the rank
+    return {brand: BrandStats(counts[brand], first_offsets[brand], rank)
+            for rank, brand in enumerate(counts, start=1)}
+
+
+def naive_brands_in(text, brands):
+    """The previous approach: one lowercase copy and substring scan per brand."""
+    return {brand for brand in brands if brand.lower() in text.lower()}
+
+
+def main():
+    """Benchmark the compiled matcher against per-brand substring scans on synthetic responses."""
+    random.seed(0)
+    brands = ["Avanza", "Nordnet", "SEB", "Swedbank", "Handelsbanken", "Nordea", "Skandia", "Länsförsäkringar",
+              "Danske Bank", "Lysa", "Montrose", "Aktieinvest", "Pareto", "Carnegie", "DEGIRO", "Interactive Brokers",
+              "Revolut", "eToro", "Trading 212", "Saxo Bank", "Safello", "Klarna", "Northmill", "Resurs",
+              "Collector", "Ikano", "Marginalen", "Sparbanken Syd", "Sparbanken Skåne", "ICA Banken", "Svea",
+              "Lendo", "Zmarta", "Nordax", "Santander", "Bluestep", "TF Bank", "Avida", "Qred", "Froda",
+              "Brite", "Trustly", "Tink", "Zimpler", "Swish", "Mynt", "Anyfin", "Rocker", "Juni", "Pleo"]
+    vocabulary = ("the a best platform for trading stocks in sweden low fees app investment fund account "
+                  "isk savings broker courtage mobile user friendly recommended").split()
+    responses = []
+    for _ in range(500):
+        words = [random.choice(vocabulary) for _ in range(400)]
+        for _ in range(8):
+            words.insert(random.randrange(len(words)), random.choice(brands))
+        responses.append(" ".join(words) + ".")
+
+    for tracked in (2, 10, len(brands)):
+        subset = brands[:tracked]
+        # Three extra aliases per brand, as when tickers and product names are tracked too
+        aliases = {brand: [brand, f"{brand} app", f"{brand} AB", f"{brand}.se"] for brand in subset}
+        alias_list = [alias for names in aliases.values() for alias in names]
+        matcher = BrandMatcher(aliases)
+
+        start = time.perf_counter()
+        for response in responses:
+            naive_brands_in(response, alias_list)
+        naive_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for response in responses:
+            matcher.brands_in(response)
+        matcher_seconds = time.perf_counter() - start
+
+        print(f"{tracked:>3} brands ({len(alias_list)} aliases) x {len(responses)} responses: "
+              f"substring scans {naive_seconds * 1000:.1f} ms, compiled matcher {matcher_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# Citation analysis: every provider's search_urls as one flat, vectorized table
+import json
+import os
+import random
+import re
+import time
+from functools import lru_cache
+from itertools import chain
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from brand_matcher import fold_text
+
+# JSON file mapping brand name -> list of registrable domains, e.g. {"Avanza": ["avanza.se"]}.
+# Brands without an entry match domains whose first label is the brand name ("avanza.se", "avanza.com")
+BRAND_DOMAINS_PATH = os.getenv("BRAND_DOMAINS_PATH", "")
+TOP_DOMAINS = int(os.getenv("TOP_DOMAINS", "20"))
+
+# Public suffixes with more than one label that AI search results commonly cite. Kept local so the
+# registrable domain needs no public-suffix-list download; anything else is treated as a one-label suffix.
+MULTI_LABEL_SUFFIXES = frozenset("""
+    co.uk org.uk ac.uk gov.uk ltd.uk plc.uk me.uk net.uk
+    com.au net.au org.au edu.au gov.au co.nz org.nz govt.nz
+    co.jp ne.jp or.jp ac.jp go.jp co.kr or.kr co.in net.in org.in gov.in
+    com.br net.br org.br gov.br com.mx com.ar com.co com.tr com.cn net.cn org.cn gov.cn
+    com.hk com.sg com.my com.tw com.ua co.za org.za co.il ac.il
+    com.es com.pl com.pt com.gr co.at or.at co.id co.th
+""".split())
+
+# Gemini cites every source through a redirect on this host, which says nothing about the source
+GEMINI_REDIRECT_HOST = "vertexaisearch.cloud.google.com"
+
+CITATION_COLUMNS = ["result_index", "provider_name", "query_text", "rank", "url", "host", "domain", "title"]
+
+_HOST = re.compile(r"^(?:[a-z][a-z0-9+.\-]*://)?(?:[^@/?#]*@)?([^/?#:]*)")
+_DOMAIN_LIKE = re.compile(r"[a-z0-9\-]+(?:\.[a-z0-9\-]+)+")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def load_brand_domains(path=BRAND_DOMAINS_PATH):
+    """Brand -> domains map from BRAND_DOMAINS_PATH; empty when unset or unreadable."""
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {brand: [domain.lower() for domain in domains] for brand, domains in json.load(f).items()}
+    except Exception as e:
+        print(f"Error loading brand domains from {path}: {e}")
+        return {}
+
+
+def brand_label(brand_name):
+    """Domain label a brand name would use: "Länsförsäkringar" -> "lansforsakringar", "Danske Bank" -> "danskebank"."""
+    folded, _ = fold_text(brand_name)
+    return _NON_ALNUM.sub("", folded)
+
+
+def url_host(url):
+    """Lowercased host of `url` without a leading www; urls without a scheme are read as host/path."""
+    return _HOST.match(url.strip().lower()).group(1).removeprefix("www.")
+
+
+@lru_cache(maxsize=65536)
+def registrable_domain(host):
+    """The domain a site registered, e.g. "blogg.avanza.se" -> "avanza.se", "www.bbc.co.uk" -> "bbc.co.uk"."""
+    labels = host.removeprefix("www.").split(".")
+    size = 3 if len(labels) > 2 and ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 2
+    return ".".join(labels[-size:])
+
+
+@lru_cache(maxsize=65536)
+def citation_host(url, title=None):
+    """Host a citation points at. Gemini cites a vertexaisearch redirect whose title is the
+    source domain, so a title that looks like a domain wins over the url's host. A redirect
+    whose title is not a domain ("Avanza Bank") has no known host and gives ""."""
+    if title:
+        title = title.strip().lower().removeprefix("www.")
+        if _DOMAIN_LIKE.fullmatch(title):
+            return title
+    host = url_host(url or "")
+    return "" if host == GEMINI_REDIRECT_HOST else host
+
+
+def _split_citation(cited):
+    # Gemini cites (uri, title) pairs, the other providers plain urls
+    return (cited[0], cited[1]) if isinstance(cited, (tuple, list)) else (cited, None)
+
+
+def citation_table(results):
+    """One row per cited source across `results` (ProviderResult dicts, raw or analyzed).
+
+    `result_index` points back into `results` and `rank` is the 1-based position of the
+    source in its response's citations. Sources with no known host have an empty host and domain.
+    """
+    lists = [result.get("search_urls") or [] for result in results]
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    urls, titles = zip(*map(_split_citation, chain.from_iterable(lists))) if lengths.sum() else ((), ())
+    # citation_host and registrable_domain are cached, so repeated sources are parsed once
+    hosts = list(map(citation_host, urls, titles))
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    citations = pd.DataFrame(dict(
+        result_index=np.repeat(np.arange(len(lists)), lengths),
+        provider_name=np.repeat(np.array([result["provider_name"] for result in results], dtype=object), lengths),
+        query_text=np.repeat(np.array([result["query_text"] for result in results], dtype=object), lengths),
+        rank=np.arange(len(urls)) - starts + 1,
+        url=np.array(urls, dtype=object),
+        host=np.array(hosts, dtype=object),
+        domain=np.array(list(map(registrable_domain, hosts)), dtype=object),
+        title=np.array(titles, dtype=object)
+    ))
+    return citations[CITATION_COLUMNS]
+
+
+def brand_domain_index(brands, brand_domains=None):
+    """{key: [brands]} for matching registrable domains to brands.
+
+    Keys are the domains configured in `brand_domains` (default: BRAND_DOMAINS_PATH); brands
+    without configured domains are keyed by `brand_label`, matched against a domain's first label.
+    """
+    brand_domains = load_brand_domains() if brand_domains is None else brand_domains
+    index = {}
+    for brand in dict.fromkeys(brands):
+        for key in brand_domains.get(brand) or [brand_label(brand) + "."]:
+            index.setdefault(key.lower(), []).append(brand)
+    return index
+
+
+def _domain_brands(domain, index):
+    return index.get(domain, []) + index.get(domain.split(".", 1)[0] + ".", [])
+
+
+def brand_citations(citations, brands, brand_domains=None):
+    """The citation rows that point at one of `brands`' domains, joined with a `brand` column."""
+    index = brand_domain_index(brands, brand_domains)
+    distinct = citations["domain"].drop_duplicates()
+    lookup = pd.DataFrame([(domain, brand) for domain in distinct for brand in _domain_brands(domain, index)],
+                          columns=["domain", "brand"], dtype=object)
+    return citations.merge(lookup, on="domain")
+
+
+def domain_mentions(citations, brands, result_count, brand_domains=None):
+    """{brand: array of citation counts per result_index} for `result_count` results."""
+    matches = brand_citations(citations, brands, brand_domains)
+    return {brand: np.bincount(matches.loc[matches["brand"] == brand, "result_index"].to_numpy(dtype=np.int64),
+                               minlength=result_count)
+            for brand in brands}
+
+
+def citation_metrics(search_urls, brand_name, competitor_name, brand_domains=None, index=None):
+    """url_domains and brand/competitor domain citation counts for one response's `search_urls`.
+
+    The analysis stage calls this per response, so it skips the table; pass `index` from
+    `brand_domain_index` to reuse it across responses.
+    """
+    if index is None:
+        index = brand_domain_index([brand_name, competitor_name], brand_domains)
+    hosts = [host for host in (citation_host(*_split_citation(cited)) for cited in search_urls or []) if host]
+    matched = [brand for host in hosts for brand in _domain_brands(registrable_domain(host), index)]
+    return dict(url_domains=hosts,
+                brand_domain_mentions=matched.count(brand_name),
+                competitor_domain_mentions=matched.count(competitor_name))
+
+
+def top_domains(citations, n=TOP_DOMAINS, by=None):
+    """Most cited registrable domains: citations, responses citing them, share and best rank.
+
+    With `by` (e.g. "provider_name") the ranking is computed within each group. Sources with
+    no known domain are left out.
+    """
+    keys = [by, "domain"] if by else ["domain"]
+    citations = citations[citations["domain"] != ""]
+    ranked = citations.groupby(keys, sort=False).agg(
+        citations=("url", "size"),
+        responses=("result_index", "nunique"),
+        best_rank=("rank", "min"),
+        average_rank=("rank", "mean")
+    ).reset_index()
+    total = ranked.groupby(by)["citations"].transform("sum") if by else ranked["citations"].sum()
+    ranked["share"] = (ranked["citations"] / total * 100).round(1)
+    ranked["average_rank"] = ranked["average_rank"].round(1)
+    ranked = ranked.sort_values([*([by] if by else []), "citations", "responses"],
+                                ascending=[*([True] if by else []), False, False])
+    return (ranked.groupby(by, sort=False).head(n) if by else ranked.head(n)).reset_index(drop=True)
+
+
+def main():
+    """Benchmark citation parsing and brand joins against per-response urlparse and substring scans."""
+    random.seed(0)
+    sites = ["avanza.se", "nordnet.se", "nordnet.no", "blogg.avanza.se", "di.se", "placera.se", "reddit.com",
+             "www.bbc.co.uk", "finansportalen.se", "privataaffarer.se", "wikipedia.org", "youtube.com"]
+    providers = ["Perplexity", "Gemini", "OpenAI"]
+    results = []
+    for index in range(20000):
+        provider = providers[index % 3]
+        picks = random.sample(sites, 5)
+        if provider == "Gemini":
+            urls = [(f"https://vertexaisearch.cloud.google.com/grounding-api-redirect/{random.randrange(10**6)}",
+                     site.removeprefix("www.")) for site in picks]
+        else:
+            urls = [f"https://{site}/artikel/{random.randrange(200)}" for site in picks]
+        results.append(dict(provider_name=provider, query_text=f"query {index % 50}", search_urls=urls))
+
+    def naive(result):
+        # The previous per-response scan: urlparse every url and substring-match the brand names
+        domains = [url[1].lower() if isinstance(url, tuple) else urlparse(url).netloc.lower().removeprefix("www.")
+                   for url in result["search_urls"]]
+        return sum("avanza" in domain for domain in domains), sum("nordnet" in domain for domain in domains)
+
+    start = time.perf_counter()
+    expected = [naive(result) for result in results]
+    naive_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = brand_domain_index(["Avanza", "Nordnet"], {})
+    per_response = [citation_metrics(result["search_urls"], "Avanza", "Nordnet", index=index) for result in results]
+    metrics_seconds = time.perf_counter() - start
+    assert [(row["brand_domain_mentions"], row["competitor_domain_mentions"]) for row in per_response] == expected
+
+    start = time.perf_counter()
+    citations = citation_table(results)
+    table_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    counts = domain_mentions(citations, ["Avanza", "Nordnet"], len(results), {})
+    ranking = top_domains(citations, 5)
+    join_seconds = time.perf_counter() - start
+    assert [tuple(pair) for pair in zip(counts["Avanza"], counts["Nordnet"])] == expected
+
+    print(f"{len(citations)} citations from {len(results)} responses:")
+    print(f"  urlparse + substring scans   {naive_seconds * 1000:6.0f} ms")
+    print(f"  citation_metrics per row     {metrics_seconds * 1000:6.0f} ms (cached hosts)")
+    print(f"  citation table               {table_seconds * 1000:6.0f} ms")
+    print(f"  brand join + top domains     {join_seconds * 1000:6.0f} ms")
+    print(ranking.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# Headless runner for large query sweeps: python cli.py queries.txt --brand Avanza --competitor Nordnet
+# Search every indexed response: python cli.py search "fee levels" --provider Gemini
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+load_dotenv()
+
+from demo_runner import add_sentiment_analysis, stream_all, unit_count
+from llm_integrations import http_pool
+from llm_integrations.rate_limiter import PRIORITY_BATCH
+from llm_integrations.sentiment_analysis import SENTIMENT_BACKEND, SENTIMENT_BACKENDS
+from utils.run_store import get_default_run_store, to_table
+from utils.search_index import get_default_search_index
+
+UNIT_COLUMNS = ["provider_name", "query_text", "attempt"]
+
+
+def read_queries(path):
+    """Queries from a text file (one per line) or a JSONL file with a "query" or "query_text" field per line."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = record.get("query") or record.get("query_text")
+                if not line:
+                    continue
+            queries.append(line)
+    return queries
+
+
+class JsonlWriter:
+    """Appends one JSON object per row and flushes, so a crash loses at most the unflushed batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def completed_units(self):
+        units = set()
+        if not os.path.exists(self.path):
+            return units
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash; that unit simply runs again
+                    continue
+                # Failed units count as missing, as in the run journal, so --resume retries them
+                if not row.get("error"):
+                    units.add((row["provider_name"], row["query_text"], row["attempt"]))
+        return units
+
+    def write(self, rows, run_id, run_at):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        for row in rows:
+            self._file.write(json.dumps({"run_id": run_id, "run_at": run_at.isoformat(), **row}, default=str) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class ParquetWriter:
+    """Writes each batch as a new part file in the output directory, in the run store schema."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def completed_units(self):
+        if not os.path.isdir(self.path):
+            return set()
+        table = ds.dataset(self.path, format="parquet").to_table(columns=[*UNIT_COLUMNS, "error"])
+        rows = zip(*(table.column(name).to_pylist() for name in [*UNIT_COLUMNS, "error"]))
+        # Failed units count as missing, as in the run journal, so --resume retries them
+        return {tuple(row[:-1]) for row in rows if not row[-1]}
+
+    def write(self, rows, run_id, run_at):
+        os.makedirs(self.path, exist_ok=True)
+        part_name = f"part-{run_id}-{uuid.uuid4().hex[:8]}.parquet"
+        # Staged under a "_" name, which pyarrow datasets skip, so a crash mid-write never breaks --resume
+        staging_path = os.path.join(self.path, f"_{part_name}.tmp")
+        pq.write_table(to_table(rows, run_id, run_at), staging_path)
+        os.replace(staging_path, os.path.join(self.path, part_name))
+
+    def close(self):
+        pass
+
+
+class SweepStats:
+    def __init__(self, total_units, skipped_units):
+        self.total_units = total_units
+        self.skipped_units = skipped_units
+        self.start = time.perf_counter()
+        self.rows = 0
+        self.cache_hits = 0
+        self.errors = Counter()
+        self.latencies = defaultdict(list)
+
+    def add(self, row):
+        self.rows += 1
+        self.cache_hits += bool(row.get("cache_hit"))
+        if row.get("error"):
+            self.errors[(row["provider_name"], row["error"].split(":", 1)[0])] += 1
+        if row.get("latency_seconds") is not None and not row.get("cache_hit"):
+            self.latencies[row["provider_name"]].append(row["latency_seconds"])
+
+    def progress_line(self):
+        done = self.skipped_units + self.rows
+        elapsed = time.perf_counter() - self.start
+        return (f"{done}/{self.total_units} units, {self.rows / elapsed if elapsed else 0:.1f} rows/s, "
+                f"{sum(self.errors.values())} errors")
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        lines = [
+            f"Finished {self.rows} rows in {elapsed:.1f} s ({self.rows / elapsed if elapsed else 0:.2f} rows/s)",
+            f"Resumed past {self.skipped_units} completed units, {self.total_units - self.skipped_units - self.rows} not run",
+            f"Response cache: {self.cache_hits} hits, {self.rows - self.cache_hits} misses",
+        ]
+        for provider, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+            lines.append(f"  {provider:<12} latency p50 {statistics.median(latencies):6.2f} s, "
+                         f"p95 {p95:6.2f} s, max {latencies[-1]:6.2f} s over {len(latencies)} calls")
+        if self.errors:
+            lines.append(f"Errors ({sum(self.errors.values())}):")
+            for (provider, error_type), count in self.errors.most_common():
+                lines.append(f"  {provider:<12} {error_type:<28} {count}")
+        else:
+            lines.append("Errors: none")
+        return "\n".join(lines)
+
+
+async def run_sweep(args):
+    queries = read_queries(args.queries)
+    writer = ParquetWriter(args.output) if args.format == "parquet" else JsonlWriter(args.output)
+    if not args.resume and os.path.exists(args.output):
+        raise SystemExit(f"{args.output} already exists; pass --resume to continue it or choose another output")
+    completed = writer.completed_units() if args.resume else set()
+
+    run_id = uuid.uuid4().hex
+    run_at = datetime.now(timezone.utc)
+    # Batch jobs and search index rows are keyed by the output, which --resume keeps, so a resumed
+    # sweep reattaches to its open batch jobs and indexes no row twice
+    sweep_id = f"cli:{os.path.abspath(args.output)}"
+    stats = SweepStats(unit_count(queries, args.repeat), len(completed))
+    print(f"Run {run_id}: {len(queries)} queries x {args.repeat} repeats, "
+          f"{stats.total_units - len(completed)} units to run")
+
+    batch = []
+    stored_rows = []
+    last_progress = time.perf_counter()
+
+    def flush():
+        rows = add_sentiment_analysis(list(batch), args.sentiment_backend)
+        writer.write(rows, run_id, run_at)
+        if args.run_store:
+            stored_rows.extend(rows)
+        batch.clear()
+
+    try:
+        async for row in stream_all(args.brand, args.competitor, queries, args.repeat,
+                                    use_cache=not args.no_cache, skip_units=completed,
+                                    use_batch_api=args.batch_api,
+                                    client_id=f"cli-{run_id}", priority=PRIORITY_BATCH, run_id=sweep_id):
+            batch.append(row)
+            stats.add(row)
+            if len(batch) >= args.flush_every:
+                flush()
+            if time.perf_counter() - last_progress >= args.progress_seconds:
+                print(stats.progress_line(), flush=True)
+                last_progress = time.perf_counter()
+    finally:
+        # Runs on completion, on errors and on Ctrl-C, so finished rows are always written
+        if batch:
+            flush()
+        writer.close()
+        if args.run_store and stored_rows and get_default_run_store() is not None:
+            get_default_run_store().append(stored_rows, run_id=run_id, run_at=run_at)
+        print(stats.report())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a query sweep against every AI search provider without the UI.")
+    parser.add_argument("queries", help="Text file with one query per line, or JSONL with a \"query\" field")
+    parser.add_argument("--brand", required=True, help="Target brand")
+    parser.add_argument("--competitor", required=True, help="Main competitor")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to repeat each query (default 1)")
+    parser.add_argument("--output", required=True, help="Output .jsonl file, or directory for --format parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], help="Output format (default: from the output name)")
+    parser.add_argument("--resume", action="store_true", help="Skip units already in the output and append to it")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="Send OpenAI and Claude units as provider batch jobs: cheaper, but may take up to 24 hours")
+    parser.add_argument("--sentiment-backend", choices=list(SENTIMENT_BACKENDS), default=SENTIMENT_BACKEND)
+    parser.add_argument("--run-store", action="store_true", help="Also append the rows to the Parquet run store")
+    parser.add_argument("--flush-every", type=int, default=50, help="Rows per write (default 50)")
+    parser.add_argument("--progress-seconds", type=float, default=10, help="Seconds between progress lines")
+    args = parser.parse_args(argv)
+    if args.format is None:
+        args.format = "jsonl" if args.output.endswith(".jsonl") else "parquet"
+    return args
+
+
+def parse_search_args(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py search",
+                                     description="Ranked full-text search over every indexed response.")
+    parser.add_argument("text", nargs="?", help="Words to find; the last word also matches as a prefix")
+    parser.add_argument("--expression", help="Raw SQLite FTS5 query instead, e.g. 'courtage NEAR(avgift, 5)'")
+    parser.add_argument("--provider", help="Only responses from this provider")
+    parser.add_argument("--brand", help="Only responses analyzed for this brand")
+    parser.add_argument("--run-id", help="Only responses from this run; a CLI sweep is cli:<absolute output path>")
+    parser.add_argument("--limit", type=int, default=20, help="Results to show (default 20)")
+    args = parser.parse_args(argv)
+    if not args.text and not args.expression:
+        parser.error("give search text or --expression")
+    return args
+
+
+def run_search(args):
+    search_index = get_default_search_index()
+    if search_index is None:
+        raise SystemExit("The search index is disabled (SEARCH_INDEX_ENABLED)")
+    start = time.perf_counter()
+    try:
+        hits = search_index.search(args.text, args.limit, args.provider, args.brand, args.run_id, args.expression)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"{len(hits)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for hit in hits:
+        print(f"\n[{hit['score']:.3g}] {hit['provider_name']} | {hit['brand_name']} | run {hit['run_id']} | "
+              f"{hit['query_text']}")
+        print(f"    {hit['snippet']}")
+
+
+def main():
+    if sys.argv[1:2] == ["search"]:
+        run_search(parse_search_args(sys.argv[2:]))
+        return
+    try:
+        http_pool.run(run_sweep(parse_args()))
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with --resume to finish the remaining units.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,274 @@
 import asyncio
+import time
 from datetime import datetime
-from typing import List, Dict
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Optional, Set, Tuple
 from dotenv import load_dotenv
 load_dotenv() 
 
-from llm_integrations.perplexity_integration import PerplexityIntegration
 from llm_integrations.gemini_integration      import GeminiIntegration
-from llm_integrations.openai_integration      import OpenAIIntegration
-from llm_integrations.claude_integration      import ClaudeIntegration
-from llm_integrations.sentiment_analysis      import SentimentAnalysis
-ProviderResult = Dict  # -> the same dict shape your provider classes return
+from llm_integrations.registry                import enabled_provider_classes
+from llm_integrations.sentiment_analysis      import get_default_analyzer, SENTIMENT_BACKEND
+from llm_integrations.retry                   import with_retries
+from llm_integrations.rate_limiter            import PRIORITY_INTERACTIVE, request_context
+from llm_integrations.response_cache          import get_default_cache
+from llm_integrations.base                    import ProviderResult, attempt_indices
+from metrics                                  import analyze_results, build_matcher
+from citations                                import brand_domain_index
+from utils.run_journal                        import get_default_journal
+from utils.search_index                       import get_default_search_index
+AnalyzedResult = Dict  # -> ProviderResult fields plus the brand metrics from metrics.analyze_results
 
-def add_sentiment_analysis(results: List[ProviderResult]) -> List[ProviderResult]:
-    """Add sentiment analysis to results synchronously."""
+# Providers are picked by name from the registry; set ENABLED_PROVIDERS (e.g. "Perplexity,Gemini,OpenAI,Claude")
+PROVIDER_CLASSES = enabled_provider_classes()
+
+def add_sentiment_analysis(results: List[AnalyzedResult], backend: str = SENTIMENT_BACKEND) -> List[AnalyzedResult]:
+    """Add sentiment label and polarity to results synchronously."""
     try:
-        analyzer = SentimentAnalysis()
+        analyzer = get_default_analyzer(backend)
         contexts = [r.get("brand_mention_context") for r in results if r.get("brand_mention_context")]
         if contexts:
-            sentiments = analyzer.predict_sentiment(contexts)
+            sentiments = analyzer.predict(contexts)
             # Add sentiments back to the original results
             context_index = 0
             for result in results:
                 if result.get("brand_mention_context"):
-                    result["sentiment"] = sentiments[context_index]
+                    result["sentiment_polarity"], result["sentiment"] = sentiments[context_index]
                     context_index += 1
     except Exception as e:
         print(f"Error running sentiment analysis: {e}")
         # Continue without sentiment analysis if it fails
     return results
 
-async def run_all(
+def analyze(
+    raw_results: List[ProviderResult],
     brand: str,
     competitor: str,
+    sentiment_backend: str = SENTIMENT_BACKEND
+) -> List[AnalyzedResult]:
+    """Run the offline analysis stage (mentions, context, URL domains, sentiment) over stored responses."""
+    return add_sentiment_analysis(analyze_results(raw_results, brand, competitor), sentiment_backend)
+
+async def fetch_all(
     queries: List[str],
-    repeat_count: int = 1
+    repeat_count: int = 1,
+    use_cache: bool = True,
+    run_id: Optional[str] = None,
+    client_id: str = "default",
+    priority: int = PRIORITY_INTERACTIVE
 ) -> List[ProviderResult]:
-    """Run all providers concurrently and flatten the results."""
-    providers = [
-        PerplexityIntegration(brand_name=brand, competitor_name=competitor),
-        GeminiIntegration(brand_name=brand, competitor_name=competitor),
-        OpenAIIntegration(brand_name=brand, competitor_name=competitor),
-       # ClaudeIntegration(brand_name=brand, competitor_name=competitor),
-    ]
+    """Query all providers concurrently and return the raw, brand-independent responses.
+
+    With use_cache=False every query goes to the providers, bypassing the response cache.
+    With a run_id the run is journaled, and calling again with the same ID only runs missing units.
+    `client_id` and `priority` place the calls in the process-wide provider queues, which serve
+    interactive work first and share slots fairly between clients.
+    """
+    if run_id is not None:
+        async with aclosing(stream_run(queries, repeat_count, use_cache, run_id,
+                                       client_id=client_id, priority=priority)) as stream:
+            results = [result async for result in stream]
+        _print_cache_summary(sum(1 for r in results if r.cache_hit), len(results))
+        return results
+
+    cache = get_default_cache() if use_cache else None
+    providers = [provider_class(cache=cache) for provider_class in PROVIDER_CLASSES]
     queries = queries * repeat_count
-    tasks = [p.batch_query_perplexity(queries) if p.provider_name == "Perplexity"
-             else p.batch_query_gemini(queries) if p.provider_name == "Gemini"
-             else p.batch_query_openai(queries) if p.provider_name == "OpenAI"
-             else p.batch_query_perplexity(queries) for p in providers]
 
-    nested_results: List[List[ProviderResult]] = await asyncio.gather(*tasks)
+    try:
+        with request_context(client_id, priority):
+            nested_results: List[List[ProviderResult]] = await asyncio.gather(*[p.batch_query(queries) for p in providers])
+    finally:
+        await asyncio.gather(*[p.close() for p in providers])
     # flatten so Streamlit can loop easily
     results = [item for sub in nested_results for item in sub]
-    
+
+    _print_cache_summary(sum(1 for r in results if r.cache_hit), len(results))
+
+    return results
+
+def _print_cache_summary(cache_hits: int, total: int):
+    print(f"Response cache: {cache_hits} hits, {total - cache_hits} misses")
+
+def unit_count(queries: List[str], repeat_count: int = 1) -> int:
+    """Number of rows a run yields: one per provider, query and repeat."""
+    return len(PROVIDER_CLASSES) * len(queries) * repeat_count
+
+async def _timed_query(query, query_text, attempt):
+    start = time.perf_counter()
+    result = await query(query_text, attempt)
+    result.latency_seconds = time.perf_counter() - start
+    return [result]
+
+async def _timed_batch(batch_query, units, run_id, journal):
+    # Latency of a batch unit is the wall time of the whole job, which is what a sweep waits for
+    start = time.perf_counter()
+    results = await batch_query(units, run_id, journal)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        result.latency_seconds = elapsed
     return results
 
+async def stream_fetch(
+    queries: List[str],
+    repeat_count: int = 1,
+    use_cache: bool = True,
+    skip_units: Optional[Set[Tuple[str, str, int]]] = None,
+    use_batch_api: bool = False,
+    client_id: str = "default",
+    priority: int = PRIORITY_INTERACTIVE,
+    run_id: Optional[str] = None,
+    journal=None
+) -> AsyncIterator[ProviderResult]:
+    """Like fetch_all, but yields each raw result as soon as its provider call completes.
+
+    Units in `skip_units`, as (provider_name, query_text, attempt), are not queried, so an
+    interrupted sweep can resume. Closing the generator early (e.g. a cancelled UI run)
+    cancels the calls still in flight.
+
+    With use_batch_api=True, units of providers with a batch API (OpenAI, Claude) are submitted
+    as one batch job each: cheaper and outside the interactive rate limits, but their results
+    only arrive when the job ends (up to 24 hours). The other providers stream as usual.
+    With a `run_id` the jobs are recorded in the run journal as soon as they are submitted, and
+    a resumed run collects the jobs still open instead of submitting (and paying for) them again.
+
+    The calls wait in the process-wide provider queues as `client_id` at `priority`.
+    """
+    skip_units = skip_units or set()
+    if use_batch_api and run_id is not None:
+        journal = journal or get_default_journal()
+    cache = get_default_cache() if use_cache else None
+    providers = [provider_class(cache=cache) for provider_class in PROVIDER_CLASSES]
+    queries = queries * repeat_count
+    tasks = []
+    # Tasks copy the current context when created, so every call they make carries the client and priority
+    with request_context(client_id, priority):
+        for p in providers:
+            units = [(q, attempt) for q, attempt in zip(queries, attempt_indices(queries))
+                     if (p.provider_name, q, attempt) not in skip_units]
+            if use_batch_api and p.supports_batch_api:
+                if units:
+                    tasks.append(asyncio.ensure_future(_timed_batch(p.batch_api_query, units, run_id, journal)))
+                continue
+            tasks += [asyncio.ensure_future(_timed_query(p.query_with_retries, q, attempt)) for q, attempt in units]
+
+    try:
+        for next_results in asyncio.as_completed(tasks):
+            for result in await next_results:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*[p.close() for p in providers])
+
+async def stream_run(
+    queries: List[str],
+    repeat_count: int = 1,
+    use_cache: bool = True,
+    run_id: Optional[str] = None,
+    journal=None,
+    client_id: str = "default",
+    priority: int = PRIORITY_INTERACTIVE
+) -> AsyncIterator[ProviderResult]:
+    """stream_fetch with a durable journal: replays the units a run already completed, then runs the rest.
+
+    Every result is journaled as it arrives, so re-invoking an interrupted run with the same
+    run_id schedules only the missing or failed units.
+    """
+    journal = journal or get_default_journal()
+    run_id = journal.start_run(queries, repeat_count, unit_count(queries, repeat_count), run_id)
+    for result in journal.results(run_id):
+        yield result
+
+    async with aclosing(stream_fetch(queries, repeat_count, use_cache, journal.completed_units(run_id),
+                                     client_id=client_id, priority=priority)) as stream:
+        async for result in stream:
+            journal.record(run_id, result)
+            yield result
+
+    if len(journal.completed_units(run_id)) >= unit_count(queries, repeat_count):
+        journal.finish_run(run_id)
+
+async def stream_all(
+    brand: str,
+    competitor: str,
+    queries: List[str],
+    repeat_count: int = 1,
+    use_cache: bool = True,
+    skip_units: Optional[Set[Tuple[str, str, int]]] = None,
+    use_batch_api: bool = False,
+    client_id: str = "default",
+    priority: int = PRIORITY_INTERACTIVE,
+    run_id: Optional[str] = None
+) -> AsyncIterator[AnalyzedResult]:
+    """Streaming run_all: yields each result with brand metrics (no sentiment) as it completes.
+
+    `run_id` journals batch jobs as in stream_fetch, and keys the rows in the search index.
+    """
+    async with aclosing(stream_fetch(queries, repeat_count, use_cache, skip_units, use_batch_api,
+                                     client_id, priority, run_id)) as stream:
+        async for row in analyze_stream(stream, brand, competitor, run_id):
+            yield row
+
+async def analyze_stream(
+    raw_stream: AsyncIterator[ProviderResult],
+    brand: str,
+    competitor: str,
+    run_id: Optional[str] = None
+) -> AsyncIterator[AnalyzedResult]:
+    """Yields each raw result with brand metrics, adding it to the search index as it arrives."""
+    # Built once per stream; per row they would recompile the brand patterns and reread the domain file
+    matcher = build_matcher(brand, competitor)
+    domain_index = brand_domain_index([brand, competitor])
+    async for raw_result in raw_stream:
+        row = analyze_results([raw_result], brand, competitor, matcher=matcher, domain_index=domain_index)[0]
+        index_results([row], run_id)
+        yield row
+
+async def run_all(
+    brand: str,
+    competitor: str,
+    queries: List[str],
+    repeat_count: int = 1,
+    use_cache: bool = True,
+    run_id: Optional[str] = None,
+    client_id: str = "default",
+    priority: int = PRIORITY_INTERACTIVE
+) -> List[AnalyzedResult]:
+    """Run all providers concurrently and return the results with brand metrics (no sentiment).
+
+    Each answered row is added to the full-text search index as it arrives, under `run_id`;
+    without one, rows are keyed by their raw payload, so running the same answers again adds nothing.
+    """
+    if run_id is not None:
+        raw_stream = stream_run(queries, repeat_count, use_cache, run_id, client_id=client_id, priority=priority)
+    else:
+        raw_stream = stream_fetch(queries, repeat_count, use_cache, client_id=client_id, priority=priority)
+    async with aclosing(raw_stream):
+        rows = [row async for row in analyze_stream(raw_stream, brand, competitor, run_id)]
+    _print_cache_summary(sum(1 for row in rows if row["cache_hit"]), len(rows))
+    return rows
+
+def index_results(results: List[AnalyzedResult], run_id: Optional[str] = None) -> int:
+    """Add analyzed rows to the search index; returns the number of new rows (0 when indexing is off)."""
+    search_index = get_default_search_index()
+    if search_index is None:
+        return 0
+    try:
+        return search_index.add(results, run_id)
+    except Exception as e:
+        print(f"Error indexing results: {e}")
+        return 0
+
 async def run_analysis(analysis_prompt: str) -> str:
     """Run the analysis prompt through an LLM provider."""
     try:
         provider = GeminiIntegration()
-        response = await provider.query_gemini_without_search(analysis_prompt)
+        try:
+            response = await with_retries(provider.query_gemini_without_search, analysis_prompt)
+        finally:
+            await provider.close()
         return response
     except Exception as e:
         print(f"Error running analysis: {e}")
@@ -1,13 +1,204 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Optional, Tuple
+
+from llm_integrations.batch_jobs import BatchRequestError, BatchUnsupportedError, batch_custom_id
+from llm_integrations.rate_limiter import ProviderScheduler, estimate_tokens
+from llm_integrations.response_cache import cache_key, fetch_with_cache
+from llm_integrations.retry import with_retries
+from llm_integrations.single_flight import get_default_single_flight
+from utils.raw_store import get_default_raw_store
+
+
+@dataclass(slots=True)
+class ProviderResult:
+    """One provider answer with only the extracted fields; the raw payload lives in the raw store under `raw_id`."""
+    provider_name: str
+    model_name: str
+    query_text: str
+    attempt: int = 0
+    cache_hit: bool = False
+    response_text: Optional[str] = None
+    search_urls: list = field(default_factory=list)
+    error: Optional[str] = None
+    raw_id: Optional[str] = None
+    latency_seconds: Optional[float] = None  # wall time including rate-limit waits and retries
+
+    def as_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+def attempt_indices(queries):
+    """Number each repeat of a query (0, 1, ...) so `queries * repeat_count` yields distinct units."""
+    seen = {}
+    indices = []
+    for query in queries:
+        indices.append(seen.get(query, 0))
+        seen[query] = indices[-1] + 1
+    return indices
+
+
+def failed_result(provider, query_text, error, attempt=0):
+    """Result row for a query that still failed after retries, so the rest of the batch survives."""
+    return ProviderResult(provider_name=provider.provider_name,
+                          model_name=provider.model_name,
+                          query_text=query_text,
+                          attempt=attempt,
+                          error=f"{type(error).__name__}: {error}")
+
 
 class BaseProvider(ABC):
+    """Contract shared by every AI search integration.
+
+    Subclasses set the class attributes and implement `fetch`; the cache, scheduler, retries
+    and raw store wrap every provider the same way through `query`, `query_with_retries` and
+    `batch_query`. Providers with a batch API set `supports_batch_api` and implement
+    `submit_batch(requests)`, which submits {custom_id: query_text} as one job and returns its
+    batch ID, and `batch_results(batch_id)`, which waits for the job to end (cancelling the wait
+    cancels the job) and returns {custom_id: fetched dict or error}.
+    """
     provider_name: str
+    env_prefix: str                   # <PREFIX>_MAX_CONCURRENCY / _RPM / _TPM configure the scheduler
+    tool_config: Dict = {}            # request settings that change the answer, part of the cache key
+    estimated_output_tokens: int = 1000
+    supports_batch_api: bool = False
 
-    def __init__(self, brand_name: str, competitor_name: str):
-        self.brand_name = brand_name
-        self.competitor_name = competitor_name
+    def __init__(self, model_name, scheduler=None, cache=None, raw_store=None):
+        self.model_name = model_name
+        self.scheduler = scheduler or ProviderScheduler.shared(self.env_prefix)
+        self.cache = cache
+        self.raw_store = raw_store or get_default_raw_store()
+        self.single_flight = get_default_single_flight()
 
     @abstractmethod
-    async def batch_query(self, queries: List[str]) -> List[Dict]:
-        ...
+    async def fetch(self, query_text) -> Dict:
+        """Call the provider once and return dict(response=raw payload, response_text=..., search_urls=...)."""
+
+    def restore_search_urls(self, search_urls):
+        """Hook for providers whose citations do not survive the JSON round trip of the cache unchanged."""
+        return search_urls
+
+    def cache_key(self, query_text, attempt):
+        return cache_key(self.provider_name, self.model_name, query_text, attempt, self.tool_config)
+
+    async def build_result(self, query_text, attempt, fetched, cache_hit):
+        # Serializing, hashing and writing the payload would hold the event loop for every row, cache hits included
+        raw_id = await asyncio.to_thread(self.raw_store.put, fetched["response"]) if self.raw_store else None
+        return ProviderResult(provider_name=self.provider_name,
+                              model_name=self.model_name,
+                              query_text=query_text,
+                              attempt=attempt,
+                              cache_hit=cache_hit,
+                              response_text=fetched["response_text"],
+                              search_urls=self.restore_search_urls(fetched["search_urls"]),
+                              raw_id=raw_id)
+
+    async def query(self, query_text, attempt=0) -> ProviderResult:
+        """One cached provider call, without scheduling or retries."""
+        fetched, cache_hit = await fetch_with_cache(self.cache, self.cache_key(query_text, attempt),
+                                                    lambda: self.fetch(query_text))
+        return await self.build_result(query_text, attempt, fetched, cache_hit)
+
+    async def _scheduled_fetch(self, query_text, key):
+        return await with_retries(
+            self.scheduler.run, fetch_with_cache, self.cache, key, lambda: self.fetch(query_text),
+            estimated_tokens=estimate_tokens(query_text, self.estimated_output_tokens)
+        )
+
+    async def query_with_retries(self, query_text, attempt=0) -> ProviderResult:
+        """Scheduled, retried query that returns a failed row instead of raising.
+
+        Cached answers are returned without waiting for a scheduler slot. Identical calls already
+        in flight (same cache key, e.g. from another session) share one upstream request; that is
+        always done for first attempts, and for repeats only with the cache on, since the repeats
+        would then share the cached answer anyway. Shared answers are reported as cache hits.
+        """
+        key = self.cache_key(query_text, attempt)
+        try:
+            cached = self.cache.get(key) if self.cache else None
+            if cached is not None:
+                return await self.build_result(query_text, attempt, cached, True)
+            if self.single_flight is not None and (attempt == 0 or self.cache is not None):
+                (fetched, cache_hit), shared = await self.single_flight.do(
+                    key, lambda: self._scheduled_fetch(query_text, key))
+                return await self.build_result(query_text, attempt, fetched, cache_hit or shared)
+            fetched, cache_hit = await self._scheduled_fetch(query_text, key)
+            return await self.build_result(query_text, attempt, fetched, cache_hit)
+        except Exception as e:
+            print(f"{self.provider_name} query failed: {e}")
+            return failed_result(self, query_text, e, attempt)
+
+    async def batch_query(self, queries: List[str]) -> List[ProviderResult]:
+        """Process multiple queries concurrently with rate limiting."""
+        return await asyncio.gather(*[
+            self.query_with_retries(query, attempt)
+            for query, attempt in zip(queries, attempt_indices(queries))
+        ])
+
+    async def batch_api_query(self, units: List[Tuple[str, int]], run_id=None, journal=None) -> List[ProviderResult]:
+        """Runs (query_text, attempt) units as one provider batch job and returns results in unit order.
+
+        Cached units are not resubmitted and batch answers are cached under the same keys as
+        direct calls. Requests that error or are missing from the job output become failed rows.
+        With a `journal`, the job is recorded under `run_id` as soon as it is submitted, and units
+        still in an open job of that run are collected from it instead of being submitted again.
+        Raises BatchUnsupportedError for providers without a batch API.
+        """
+        if not self.supports_batch_api:
+            raise BatchUnsupportedError(f"{self.provider_name} has no batch API")
+        results = [None] * len(units)
+        pending = {}
+        for index, (query_text, attempt) in enumerate(units):
+            cached = self.cache.get(self.cache_key(query_text, attempt)) if self.cache else None
+            if cached is not None:
+                results[index] = await self.build_result(query_text, attempt, cached, True)
+            else:
+                pending[(query_text, attempt)] = index
+
+        jobs = {}
+        unsubmitted = dict(pending)
+        if journal is not None and pending:
+            for batch_id, requests in journal.open_batches(run_id, self.provider_name).items():
+                claimed = {custom_id: unit for custom_id, unit in requests.items()
+                           if unsubmitted.pop(unit, None) is not None}
+                if claimed:
+                    print(f"Reattaching to {self.provider_name} batch {batch_id} for {len(claimed)} units")
+                    jobs[batch_id] = claimed
+                else:
+                    journal.finish_batch(batch_id)
+
+        if unsubmitted:
+            requests = {batch_custom_id(index): unit for index, unit in enumerate(unsubmitted)}
+            try:
+                batch_id = await self.submit_batch({custom_id: unit[0] for custom_id, unit in requests.items()})
+            except Exception as e:
+                print(f"{self.provider_name} batch failed: {e}")
+                for query_text, attempt in requests.values():
+                    results[pending[(query_text, attempt)]] = failed_result(self, query_text, e, attempt)
+            else:
+                if journal is not None:
+                    journal.record_batch(run_id, self.provider_name, batch_id, requests)
+                jobs[batch_id] = requests
+
+        collected = await asyncio.gather(*[self.batch_results(batch_id) for batch_id in jobs], return_exceptions=True)
+        for (batch_id, requests), answers in zip(jobs.items(), collected):
+            if isinstance(answers, Exception):
+                # The job stays open in the journal, so a resumed run tries to collect it again
+                print(f"{self.provider_name} batch {batch_id} failed: {answers}")
+            for custom_id, (query_text, attempt) in requests.items():
+                index = pending[(query_text, attempt)]
+                fetched = answers if isinstance(answers, Exception) else answers.get(
+                    custom_id, BatchRequestError("missing from batch results"))
+                if isinstance(fetched, Exception):
+                    results[index] = failed_result(self, query_text, fetched, attempt)
+                    continue
+                if self.cache:
+                    self.cache.set(self.cache_key(query_text, attempt), fetched)
+                results[index] = await self.build_result(query_text, attempt, fetched, False)
+            if journal is not None and not isinstance(answers, Exception):
+                journal.finish_batch(batch_id)
+        return results
+
+    async def close(self):
+        """Release per-run resources. Clients are shared through http_pool and stay open for the next run."""
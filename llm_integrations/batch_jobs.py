@@ -0,0 +1,54 @@
+# Shared helpers for provider batch APIs: submit many requests as one job, poll until it ends
+import asyncio
+import os
+import time
+
+from llm_integrations.retry import with_retries
+
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+BATCH_MAX_POLL_SECONDS = float(os.getenv("BATCH_MAX_POLL_SECONDS", "600"))
+# Both providers finish or expire batches within 24 hours
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", str(25 * 3600)))
+
+
+class BatchRequestError(Exception):
+    """One request inside a batch job that errored, expired or was cancelled."""
+
+
+class BatchUnsupportedError(Exception):
+    """A batch job was asked of a provider without a batch API."""
+
+
+def batch_custom_id(index):
+    """ID tying a batch result line back to its unit; both providers accept [A-Za-z0-9_-]{1,64}."""
+    return f"unit-{index}"
+
+
+async def poll_batch(retrieve, is_done, label, cancel=None, poll_seconds=BATCH_POLL_SECONDS,
+                     max_poll_seconds=BATCH_MAX_POLL_SECONDS, timeout_seconds=BATCH_TIMEOUT_SECONDS):
+    """Retrieve a batch job until `is_done(job)`, backing off from `poll_seconds` to `max_poll_seconds`.
+
+    Batches take minutes to hours, so the interval grows instead of spending requests on a job
+    that is nowhere near done. If the wait is cancelled (a stopped run), `cancel()` stops the job
+    on the provider's side too, so it is not billed for answers nobody collects.
+    """
+    deadline = time.monotonic() + timeout_seconds
+    delay = poll_seconds
+    try:
+        while True:
+            job = await with_retries(retrieve)
+            if is_done(job):
+                return job
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"{label} did not finish within {timeout_seconds / 3600:.1f} hours")
+            print(f"{label} still running, next check in {delay:.0f} s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, max_poll_seconds)
+    except asyncio.CancelledError:
+        if cancel is not None:
+            try:
+                await cancel()
+                print(f"Cancelled {label}")
+            except Exception as e:
+                print(f"Error cancelling {label}: {e}")
+        raise
@@ -1,61 +1,85 @@
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 import json
 import os
 from dotenv import load_dotenv
 import asyncio
-from metrics import has_brand_mention
+from metrics import analyze_response
+from llm_integrations.base import BaseProvider
+from llm_integrations.batch_jobs import BatchRequestError, poll_batch
+from llm_integrations.http_pool import http_client, shared_client
+from llm_integrations.registry import register_provider
+from llm_integrations.retry import with_retries
 
 load_dotenv()
 
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 CLAUDE_MODEL_NAME = os.getenv("CLAUDE_MODEL_NAME")
+CLAUDE_MAX_TOKENS = 500
+CLAUDE_SEARCH_TOOLS = [{"type": "web_search_20250305", "name": "web_search", "max_uses": 2}]
+CLAUDE_TOOL_CONFIG = {"tools": CLAUDE_SEARCH_TOOLS, "max_tokens": CLAUDE_MAX_TOKENS}
 
-# TODO: Look into batching!! This seems very simple in Anthropic integration
-class ClaudeIntegration:
-    def __init__(self, model_name=CLAUDE_MODEL_NAME, api_key=CLAUDE_API_KEY, brand_name="Avanza", competitor_name="Nordnet"):
-        self.client = Anthropic(api_key=api_key)
-        self.model_name = model_name
-        self.brand_name = brand_name
-        self.competitor_name = competitor_name
-        self.provider_name = "Claude"
+@register_provider
+class ClaudeIntegration(BaseProvider):
+    provider_name = "Claude"
+    env_prefix = "CLAUDE"
+    tool_config = CLAUDE_TOOL_CONFIG
+    estimated_output_tokens = CLAUDE_MAX_TOKENS
+    supports_batch_api = True
 
-    async def query_claude(self, query_text):
-        response = self.client.messages.create(
-            model=self.model_name,
-            max_tokens=500,
-            messages=[
-                {"role": "user", "content": query_text}
-            ],
-            tools=[{
-                "type":"web_search_20250305",
-                "name": "web_search",
-                "max_uses": 2
-            }],
-        )
-        
-        response_text = await self.extract_response_text(response)
-        search_urls = await self.extract_search_urls(response)
-        brand_mention, competitor_mention = await self.extract_brand_mentions(response, self.brand_name, self.competitor_name)
-        brand_mention_context = await self.extract_brand_mention_context(response, self.brand_name)
-        
-        output = dict(brand_name=self.brand_name,
-                provider_name=self.provider_name,
-                model_name=self.model_name,
-                query_text=query_text, 
-                response=response, 
-                response_text=response_text, 
-                search_urls=search_urls, 
-                brand_mention=brand_mention, 
-                competitor_mention=competitor_mention,
-                brand_mention_context=brand_mention_context)
+    def __init__(self, model_name=CLAUDE_MODEL_NAME, api_key=CLAUDE_API_KEY, scheduler=None, cache=None, raw_store=None):
+        super().__init__(model_name, scheduler, cache, raw_store)
+        self.client = shared_client(("Claude", api_key), lambda: AsyncAnthropic(
+            api_key=api_key, max_retries=0, http_client=http_client()))
 
-        return output
-    
-    
-    async def batch_query_claude(self, queries):
-        responses = await asyncio.gather(*[self.query_claude(query) for query in queries])
+    def message_params(self, query_text):
+        """Messages API parameters for one query, shared by direct calls and batch jobs."""
+        return dict(model=self.model_name,
+                    max_tokens=CLAUDE_MAX_TOKENS,
+                    messages=[
+                        {"role": "user", "content": query_text}
+                    ],
+                    tools=CLAUDE_SEARCH_TOOLS)
+
+    async def extract_fetched(self, response):
+        return dict(response=response.model_dump(mode="json", exclude_none=True),
+                    response_text=await self.extract_response_text(response),
+                    search_urls=await self.extract_search_urls(response))
+
+    async def fetch(self, query_text):
+        """Calls the Messages API with web search and returns the raw payload plus the extracted text and citations."""
+        response = await self.client.messages.create(**self.message_params(query_text))
+        return await self.extract_fetched(response)
+
+    async def submit_batch(self, requests):
+        """Submits the requests to the Message Batches API: cheaper and outside the interactive
+        rate limits, but results can take up to 24 hours."""
+        batch = await with_retries(self.client.messages.batches.create, requests=[
+            {"custom_id": custom_id, "params": self.message_params(query_text)}
+            for custom_id, query_text in requests.items()
+        ])
+        print(f"Submitted Claude batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    async def batch_results(self, batch_id):
+        # A cancelled batch also ends, with the requests it never processed reported as canceled
+        await poll_batch(lambda: self.client.messages.batches.retrieve(batch_id),
+                         lambda job: job.processing_status == "ended",
+                         f"Claude batch {batch_id}",
+                         cancel=lambda: with_retries(self.client.messages.batches.cancel, batch_id))
+
+        answers = {}
+        async for entry in await with_retries(self.client.messages.batches.results, batch_id):
+            if entry.result.type != "succeeded":
+                error = f"{entry.result.type} {getattr(entry.result, 'error', '') or ''}".strip()
+                answers[entry.custom_id] = BatchRequestError(error)
+                continue
+            try:
+                answers[entry.custom_id] = await self.extract_fetched(entry.result.message)
+            except Exception as e:
+                # One unreadable answer fails its own unit, not the whole job on every resume
+                answers[entry.custom_id] = BatchRequestError(f"unreadable result: {type(e).__name__}: {e}")
+        return answers
 
-        return responses
     
     async def extract_response_text(self, response):
         text = ""
@@ -73,38 +97,13 @@ class ClaudeIntegration:
                         urls.append(citation.url)
         return urls
 
-    async def extract_brand_mention_context(self, response, brand_name):
-        text = await self.extract_response_text(response)
-        if brand_name.lower() not in text.lower():
-            return None
-        
-        brand_index = text.lower().find(brand_name.lower())
-        text_after_brand = text[brand_index:]
-
-        import re
-        sentences = re.split(r'(?<=[.!?])\s+', text_after_brand)
-        
-        result_sentences = sentences[:min(3, len(sentences))]
-        result = ' '.join(result_sentences)
-        
-        return result
-            
-    async def extract_brand_mentions(self, response, brand_name, competitor_name):
-        text = await self.extract_response_text(response)
-        brand_mention = await has_brand_mention(text, brand_name)
-        competitor_mention = await has_brand_mention(text, competitor_name)
-        return brand_mention, competitor_mention
-    
 async def main():
     claude_integration = ClaudeIntegration()
-    response = await claude_integration.query_claude("What's the best service to trade stocks in Sweden?")
-    for content in response.content:
-        if content.type == "text":
-            print(content.text)
-            if content.citations is not None:
-                for citation in content.citations:
-                    print(citation.url)
-                    print(citation.title)
+    response = await claude_integration.query("What's the best service to trade stocks in Sweden?")
+    print(response.response_text)
+    print(response.search_urls)
+    print(analyze_response(response.response_text, response.search_urls, "Avanza", "Nordnet"))
+    await claude_integration.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,29 +1,40 @@
 import asyncio
 from google import genai
-from google.genai.types import Tool, GenerateContentConfig, GoogleSearchRetrieval
+from google.genai.types import Tool, GenerateContentConfig, GoogleSearchRetrieval, HttpOptions
 import os 
 from dotenv import load_dotenv
-from metrics import has_brand_mention
+from metrics import analyze_response
+from llm_integrations.base import BaseProvider
+from llm_integrations.http_pool import client_args, shared_client
+from llm_integrations.registry import register_provider
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME")
+# No output cap is sent for this provider, so budget a typical answer length
+GEMINI_ESTIMATED_OUTPUT_TOKENS = 1000
+GEMINI_TOOL_CONFIG = {"tools": ["google_search_retrieval"], "response_modalities": ["TEXT"]}
 
-class GeminiIntegration:
-    def __init__(self, model_name=GEMINI_MODEL_NAME, api_key=GEMINI_API_KEY, brand_name="Avanza", competitor_name="Nordnet"):
-        self.client = genai.Client(api_key=api_key)
-        self.model_name = model_name
-        self.brand_name = brand_name
-        self.competitor_name = competitor_name
-        self.provider_name = "Gemini"
+@register_provider
+class GeminiIntegration(BaseProvider):
+    provider_name = "Gemini"
+    env_prefix = "GEMINI"
+    tool_config = GEMINI_TOOL_CONFIG
+    estimated_output_tokens = GEMINI_ESTIMATED_OUTPUT_TOKENS
 
-    async def query_gemini(self, query_text):
+    def __init__(self, model_name=GEMINI_MODEL_NAME, api_key=GEMINI_API_KEY, scheduler=None, cache=None, raw_store=None):
+        super().__init__(model_name, scheduler, cache, raw_store)
+        self.client = shared_client(("Gemini", api_key), lambda: genai.Client(
+            api_key=api_key, http_options=HttpOptions(async_client_args=client_args())))
+
+    async def fetch(self, query_text):
+        """Calls Gemini with Google Search grounding and returns the raw payload plus the extracted text and sources."""
         google_search_tool = Tool(
             google_search_retrieval = GoogleSearchRetrieval()
         )
 
-        response = self.client.models.generate_content(
+        response = await self.client.aio.models.generate_content(
             model=self.model_name,
             contents=query_text,
             config=GenerateContentConfig(
@@ -31,27 +42,17 @@ class GeminiIntegration:
                     response_modalities=["TEXT"],
                 )
             )
-        
-        response_text = await self.extract_response_text(response)
-        search_urls = await self.extract_search_urls(response)
-        brand_mention, competitor_mention = await self.extract_brand_mentions(response, self.brand_name, self.competitor_name)
-        brand_mention_context = await self.extract_brand_mention_context(response, self.brand_name)
-        
-        output = dict(brand_name=self.brand_name,
-                provider_name=self.provider_name,
-                model_name=self.model_name,
-                query_text=query_text, 
-                response=response, 
-                response_text=response_text, 
-                search_urls=search_urls, 
-                brand_mention=brand_mention, 
-                competitor_mention=competitor_mention,
-                brand_mention_context=brand_mention_context)
-        
-        return output
-    
+
+        return dict(response=response.model_dump(mode="json", exclude_none=True),
+                    response_text=await self.extract_response_text(response),
+                    search_urls=await self.extract_search_urls(response))
+
+    def restore_search_urls(self, search_urls):
+        # JSON turns the (uri, title) pairs into lists, so restore the tuples the UI expects
+        return [tuple(url) for url in search_urls]
+
     async def query_gemini_without_search(self, query_text):
-        response = self.client.models.generate_content(
+        response = await self.client.aio.models.generate_content(
             model=self.model_name,
             contents=query_text
         )
@@ -59,11 +60,6 @@ class GeminiIntegration:
         response_text = await self.extract_response_text(response)
         return response_text
         
-    async def batch_query_gemini(self, queries):
-        responses = await asyncio.gather(*[self.query_gemini(query) for query in queries])
-
-        return responses
-    
     async def extract_response_text(self, response):
         return response.candidates[0].content.parts[0].text.replace('*', '')
     
@@ -72,32 +68,7 @@ class GeminiIntegration:
         grounding_supports = response.candidates[0].grounding_metadata.grounding_chunks
         grounding_urls = [(chunk.web.uri, chunk.web.title) for chunk in grounding_supports if chunk.web]
         return grounding_urls
-    
-    async def extract_brand_mention_context(self, response, brand_name):
-        response_text = response.candidates[0].content.parts[0].text.replace('*', '')
-        if brand_name.lower() not in response_text.lower():
-            return None
-        
-        brand_index = response_text.lower().find(brand_name.lower())
-        text_after_brand = response_text[brand_index:]
 
-        import re
-        sentences = re.split(r'(?<=[.!?])\s+', text_after_brand)
-        
-        result_sentences = sentences[:min(3, len(sentences))]
-        result = ' '.join(result_sentences)
-        
-        return result
-    
-    # CALCULATING METRICS AND SUMMARIZING
-    async def extract_brand_mentions(self, response, brand_name, competitor_name):
-        response_text = await self.extract_response_text(response)
-        brand_mention = await has_brand_mention(response_text, brand_name)
-        competitor_mention = await has_brand_mention(response_text, competitor_name)
-        return brand_mention, competitor_mention
-    
-    
-        
 
 async def main():
     gemini_integration = GeminiIntegration(model_name=GEMINI_MODEL_NAME, api_key=GEMINI_API_KEY)
@@ -105,12 +76,11 @@ async def main():
         "Can you give me some information about the best trading apps in sweden?",
     ]
     
-    response = await gemini_integration.query_gemini(queries[0])
+    response = await gemini_integration.query(queries[0])
     
-    print(response["response_text"])
-    print(response["search_urls"])
-    print(response["brand_mention"])
-    print(response["brand_mention_context"])
+    print(response.response_text)
+    print(response.search_urls)
+    print(analyze_response(response.response_text, response.search_urls, "Avanza", "Nordnet"))
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
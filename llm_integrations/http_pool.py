@@ -0,0 +1,136 @@
+# Process-wide event loop and pooled provider clients, so runs and sessions reuse warm connections
+import asyncio
+import atexit
+import importlib.util
+import os
+import threading
+
+import httpx
+
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_POOL_KEEPALIVE_SECONDS = float(os.getenv("HTTP_POOL_KEEPALIVE_SECONDS", "60"))
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]"); without it clients stay on HTTP/1.1
+HTTP2_ENABLED = (os.getenv("HTTP2_ENABLED", "true").lower() not in ("0", "false", "no")
+                 and importlib.util.find_spec("h2") is not None)
+# How long a cancelled run gets to flush and close before the caller moves on
+CANCEL_GRACE_SECONDS = float(os.getenv("CANCEL_GRACE_SECONDS", "30"))
+
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_loop():
+    """The shared event loop, started on a daemon thread on first use.
+
+    Pooled connections belong to the loop that opened them, so every provider call runs here
+    instead of in a fresh `asyncio.run` loop per Streamlit click.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="provider-event-loop", daemon=True).start()
+        return _loop
+
+
+def run(coro):
+    """Run a coroutine on the shared loop from synchronous code and return its result.
+
+    If the caller is interrupted (Ctrl-C, a Streamlit stop or rerun), the coroutine is cancelled
+    and given CANCEL_GRACE_SECONDS to run its cleanup before the exception propagates.
+    """
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run() called from the shared loop; await the coroutine instead")
+
+    finished = threading.Event()
+
+    async def guarded():
+        try:
+            return await coro
+        finally:
+            finished.set()
+
+    future = asyncio.run_coroutine_threadsafe(guarded(), loop)
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        finished.wait(CANCEL_GRACE_SECONDS)
+        raise
+
+
+def iterate(agen):
+    """Iterate an async generator on the shared loop from synchronous code.
+
+    Leaving the loop early (break, an exception or a Streamlit stop) closes the generator.
+    """
+    try:
+        while True:
+            try:
+                yield run(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run(agen.aclose())
+
+
+def pool_limits():
+    return httpx.Limits(max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                        keepalive_expiry=HTTP_POOL_KEEPALIVE_SECONDS)
+
+
+def client_args(**kwargs):
+    """httpx.AsyncClient arguments with the shared pool limits and HTTP/2 where available."""
+    return dict(limits=pool_limits(), http2=HTTP2_ENABLED, **kwargs)
+
+
+def http_client(**kwargs):
+    return httpx.AsyncClient(**client_args(**kwargs))
+
+
+def shared_client(key, factory, close=None):
+    """Process-wide client for `key`, built by `factory()` on first use and reused afterwards.
+
+    `close(client)` is awaited at interpreter exit; by default the client's own `aclose`/`close`.
+    """
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = (factory(), close)
+        return _clients[key][0]
+
+
+async def close_clients():
+    """Close every shared client; the next shared_client() call opens a fresh one."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client, close in clients:
+        try:
+            if close is not None:
+                await close(client)
+            elif hasattr(client, "aclose"):
+                await client.aclose()
+            elif hasattr(client, "close"):
+                await client.close()
+        except Exception as e:
+            print(f"Error closing client: {e}")
+
+
+@atexit.register
+def _shutdown():
+    if _loop is None or not _loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(close_clients(), _loop).result(CANCEL_GRACE_SECONDS)
+    except Exception as e:
+        print(f"Error closing clients at exit: {e}")
+    _loop.call_soon_threadsafe(_loop.stop)
@@ -1,61 +1,111 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+from openai.types.responses import Response
 import json
 import os
 from dotenv import load_dotenv
 import asyncio
-from metrics import has_brand_mention
+from metrics import analyze_response
+from llm_integrations.base import BaseProvider
+from llm_integrations.batch_jobs import BatchRequestError, poll_batch
+from llm_integrations.http_pool import http_client, shared_client
+from llm_integrations.registry import register_provider
+from llm_integrations.retry import with_retries
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME")
+# No output cap is sent for this provider, so budget a typical answer length
+OPENAI_ESTIMATED_OUTPUT_TOKENS = 1000
+OPENAI_SEARCH_TOOLS = [{"type": "web_search_preview"}]
+OPENAI_TOOL_CONFIG = {"tools": OPENAI_SEARCH_TOOLS, "tool_choice": "web_search_preview"}
+OPENAI_BATCH_ENDPOINT = "/v1/responses"
+OPENAI_BATCH_DONE_STATUSES = ("completed", "failed", "expired", "cancelled")
 
 
-class OpenAIIntegration:
-    def __init__(self, model_name=OPENAI_MODEL_NAME, api_key=OPENAI_API_KEY, brand_name="Avanza", competitor_name="Nordnet"):
-        self.client = OpenAI(api_key=api_key)
-        self.model_name = model_name
-        self.brand_name = brand_name
-        self.competitor_name = competitor_name
-        self.provider_name = "OpenAI"
+@register_provider
+class OpenAIIntegration(BaseProvider):
+    provider_name = "OpenAI"
+    env_prefix = "OPENAI"
+    tool_config = OPENAI_TOOL_CONFIG
+    estimated_output_tokens = OPENAI_ESTIMATED_OUTPUT_TOKENS
+    supports_batch_api = True
 
-    async def query_openai(self, query_text):
-        response = self.client.responses.create(
-            model=self.model_name,
-            tools=[{"type":"web_search_preview"}],
-            tool_choice={"type": "web_search_preview"},
-            input=query_text
-        )
-        
-        response_text = await self.extract_response_text(response)
-        search_urls = await self.extract_search_urls(response)
-        brand_mention, competitor_mention = await self.extract_brand_mentions(response, self.brand_name, self.competitor_name)
-        brand_mention_context = await self.extract_brand_mention_context(response, self.brand_name)
-        
-        output = dict(brand_name=self.brand_name,
-                provider_name=self.provider_name,
-                model_name=self.model_name,
-                query_text=query_text, 
-                response=response, 
-                response_text=response_text, 
-                search_urls=search_urls, 
-                brand_mention=brand_mention, 
-                competitor_mention=competitor_mention,
-                brand_mention_context=brand_mention_context)
+    def __init__(self, model_name=OPENAI_MODEL_NAME, api_key=OPENAI_API_KEY, scheduler=None, cache=None, raw_store=None):
+        super().__init__(model_name, scheduler, cache, raw_store)
+        self.client = shared_client(("OpenAI", api_key), lambda: AsyncOpenAI(
+            api_key=api_key, max_retries=0, http_client=http_client()))
+
+    def request_body(self, query_text):
+        """Responses API body for one query, shared by direct calls and batch jobs."""
+        return dict(model=self.model_name,
+                    tools=OPENAI_SEARCH_TOOLS,
+                    tool_choice={"type": "web_search_preview"},
+                    input=query_text)
+
+    async def extract_fetched(self, response):
+        return dict(response=response.model_dump(mode="json", exclude_none=True),
+                    response_text=await self.extract_response_text(response),
+                    search_urls=await self.extract_search_urls(response))
+
+    async def fetch(self, query_text):
+        """Calls the Responses API with web search and returns the raw payload plus the extracted text and citations."""
+        response = await self.client.responses.create(**self.request_body(query_text))
+        return await self.extract_fetched(response)
 
-        return output
-    
     async def query_openai_without_search(self, query_text):
-        response = self.client.responses.create(
+        response = await self.client.responses.create(
             model=self.model_name,
             input=query_text
         )
         
         return response.output_text
     
-    async def batch_query_openai(self, queries):
-        responses = await asyncio.gather(*[self.query_openai(query) for query in queries])
+    async def submit_batch(self, requests):
+        """Submits the requests to the Batch API: half the price and a separate rate limit pool,
+        but results can take up to 24 hours."""
+        lines = [json.dumps({"custom_id": custom_id, "method": "POST", "url": OPENAI_BATCH_ENDPOINT,
+                             "body": self.request_body(query_text)})
+                 for custom_id, query_text in requests.items()]
+        input_file = await with_retries(self.client.files.create,
+                                        file=("queries.jsonl", "\n".join(lines).encode("utf-8")),
+                                        purpose="batch")
+        batch = await with_retries(self.client.batches.create, input_file_id=input_file.id,
+                                   endpoint=OPENAI_BATCH_ENDPOINT, completion_window="24h")
+        print(f"Submitted OpenAI batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    async def batch_results(self, batch_id):
+        batch = await poll_batch(lambda: self.client.batches.retrieve(batch_id),
+                                 lambda job: job.status in OPENAI_BATCH_DONE_STATUSES,
+                                 f"OpenAI batch {batch_id}",
+                                 cancel=lambda: with_retries(self.client.batches.cancel, batch_id))
+
+        answers = {}
+        # Successful lines land in the output file and failed ones in the error file
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await with_retries(self.client.files.content, file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    try:
+                        answers[entry["custom_id"]] = await self.extract_fetched(Response.model_validate(response["body"]))
+                    except Exception as e:
+                        # One unreadable answer fails its own unit, not the whole job on every resume
+                        answers[entry["custom_id"]] = BatchRequestError(f"unreadable result: {type(e).__name__}: {e}")
+                else:
+                    error = entry.get("error") or (response.get("body") or {}).get("error")
+                    answers[entry["custom_id"]] = BatchRequestError(str(error))
+
+        total = batch.request_counts.total if batch.request_counts else len(answers)
+        if len(answers) < total:
+            print(f"OpenAI batch {batch.id} ended as {batch.status} with {total - len(answers)} requests unanswered")
+        return answers
 
-        return responses
     
     async def extract_response_text(self, response):
         return response.output_text
@@ -67,35 +117,13 @@ class OpenAIIntegration:
                 urls.append(annotation.url)
         return urls
 
-    async def extract_brand_mention_context(self, response, brand_name):
-        text = await self.extract_response_text(response)
-        if brand_name.lower() not in text.lower():
-            return None
-        
-        brand_index = text.lower().find(brand_name.lower())
-        text_after_brand = text[brand_index:]
-
-        import re
-        sentences = re.split(r'(?<=[.!?])\s+', text_after_brand)
-        
-        result_sentences = sentences[:min(3, len(sentences))]
-        result = ' '.join(result_sentences)
-        
-        return result
-            
-    async def extract_brand_mentions(self, response, brand_name, competitor_name):
-        text = await self.extract_response_text(response)
-        brand_mention = await has_brand_mention(text, brand_name)
-        competitor_mention = await has_brand_mention(text, competitor_name)
-        return brand_mention, competitor_mention
-    
 async def main():
     openai_integration = OpenAIIntegration()
-    response = await openai_integration.query_openai("What's the best service to trade stocks in Sweden?")
-    print(response["response_text"])
-    print(response["search_urls"])
-    print(response["brand_mention"])
-    print(response["brand_mention_context"])
+    response = await openai_integration.query("What's the best service to trade stocks in Sweden?")
+    print(response.response_text)
+    print(response.search_urls)
+    print(analyze_response(response.response_text, response.search_urls, "Avanza", "Nordnet"))
+    await openai_integration.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
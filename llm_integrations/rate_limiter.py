@@ -0,0 +1,210 @@
+# Concurrency and rate limiting for provider calls, shared by every run and session in the process
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+DEFAULT_MAX_CONCURRENCY = 10
+
+# Lower values are served first: interactive UI runs go ahead of sweeps
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+# Who a provider call is made for; set once per run and inherited by every task it starts
+REQUEST_CLIENT = ContextVar("request_client", default="default")
+REQUEST_PRIORITY = ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def request_context(client_id, priority=PRIORITY_INTERACTIVE):
+    """Attribute the provider calls started inside the block to `client_id` at `priority`."""
+    client_token = REQUEST_CLIENT.set(client_id)
+    priority_token = REQUEST_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        REQUEST_CLIENT.reset(client_token)
+        REQUEST_PRIORITY.reset(priority_token)
+
+
+def estimate_tokens(text, max_output_tokens=0):
+    """Rough token estimate (~4 characters per token) plus the output budget."""
+    return len(text) // 4 + 1 + max_output_tokens
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.refill_per_second = rate_per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    async def acquire(self, amount=1):
+        """Wait until `amount` tokens are available and take them."""
+        # A request larger than the bucket could never be served, so cap it at a full bucket
+        amount = min(float(amount), self.capacity)
+        # Waiters queue on the lock, so the bucket drains in FIFO order
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.refill_per_second)
+                self._refill()
+            self.tokens -= amount
+
+
+class ProviderScheduler:
+    """Bounds in-flight requests and enforces requests/tokens per minute for one provider.
+
+    Waiting requests are served by priority, and round-robin across clients within a priority,
+    so one user's large sweep cannot starve the others. Use `shared()` to get the process-wide
+    instance that every session submits to.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, requests_per_minute=None, tokens_per_minute=None):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._in_flight = 0
+        # priority -> client_id -> FIFO of waiting futures; dict order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        # Moving average of how long a request holds its slot, for wait estimates
+        self._average_hold_seconds = None
+
+    @classmethod
+    def from_env(cls, prefix):
+        """Build a scheduler from <PREFIX>_MAX_CONCURRENCY, <PREFIX>_RPM and <PREFIX>_TPM."""
+        def read(name, default=None):
+            value = os.getenv(f"{prefix}_{name}")
+            return int(value) if value else default
+
+        return cls(
+            max_concurrency=read("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY),
+            requests_per_minute=read("RPM"),
+            tokens_per_minute=read("TPM"),
+        )
+
+    @classmethod
+    def shared(cls, prefix):
+        """Process-wide scheduler for `prefix`, so the limits hold across every run and session."""
+        with _shared_lock:
+            if prefix not in _shared_schedulers:
+                _shared_schedulers[prefix] = cls.from_env(prefix)
+            return _shared_schedulers[prefix]
+
+    def _has_free_slot(self):
+        return not self.max_concurrency or self._in_flight < self.max_concurrency
+
+    async def _acquire_turn(self, client_id, priority):
+        if self._has_free_slot() and not any(self._waiting.values()):
+            self._in_flight += 1
+            return
+        turn = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(client_id, deque()).append(turn)
+        self._waiting[priority] += 1
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if turn.done() and not turn.cancelled():
+                # The turn was granted just as the caller was cancelled, so pass it on
+                self._release_turn()
+            raise
+
+    def _release_turn(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._has_free_slot():
+                client_id, turns = next(iter(queue.items()))
+                turn = turns.popleft()
+                self._waiting[priority] -= 1
+                if turns:
+                    queue.move_to_end(client_id)
+                else:
+                    del queue[client_id]
+                if turn.cancelled():
+                    continue
+                self._in_flight += 1
+                turn.set_result(None)
+            if not self._has_free_slot():
+                return
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens=0, client_id=None, priority=None):
+        """Hold one in-flight slot once it is this client's turn and the rate buckets allow another request.
+
+        `client_id` and `priority` default to the current request_context.
+        """
+        client_id = REQUEST_CLIENT.get() if client_id is None else client_id
+        priority = REQUEST_PRIORITY.get() if priority is None else priority
+        await self._acquire_turn(client_id, priority)
+        start = time.monotonic()
+        try:
+            if self._request_bucket:
+                await self._request_bucket.acquire(1)
+            if self._token_bucket and estimated_tokens:
+                await self._token_bucket.acquire(estimated_tokens)
+            yield
+        finally:
+            held = time.monotonic() - start
+            self._average_hold_seconds = (held if self._average_hold_seconds is None
+                                          else 0.8 * self._average_hold_seconds + 0.2 * held)
+            self._release_turn()
+
+    async def run(self, func, *args, estimated_tokens=0):
+        """Await `func(*args)` inside a scheduler slot."""
+        async with self.slot(estimated_tokens):
+            return await func(*args)
+
+    def queue_depth(self, priority=None):
+        """Requests waiting for a slot, at `priority` and ahead of it, or in total."""
+        if priority is None:
+            return sum(self._waiting.values())
+        return sum(count for level, count in self._waiting.items() if level <= priority)
+
+    def estimated_wait_seconds(self, priority=PRIORITY_INTERACTIVE):
+        """Rough wait before a new request at `priority` starts, from the queue ahead of it."""
+        ahead = self.queue_depth(priority)
+        if not ahead and self._has_free_slot():
+            return 0.0
+        waits = []
+        if self.max_concurrency and self._average_hold_seconds is not None:
+            waits.append((ahead + 1) / self.max_concurrency * self._average_hold_seconds)
+        if self.requests_per_minute:
+            waits.append((ahead + 1) * 60.0 / self.requests_per_minute)
+        return max(waits) if waits else None
+
+    def status(self):
+        return dict(in_flight=self._in_flight,
+                    max_concurrency=self.max_concurrency,
+                    waiting_interactive=self._waiting[PRIORITY_INTERACTIVE],
+                    waiting_batch=self._waiting[PRIORITY_BATCH],
+                    estimated_wait_seconds=self.estimated_wait_seconds())
+
+
+_shared_schedulers = {}
+_shared_lock = threading.Lock()
+
+
+def scheduler_status():
+    """Queue status of every shared scheduler, keyed by provider env prefix."""
+    with _shared_lock:
+        schedulers = dict(_shared_schedulers)
+    return {prefix: scheduler.status() for prefix, scheduler in schedulers.items()}
@@ -0,0 +1,40 @@
+# Registry of provider integrations, so runners look providers up by name instead of branching on it
+import importlib
+import os
+
+BUILTIN_PROVIDER_MODULES = [
+    "llm_integrations.perplexity_integration",
+    "llm_integrations.gemini_integration",
+    "llm_integrations.openai_integration",
+    "llm_integrations.claude_integration",
+]
+# Extra modules to import, comma separated; each registers its providers on import
+PROVIDER_PLUGINS = os.getenv("PROVIDER_PLUGINS", "")
+ENABLED_PROVIDERS = os.getenv("ENABLED_PROVIDERS", "Perplexity,Gemini,OpenAI")
+
+PROVIDERS = {}
+
+
+def register_provider(provider_class):
+    """Class decorator that makes a BaseProvider subclass available under its `provider_name`."""
+    PROVIDERS[provider_class.provider_name] = provider_class
+    return provider_class
+
+
+def load_providers(plugins=PROVIDER_PLUGINS):
+    """Import the built-in integrations and any plugin modules, registering their providers."""
+    for module in BUILTIN_PROVIDER_MODULES + [name.strip() for name in plugins.split(",") if name.strip()]:
+        importlib.import_module(module)
+    return PROVIDERS
+
+
+def get_provider_class(name):
+    load_providers()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown provider {name!r}; registered providers: {', '.join(sorted(PROVIDERS))}")
+    return PROVIDERS[name]
+
+
+def enabled_provider_classes(names=ENABLED_PROVIDERS):
+    """Provider classes named in `names` (comma separated, default ENABLED_PROVIDERS), in that order."""
+    return [get_provider_class(name.strip()) for name in names.split(",") if name.strip()]
@@ -0,0 +1,142 @@
+# On-disk cache of provider responses so repeated query sets don't pay for API calls twice
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache/responses.sqlite")
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "500"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+
+def cache_key(provider_name, model_name, query_text, attempt, tool_config):
+    """Content address of one provider call."""
+    key_material = json.dumps([provider_name, model_name, query_text, attempt, tool_config], sort_keys=True, default=str)
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed key/value store with a TTL and least-recently-used eviction by total size."""
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, max_mb=RESPONSE_CACHE_MAX_MB):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Streamlit reruns scripts on different threads, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        self._conn.commit()
+        # Running total of the `size` column, so a write does not sum the whole table. Other processes
+        # sharing the file make it drift, so it is recounted before anything is evicted.
+        self._total_bytes = self._count_bytes()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total_bytes -= len(value)
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Store a JSON-serialisable value and evict old entries if the cache grew too large."""
+        payload = json.dumps(value, default=str)
+        now = time.time()
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._total_bytes += len(payload) - (replaced[0] if replaced else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _count_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self):
+        if self.ttl_seconds:
+            cutoff = time.time() - self.ttl_seconds
+            expired = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?",
+                                         (cutoff,)).fetchone()[0]
+            if expired:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+                self._total_bytes -= expired
+        if not self.max_bytes or self._total_bytes <= self.max_bytes:
+            return
+        total = self._total_bytes = self._count_bytes()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache fits again
+        freed = 0
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if total - freed <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        self._total_bytes -= freed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Process-wide cache shared by every run, or None when RESPONSE_CACHE_ENABLED is off."""
+    global _default_cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
+
+
+async def fetch_with_cache(cache, key, fetch):
+    """Return (payload, cache_hit), awaiting `fetch()` only when the key is not cached."""
+    if cache is not None:
+        payload = cache.get(key)
+        if payload is not None:
+            return payload, True
+    payload = await fetch()
+    if cache is not None:
+        cache.set(key, payload)
+    return payload, False
@@ -0,0 +1,83 @@
+# Shared retry policy for provider calls
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import anthropic
+import httpx
+import openai
+from google.genai import errors as genai_errors
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "1"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "60"))
+
+
+def status_code(error):
+    """HTTP status carried by a provider exception, or None for non-HTTP failures."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    if isinstance(error, (openai.APIStatusError, anthropic.APIStatusError)):
+        return error.status_code
+    if isinstance(error, genai_errors.APIError):
+        return error.code
+    return None
+
+
+def is_retryable(error):
+    """Network failures, timeouts, throttling and server errors are worth retrying; the rest are fatal."""
+    if isinstance(error, (httpx.TransportError, openai.APIConnectionError, anthropic.APIConnectionError, TimeoutError)):
+        return True
+    return status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error):
+    """Delay requested by the server through Retry-After (seconds or HTTP date) or retry-after-ms."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY_SECONDS, max_delay=RETRY_MAX_DELAY_SECONDS):
+    """Exponential backoff with full jitter so concurrent retries spread out."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+async def with_retries(func, *args, max_attempts=RETRY_MAX_ATTEMPTS, **kwargs):
+    """Await `func(*args, **kwargs)`, retrying retryable errors and re-raising the last one."""
+    for attempt in range(max_attempts):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt == max_attempts - 1:
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            else:
+                # Honor the server's hint, with a little jitter so waiters don't return in lockstep
+                delay = min(delay, RETRY_MAX_DELAY_SECONDS) + random.uniform(0, RETRY_BASE_DELAY_SECONDS)
+            print(f"Retrying after {type(e).__name__} (attempt {attempt + 1}/{max_attempts}, waiting {delay:.1f}s)")
+            await asyncio.sleep(delay)
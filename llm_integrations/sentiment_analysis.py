@@ -1,36 +1,267 @@
 # This is to create a first draft of sentiment analysis of brand mentions
+import atexit
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from textblob import TextBlob
 
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", str(os.cpu_count() or 1)))
+# Below this many unscored texts a process pool costs more to start than it saves
+SENTIMENT_PARALLEL_MIN_TEXTS = int(os.getenv("SENTIMENT_PARALLEL_MIN_TEXTS", "2000"))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "500"))
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "100000"))
+DEFAULT_SENTIMENT_BACKEND = "textblob"
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", DEFAULT_SENTIMENT_BACKEND)
+# Optional tab-separated "word<TAB>weight" file replacing the built-in lexicon
+SENTIMENT_LEXICON_PATH = os.getenv("SENTIMENT_LEXICON_PATH")
+
+# Word weights in [-1, 1] for the queries we run, which are mostly Swedish with English answers mixed in
+DEFAULT_LEXICON = {
+    # Swedish
+    "bra": 0.6, "bättre": 0.6, "bäst": 0.9, "bästa": 0.9, "utmärkt": 0.9, "utmärkta": 0.9, "toppen": 0.8,
+    "enkel": 0.4, "enkelt": 0.4, "enkla": 0.4, "smidig": 0.5, "smidigt": 0.5, "prisvärd": 0.6, "prisvärt": 0.6,
+    "billig": 0.4, "billigt": 0.4, "billiga": 0.4, "pålitlig": 0.6, "pålitligt": 0.6, "populär": 0.5,
+    "populära": 0.5, "rekommenderas": 0.6, "rekommenderad": 0.6, "trygg": 0.6, "tryggt": 0.6, "säker": 0.5,
+    "säkert": 0.5, "snabb": 0.4, "snabbt": 0.4, "nöjd": 0.6, "nöjda": 0.6, "fördel": 0.4, "fördelar": 0.4,
+    "dålig": -0.6, "dåligt": -0.6, "dåliga": -0.6, "sämre": -0.5, "sämst": -0.9, "dyr": -0.4, "dyrt": -0.4,
+    "dyra": -0.4, "krånglig": -0.5, "krångligt": -0.5, "långsam": -0.4, "långsamt": -0.4, "problem": -0.4,
+    "nackdel": -0.4, "nackdelar": -0.4, "missnöjd": -0.6, "missnöjda": -0.6, "osäker": -0.5, "osäkert": -0.5,
+    "risk": -0.2, "risker": -0.2, "bedrägeri": -0.9, "klagomål": -0.5, "förvirrande": -0.5, "svag": -0.4,
+    # English
+    "good": 0.6, "better": 0.5, "best": 0.9, "great": 0.8, "excellent": 0.9, "easy": 0.4, "simple": 0.3,
+    "cheap": 0.3, "affordable": 0.5, "reliable": 0.6, "trusted": 0.6, "popular": 0.5, "recommended": 0.6,
+    "recommend": 0.5, "safe": 0.5, "secure": 0.5, "fast": 0.4, "quick": 0.4, "friendly": 0.5, "strong": 0.4,
+    "love": 0.7, "advantage": 0.4, "advantages": 0.4, "competitive": 0.4, "low": 0.1,
+    "bad": -0.6, "worse": -0.5, "worst": -0.9, "poor": -0.6, "expensive": -0.4, "slow": -0.4, "high": -0.1,
+    # "problem" and "risk" are spelled the same in Swedish and weighted above
+    "confusing": -0.5, "complicated": -0.5, "difficult": -0.4, "problems": -0.4,
+    "issue": -0.3, "issues": -0.3, "risky": -0.4, "fraud": -0.9, "scam": -0.9, "hate": -0.8,
+    "complaint": -0.5, "complaints": -0.5, "disadvantage": -0.4, "disadvantages": -0.4, "limited": -0.3,
+    "weak": -0.4, "awful": -1.0, "terrible": -1.0,
+}
+# English contractions are listed without the apostrophe, which is removed before tokenizing
+NEGATIONS = {"inte", "ej", "aldrig", "ingen", "inget", "inga", "not", "no", "never", "without", "cannot",
+             "isnt", "arent", "wasnt", "werent", "dont", "doesnt", "didnt", "cant", "couldnt", "wont",
+             "wouldnt", "shouldnt", "hasnt", "havent", "hadnt"}
+
+_WORD = re.compile(r"\w+")
+_APOSTROPHE = re.compile(r"['\u2019]")
+
+
+def sentiment_label(polarity):
+    """Convert polarity (-1 to 1) to our 5 categories."""
+    if polarity <= -0.6:
+        return "Very Negative"
+    elif polarity <= -0.2:
+        return "Negative"
+    elif polarity <= 0.2:
+        return "Neutral"
+    elif polarity <= 0.6:
+        return "Positive"
+    return "Very Positive"
+
+
+class SentimentBackend(ABC):
+    name: str
+
+    @abstractmethod
+    def score_batch(self, texts):
+        """Polarity (-1 to 1) for each text."""
+        ...
+
+
+class TextBlobBackend(SentimentBackend):
+    """English pattern-based polarity, parsed one text at a time."""
+    name = "textblob"
+
+    def score_batch(self, texts):
+        return [TextBlob(text).sentiment.polarity for text in texts]
+
+
+class LexiconBackend(SentimentBackend):
+    """Swedish and English word lexicon, scored for a whole batch with NumPy.
+
+    The batch is tokenized into one flat array of (text, word) pairs, which is a sparse
+    text-by-word count matrix; multiplying it by the weight vector is a single bincount.
+    A text's polarity is the mean weight of its lexicon words, and a word right after a
+    negation ("inte bra", "not good") counts as -0.5 times its weight, as in TextBlob.
+    """
+    name = "lexicon"
+
+    def __init__(self, lexicon=None, negations=NEGATIONS):
+        lexicon = lexicon or DEFAULT_LEXICON
+        # Index 0 is every word outside the lexicon, with weight 0
+        self.vocabulary = {word.lower(): index for index, word in enumerate(lexicon, start=1)}
+        self.weights = np.array([0.0, *lexicon.values()])
+        self.negations = {word.lower() for word in negations}
+
+    @classmethod
+    def from_file(cls, path):
+        lexicon = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip() and not line.startswith("#"):
+                    word, weight = line.rstrip("\n").split("\t")
+                    lexicon[word] = float(weight)
+        return cls(lexicon)
+
+    def score_batch(self, texts):
+        # "isn't" must stay one token, or the negation would land on the "t"
+        tokens_per_text = [_WORD.findall(_APOSTROPHE.sub("", text.lower())) for text in texts]
+        lengths = np.fromiter((len(tokens) for tokens in tokens_per_text), dtype=np.int64, count=len(texts))
+        tokens = [token for text_tokens in tokens_per_text for token in text_tokens]
+        if not tokens:
+            return [0.0] * len(texts)
+
+        # Look every distinct word up once instead of every occurrence
+        unique_tokens, token_codes = np.unique(np.array(tokens), return_inverse=True)
+        word_ids = np.array([self.vocabulary.get(token, 0) for token in unique_tokens])[token_codes]
+        is_negation = np.array([token in self.negations for token in unique_tokens])[token_codes]
+        text_ids = np.repeat(np.arange(len(texts)), lengths)
+
+        negated = np.zeros(len(tokens), dtype=bool)
+        negated[1:] = is_negation[:-1] & (text_ids[1:] == text_ids[:-1])
+        token_weights = np.where(negated, -0.5, 1.0) * self.weights[word_ids]
+
+        totals = np.bincount(text_ids, weights=token_weights, minlength=len(texts))
+        matches = np.bincount(text_ids, weights=word_ids > 0, minlength=len(texts))
+        polarities = np.divide(totals, matches, out=np.zeros(len(texts)), where=matches > 0)
+        return np.clip(polarities, -1.0, 1.0).tolist()
+
+
+SENTIMENT_BACKENDS = {"textblob": TextBlobBackend, "lexicon": LexiconBackend}
+if SENTIMENT_BACKEND not in SENTIMENT_BACKENDS:
+    print(f"Unknown SENTIMENT_BACKEND {SENTIMENT_BACKEND!r}, expected one of {', '.join(SENTIMENT_BACKENDS)}; "
+          f"using {DEFAULT_SENTIMENT_BACKEND}")
+    SENTIMENT_BACKEND = DEFAULT_SENTIMENT_BACKEND
+
+
+def get_backend(name):
+    if name not in SENTIMENT_BACKENDS:
+        raise ValueError(f"Unknown sentiment backend {name!r}, expected one of {', '.join(SENTIMENT_BACKENDS)}")
+    if name == "lexicon" and SENTIMENT_LEXICON_PATH:
+        return LexiconBackend.from_file(SENTIMENT_LEXICON_PATH)
+    return SENTIMENT_BACKENDS[name]()
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
 
 class SentimentAnalysis:
-    def __init__(self):
-        pass
+    def __init__(self, backend=SENTIMENT_BACKEND, workers=SENTIMENT_WORKERS,
+                 parallel_min_texts=SENTIMENT_PARALLEL_MIN_TEXTS, batch_size=SENTIMENT_BATCH_SIZE,
+                 cache_size=SENTIMENT_CACHE_SIZE):
+        self.backend = get_backend(backend) if isinstance(backend, str) else backend
+        self.workers = workers
+        self.parallel_min_texts = parallel_min_texts
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        # Repeated queries often return identical contexts, so polarity is memoized by text hash
+        self._polarities = {}
+        self._executor = None
+        # The default analyzer is shared by every Streamlit session; the lock guards the memo and the pool
+        self._lock = threading.Lock()
+
+    def predict_polarity(self, texts):
+        """Polarity (-1 to 1) for each text, scoring only texts not seen before."""
+        hashes = [text_hash(text) for text in texts]
+        known, missing = {}, {}
+        with self._lock:
+            for digest, text in zip(hashes, texts):
+                if digest in self._polarities:
+                    known[digest] = self._polarities[digest]
+                else:
+                    missing.setdefault(digest, text)
+
+        # Scored outside the lock, so one session's large batch does not hold up the others' memo hits
+        if missing:
+            known.update(zip(missing, self._score(list(missing.values()))))
+        with self._lock:
+            self._polarities.update((digest, known[digest]) for digest in missing)
+            overflow = len(self._polarities) - self.cache_size
+            if overflow > 0:
+                # Dicts keep insertion order, so this drops the oldest entries
+                for digest in list(self._polarities)[:overflow]:
+                    del self._polarities[digest]
+        return [known[digest] for digest in hashes]
 
     def predict_sentiment(self, texts):
-        sentiments = []
-        for text in texts:
-            analysis = TextBlob(text)
-            # Convert polarity (-1 to 1) to our 5 categories
-            polarity = analysis.sentiment.polarity
-            if polarity <= -0.6:
-                sentiment = "Very Negative"
-            elif polarity <= -0.2:
-                sentiment = "Negative"
-            elif polarity <= 0.2:
-                sentiment = "Neutral"
-            elif polarity <= 0.6:
-                sentiment = "Positive"
-            else:
-                sentiment = "Very Positive"
-            sentiments.append(sentiment)
-        return sentiments
+        """Five-bucket label for each text."""
+        return [sentiment_label(polarity) for polarity in self.predict_polarity(texts)]
+
+    def predict(self, texts):
+        """(polarity, label) for each text."""
+        return [(polarity, sentiment_label(polarity)) for polarity in self.predict_polarity(texts)]
+
+    def _score(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self.workers <= 1 or len(texts) < self.parallel_min_texts or len(batches) == 1:
+            return [polarity for batch in batches for polarity in self.backend.score_batch(batch)]
+
+        with self._lock:
+            if self._executor is None:
+                # Forking a process that runs other threads (Streamlit, the provider event loop) can copy
+                # locks those threads hold into the workers and deadlock them, so workers start from a fork server
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("forkserver"))
+            executor = self._executor
+        return [polarity for batch in executor.map(self.backend.score_batch, batches) for polarity in batch]
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+_default_analyzers = {}
+_default_analyzers_lock = threading.Lock()
+
+
+def get_default_analyzer(backend=SENTIMENT_BACKEND):
+    """Process-wide analyzer per backend, so the polarity cache and worker pool outlive a single run."""
+    with _default_analyzers_lock:
+        if backend not in _default_analyzers:
+            _default_analyzers[backend] = SentimentAnalysis(backend)
+            atexit.register(_default_analyzers[backend].close)
+        return _default_analyzers[backend]
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
 
 
 def main():
     sentiment_analysis = SentimentAnalysis()
     texts = ["I love this product", "I hate this product", "I'm neutral about this product"]
-    for text, sentiment in zip(texts, sentiment_analysis.predict_sentiment(texts)):
-        print(f"Text: {text}\nSentiment: {sentiment}\n")
+    for text, (polarity, sentiment) in zip(texts, sentiment_analysis.predict(texts)):
+        print(f"Text: {text}\nSentiment: {sentiment} ({polarity:+.2f})\n")
+
+    # Benchmark: brand contexts from repeated queries, where a third of the texts are repeats
+    phrases = ["Avanza is the best platform for beginners.", "Fees at Nordnet are high and the app is slow.",
+               "Many users find the interface confusing.", "Customer support is excellent and quick.",
+               "Avanza är inte dyrt och appen är enkel att använda.", "It is a reasonable choice for long-term savers."]
+    contexts = [f"{phrases[i % 6]} {phrases[(i * 7) % 6]} Review number {i % 4000}." for i in range(6000)]
+
+    for backend in SENTIMENT_BACKENDS:
+        unmemoized = get_backend(backend)
+        print(f"{backend:<9} one batch:  {_timed(unmemoized.score_batch, contexts):6.3f} s for {len(contexts)} contexts")
+        analyzer = SentimentAnalysis(backend, workers=1)
+        print(f"{backend:<9} memoized:   {_timed(analyzer.predict, contexts):6.3f} s, "
+              f"repeated run {_timed(analyzer.predict, contexts):.3f} s")
+
+    lexicon = LexiconBackend()
+    for text in phrases:
+        print(f"{lexicon.score_batch([text])[0]:+.2f}  {TextBlobBackend().score_batch([text])[0]:+.2f}  {text}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,67 @@
+# Collapse identical in-flight provider calls into one upstream request
+import asyncio
+import os
+
+from llm_integrations.rate_limiter import REQUEST_PRIORITY
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() not in ("0", "false", "no")
+
+
+class _Call:
+    __slots__ = ("task", "priority", "waiters")
+
+    def __init__(self, task, priority):
+        self.task = task
+        self.priority = priority
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs await the same result.
+
+    The call is cancelled only when every caller waiting on it has been cancelled, so one
+    stopped run does not fail the identical requests of other sessions. The call waits in the
+    provider queues at its starter's priority, so callers only join calls at least as urgent as
+    their own; a more urgent caller starts a new call, which later callers of the key join.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key, func):
+        """Return (result of `func()`, shared) where shared is True if another caller started the call."""
+        priority = REQUEST_PRIORITY.get()
+        call = self._calls.get(key)
+        # Lower values are more urgent: an interactive caller must not wait behind a call queued as batch work
+        if call is not None and call.priority > priority:
+            call = None
+        shared = call is not None
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(func()), priority)
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+                # Forgotten now, not when the task finishes, so a caller arriving meanwhile starts afresh
+                self._forget(key, call)
+            raise
+        finally:
+            call.waiters -= 1
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+_default_single_flight = SingleFlight()
+
+
+def get_default_single_flight():
+    """Process-wide single-flight group, or None when SINGLE_FLIGHT_ENABLED is off."""
+    return _default_single_flight if SINGLE_FLIGHT_ENABLED else None
@@ -1,7 +1,230 @@
-async def has_brand_mention(text, brand_name):
+import re
+import time
+from itertools import islice
+
+from brand_matcher import BrandMatcher, mention_stats
+from citations import brand_domain_index, citation_host, citation_metrics
+
+# Sentences kept after each brand mention for the sentiment context
+CONTEXT_SENTENCES = 3
+
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+
+def has_brand_mention(text, brand_name):
     """Checks if the text contains at least one case-insensitive mention of the brand name."""
     if not text:
         return 0
     # Return 1 if mentioned at least once, 0 otherwise
     return 1 if brand_name.lower() in text.lower() else 0
 
+
+def iter_sentence_spans(text, start=0):
+    """Lazily yields (start, end) of each sentence from `start`, so callers can stop early."""
+    position = start
+    for sentence_break in _SENTENCE_BREAK.finditer(text, start):
+        yield position, sentence_break.start()
+        position = sentence_break.end()
+    yield position, len(text)
+
+
+def extract_mention_contexts(text, offsets, sentences=CONTEXT_SENTENCES, window=None):
+    """Context snippet for every mention offset, with overlapping snippets merged.
+
+    By default a snippet is `sentences` sentences starting at the mention. With `window=K`
+    it is the sentence containing the mention plus K sentences before and after.
+    """
+    if not text or not offsets:
+        return []
+    offsets = sorted(offsets)
+    if window is not None:
+        return _windowed_contexts(text, offsets, window)
+
+    contexts = []
+    snippet_end = -1
+    for offset in offsets:
+        if offset < snippet_end:
+            continue
+        spans = list(islice(iter_sentence_spans(text, offset), sentences))
+        snippet_end = spans[-1][1]
+        contexts.append(' '.join(text[start:end] for start, end in spans))
+    return contexts
+
+
+def _sentence_start_before(text, offset, count):
+    """Start of the sentence `count` sentences before the one containing `offset`."""
+    lookback = 1024
+    while True:
+        scan_from = max(offset - lookback, 0)
+        starts = [sentence_break.end() for sentence_break in _SENTENCE_BREAK.finditer(text, scan_from, offset + 1)
+                  if sentence_break.end() <= offset]
+        if len(starts) > count:
+            return starts[-count - 1]
+        if scan_from == 0:
+            # Fewer than `count` sentences before it: the window starts at the top of the text
+            return 0
+        lookback *= 4
+
+
+def _windowed_contexts(text, offsets, window):
+    windows = []
+    for offset in offsets:
+        spans = []
+        sentences_after = 0
+        for span in iter_sentence_spans(text, _sentence_start_before(text, offset, window)):
+            if span[0] > offset:
+                if sentences_after == window:
+                    break
+                sentences_after += 1
+            spans.append(span)
+        if windows and (spans[0][0] <= windows[-1][-1][1] or text[windows[-1][-1][1]:spans[0][0]].isspace()):
+            # Overlaps or touches the previous window: extend it with the sentences it does not have yet
+            windows[-1].extend(span for span in spans if span[0] > windows[-1][-1][1])
+        else:
+            windows.append(spans)
+    return [' '.join(text[start:end] for start, end in spans) for spans in windows]
+
+
+def extract_brand_mention_context(text, brand_name, sentences=CONTEXT_SENTENCES):
+    """Returns up to `sentences` sentences starting at the first mention of the brand, or None."""
+    if not text:
+        return None
+    brand_index = text.lower().find(brand_name.lower())
+    if brand_index < 0:
+        return None
+    return extract_mention_contexts(text, [brand_index], sentences)[0]
+
+
+def extract_url_domains(search_urls):
+    """Lowercased host of every cited source with a known host, without a leading www."""
+    hosts = (citation_host(*url) if isinstance(url, (tuple, list)) else citation_host(url) for url in search_urls or [])
+    return [host for host in hosts if host]
+
+
+def build_matcher(brand_name, competitor_name, tracked_brands=None):
+    """One matcher for the target, the competitor and any other tracked brands (name -> aliases)."""
+    brands = {brand_name: [brand_name], competitor_name: [competitor_name]}
+    for name, aliases in (tracked_brands or {}).items():
+        brands[name] = [*brands.get(name, []), *aliases]
+    return BrandMatcher(brands)
+
+
+def analyze_response(response_text, search_urls, brand_name, competitor_name, matcher=None, citations=None):
+    """Brand metrics for one stored response. Pure, so any brand pair can be re-analyzed offline.
+
+    `citations` is the response's `citation_metrics`, when the caller already computed them.
+    """
+    if matcher is None:
+        matcher = build_matcher(brand_name, competitor_name)
+    if citations is None:
+        citations = citation_metrics(search_urls, brand_name, competitor_name)
+    hits = matcher.find_all(response_text)
+    stats = mention_stats(hits)
+    brand_contexts = extract_mention_contexts(response_text, [hit.start for hit in hits if hit.brand == brand_name])
+    brand_stats = stats.get(brand_name)
+    competitor_stats = stats.get(competitor_name)
+    return dict(brand_name=brand_name,
+                competitor_name=competitor_name,
+                brand_mention=int(brand_stats is not None),
+                competitor_mention=int(competitor_stats is not None),
+                brand_mention_count=brand_stats.count if brand_stats else 0,
+                competitor_mention_count=competitor_stats.count if competitor_stats else 0,
+                brand_first_offset=brand_stats.first_offset if brand_stats else None,
+                competitor_first_offset=competitor_stats.first_offset if competitor_stats else None,
+                brand_rank=brand_stats.rank if brand_stats else None,
+                competitor_rank=competitor_stats.rank if competitor_stats else None,
+                brands_mentioned=list(stats),
+                mention_stats=[(brand, *brand_stats) for brand, brand_stats in stats.items()],
+                brand_mention_context=brand_contexts[0] if brand_contexts else None,
+                brand_mention_contexts=brand_contexts,
+                **citations)
+
+
+def analyze_results(raw_results, brand_name, competitor_name, tracked_brands=None, matcher=None, domain_index=None):
+    """Merge brand metrics into dict copies of the raw `ProviderResult` rows; failed rows get empty metrics.
+
+    `tracked_brands` maps further brand names to aliases (tickers, product names) whose mentions
+    are reported in `brands_mentioned`. Streams that analyze one row at a time pass `matcher`
+    (from `build_matcher`) and `domain_index` (from `brand_domain_index`), so both are built once.
+    """
+    matcher = matcher or build_matcher(brand_name, competitor_name, tracked_brands)
+    if domain_index is None:
+        domain_index = brand_domain_index([brand_name, competitor_name])
+    analyzed = []
+    for raw in raw_results:
+        if raw.error:
+            metrics = dict(brand_name=brand_name,
+                           competitor_name=competitor_name,
+                           brand_mention=None,
+                           competitor_mention=None,
+                           brand_mention_count=None,
+                           competitor_mention_count=None,
+                           brand_first_offset=None,
+                           competitor_first_offset=None,
+                           brand_rank=None,
+                           competitor_rank=None,
+                           brands_mentioned=[],
+                           mention_stats=[],
+                           brand_mention_context=None,
+                           brand_mention_contexts=[],
+                           url_domains=[],
+                           brand_domain_mentions=None,
+                           competitor_domain_mentions=None)
+        else:
+            citations = citation_metrics(raw.search_urls, brand_name, competitor_name, index=domain_index)
+            metrics = analyze_response(raw.response_text, raw.search_urls, brand_name, competitor_name, matcher,
+                                       citations)
+        analyzed.append({**raw.as_dict(), **metrics})
+    return analyzed
+
+
+def mentions_table(analyzed_results):
+    """Columnar (brand, count, first_offset, rank) rows for every brand hit across results.
+
+    `result_index` points back into `analyzed_results`, so the table loads straight into a
+    DataFrame and share of voice is a groupby instead of another pass over the response texts.
+    """
+    table = dict(result_index=[], provider_name=[], query_text=[], brand=[], count=[], first_offset=[], rank=[])
+    for index, result in enumerate(analyzed_results):
+        for brand, count, first_offset, rank in result.get("mention_stats") or []:
+            table["result_index"].append(index)
+            table["provider_name"].append(result["provider_name"])
+            table["query_text"].append(result["query_text"])
+            table["brand"].append(brand)
+            table["count"].append(count)
+            table["first_offset"].append(first_offset)
+            table["rank"].append(rank)
+    return table
+
+
+def main():
+    """Benchmark the context extractor against splitting the whole remaining text on long responses."""
+    def split_context(text, brand_name):
+        # The previous approach: lowercase twice and split everything after the mention
+        if brand_name.lower() not in text.lower():
+            return None
+        sentences = re.split(r'(?<=[.!?])\s+', text[text.lower().find(brand_name.lower()):])
+        return ' '.join(sentences[:3])
+
+    filler = "Many Swedish investors compare fees, fund selection and the mobile app before choosing a broker. "
+    responses = [filler * position + "Avanza is often recommended for beginners. " + filler * (400 - position)
+                 for position in range(0, 400, 4)]
+    assert all(split_context(text, "Avanza") == extract_brand_mention_context(text, "Avanza") for text in responses)
+    # Mention offsets come from the matcher pass that analyze_response already makes
+    matcher = build_matcher("Avanza", "Nordnet")
+    offsets = [[hit.start for hit in matcher.find_all(text)] for text in responses]
+
+    for label, extract in (("split remaining text", lambda index: split_context(responses[index], "Avanza")),
+                           ("first mention", lambda index: extract_brand_mention_context(responses[index], "Avanza")),
+                           ("every mention", lambda index: extract_mention_contexts(responses[index], offsets[index])),
+                           ("every mention, +-1 sentence",
+                            lambda index: extract_mention_contexts(responses[index], offsets[index], window=1))):
+        start = time.perf_counter()
+        for index in range(len(responses)):
+            extract(index)
+        print(f"{label:<28} {(time.perf_counter() - start) * 1000:7.1f} ms for {len(responses)} responses "
+              f"of ~{len(responses[0]) // 1000} kB")
+
+
+if __name__ == "__main__":
+    main()
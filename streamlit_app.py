@@ -1,11 +1,212 @@
 import streamlit as st
-import asyncio
 import pandas as pd
+import numpy as np
 import os
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime
 import plotly.graph_objects as go
+from contextlib import closing
 from dotenv import load_dotenv
 load_dotenv() 
-from demo_runner import run_all, add_sentiment_analysis, run_analysis
+from demo_runner import stream_run, unit_count, analyze, run_analysis, index_results
+from metrics import analyze_results, build_matcher, mentions_table
+from citations import brand_citations, brand_domain_index, citation_table, top_domains
+from llm_integrations.sentiment_analysis import SENTIMENT_BACKEND, SENTIMENT_BACKENDS
+from llm_integrations import http_pool
+from llm_integrations.rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE, scheduler_status
+from utils.run_store import get_default_run_store
+from utils.run_journal import get_default_journal
+from utils.raw_store import get_default_raw_store
+from utils.text_index import TextIndex
+from utils.search_index import get_default_search_index
+
+# Runs larger than this yield to interactive runs from other sessions in the shared provider queues
+INTERACTIVE_MAX_UNITS = int(os.getenv("INTERACTIVE_MAX_UNITS", "60"))
+
+
+def queue_summary(priority=PRIORITY_INTERACTIVE):
+    """Requests queued ahead of a new run at `priority` across all sessions, and the longest estimated wait."""
+    statuses = scheduler_status().values()
+    queued = sum(s["waiting_interactive"] + (s["waiting_batch"] if priority == PRIORITY_BATCH else 0) for s in statuses)
+    waits = [s["estimated_wait_seconds"] for s in statuses if s["estimated_wait_seconds"]]
+    return queued, max(waits, default=0.0)
+
+
+SENTIMENT_ORDER = ['Very Negative', 'Negative', 'Neutral', 'Positive', 'Very Positive']
+SENTIMENT_COLORS = {
+    'Very Negative': '#dc2626',
+    'Negative': '#f87171',
+    'Neutral': '#9ca3af',
+    'Positive': '#34d399',
+    'Very Positive': '#10b981'
+}
+# Seconds between redraws of the partial results while a run streams in
+PARTIAL_REFRESH_SECONDS = 0.5
+# Rows per page of the results tab; only the current page is sent to the browser
+RESULTS_PAGE_SIZE = int(os.getenv("RESULTS_PAGE_SIZE", "25"))
+PAGE_SIZES = sorted({10, 25, 50, 100, RESULTS_PAGE_SIZE})
+# Characters of each response shown in the results table; the full text loads when a row is selected
+PREVIEW_CHARS = 160
+
+
+def results_fingerprint(run_id, analyzed_for, row_count):
+    """Identifies one analyzed result set; dashboard aggregates are cached under it."""
+    return hashlib.sha256(json.dumps([run_id, *analyzed_for, row_count]).encode("utf-8")).hexdigest()[:16]
+
+
+def grouped_bar_chart(series, title, xaxis_title, yaxis_title, text_suffix=''):
+    """Plotly grouped bars for [(name, x, values, color)] series in the dashboard style."""
+    fig = go.Figure()
+    for name, x, values, color in series:
+        fig.add_trace(go.Bar(
+            name=name,
+            x=x,
+            y=values,
+            marker_color=color,
+            text=values.astype(str) + text_suffix,
+            textposition='auto'
+        ))
+    fig.update_layout(
+        title={
+            'text': title,
+            'x': 0.5,
+            'font': {'size': 18, 'color': '#1f2937'}
+        },
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title,
+        barmode='group',
+        showlegend=True,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={'color': '#1f2937'},
+        legend={'orientation': 'h', 'yanchor': 'bottom', 'y': 1.02, 'xanchor': 'right', 'x': 1}
+    )
+    fig.update_xaxes(showgrid=False, tickfont={'color': '#1f2937'})
+    fig.update_yaxes(showgrid=True, gridcolor='#e1e8ed', tickfont={'color': '#1f2937'})
+    return fig
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def response_index(fingerprint, _df):
+    """Text index over the queries and responses of one result set, built once and shared unpickled."""
+    return TextIndex((_df['query_text'] + "\n" + _df['response_text'].fillna("")).tolist())
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def dashboard_data(fingerprint, _df, _results, brand, competitor):
+    """Every aggregate and figure the result tabs show, computed once per result set.
+
+    Only `fingerprint`, `brand` and `competitor` are hashed; the frame and rows behind the
+    fingerprint are passed unhashed, so widget reruns return the cached values immediately.
+    Figures are cached as plain dicts, which unpickle far faster than plotly Figure objects.
+    """
+    df = _df
+    data = {}
+
+    total_queries = len(df)
+    brand_mentions = int(df['brand_mention'].sum())
+    competitor_mentions = int(df['competitor_mention'].sum())
+    data['total_queries'] = total_queries
+    data['brand_rate'] = brand_mentions / total_queries * 100
+    data['competitor_rate'] = competitor_mentions / total_queries * 100
+    data['providers'] = list(df['provider_name'].unique())
+
+    summary_df = df.groupby('provider_name').agg(
+        total=('brand_mention', 'count'),
+        brand=('brand_mention', 'sum'),
+        competitor=('competitor_mention', 'sum')
+    ).reset_index()
+    summary_df.columns = ['Provider', 'Total Queries', 'Brand Mentions', 'Competitor Mentions']
+    summary_df['Brand Mention Rate'] = (summary_df['Brand Mentions'] / summary_df['Total Queries'] * 100).round(1)
+    summary_df['Competitor Mention Rate'] = (summary_df['Competitor Mentions'] / summary_df['Total Queries'] * 100).round(1)
+    data['summary_df'] = summary_df
+    data['mention_fig'] = grouped_bar_chart(
+        [(brand, summary_df['Provider'], summary_df['Brand Mention Rate'], '#3b82f6'),
+         (competitor, summary_df['Provider'], summary_df['Competitor Mention Rate'], '#ec4899')],
+        'Brand vs Competitor Mention Rates by AI Search Provider', 'AI Search Provider', 'Mention Rate (%)', '%'
+    ).to_dict()
+
+    # One row per (response, brand) from the analysis stage, so no response text is scanned here
+    mentions_df = pd.DataFrame(mentions_table(_results))
+    data['voice_df'] = None
+    if not mentions_df.empty:
+        voice_df = mentions_df.groupby(['provider_name', 'brand'], sort=False).agg(
+            mentions=('count', 'sum'),
+            responses=('result_index', 'nunique'),
+            avg_rank=('rank', 'mean')
+        ).reset_index()
+        voice_df['share'] = (voice_df['mentions'] / voice_df.groupby('provider_name')['mentions'].transform('sum') * 100).round(1)
+        voice_df = voice_df[voice_df['brand'].isin([brand, competitor])]
+        voice_df.columns = ['Provider', 'Brand', 'Mentions', 'Responses', 'Average Rank', 'Share of Voice']
+        data['voice_df'] = voice_df
+        data['voice_fig'] = grouped_bar_chart(
+            [(name, voice_df.loc[voice_df['Brand'] == name, 'Provider'],
+              voice_df.loc[voice_df['Brand'] == name, 'Share of Voice'], color)
+             for name, color in ((brand, '#3b82f6'), (competitor, '#ec4899'))],
+            'Share of All Brand Mentions by AI Search Provider', 'AI Search Provider', 'Share of Voice (%)', '%'
+        ).to_dict()
+
+    data['has_sentiment'] = 'sentiment' in df.columns
+    if data['has_sentiment']:
+        sentiment_counts = df['sentiment'].value_counts().reindex(SENTIMENT_ORDER, fill_value=0)
+        data['sentiment_counts'] = sentiment_counts
+        data['sentiment_distribution'] = df['sentiment'].value_counts().to_dict()
+        data['sentiment_options'] = list(df['sentiment'].dropna().unique())
+
+        fig = go.Figure(data=[
+            go.Bar(
+                x=sentiment_counts.index,
+                y=sentiment_counts.values,
+                marker_color=[SENTIMENT_COLORS[sentiment] for sentiment in sentiment_counts.index],
+                text=sentiment_counts.values,
+                textposition='auto'
+            )
+        ])
+        fig.update_layout(
+            title={
+                'text': f'Sentiment Distribution for {brand} Mentions',
+                'x': 0.5,
+                'font': {'size': 18, 'color': '#1f2937'}
+            },
+            xaxis_title='Sentiment Category',
+            yaxis_title='Number of Mentions',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font={'color': '#1f2937'},
+            showlegend=False
+        )
+        fig.update_xaxes(showgrid=False, tickfont={'color': '#1f2937'})
+        fig.update_yaxes(showgrid=True, gridcolor='#e1e8ed', tickfont={'color': '#1f2937'})
+        data['sentiment_fig'] = fig.to_dict()
+
+        polarity_df = df.groupby('provider_name')['sentiment_polarity'].agg(['mean', 'count']).reset_index()
+        polarity_df.columns = ['Provider', 'Average Polarity', 'Scored Contexts']
+        data['polarity_df'] = polarity_df
+    else:
+        data['sentiment_distribution'] = {}
+
+    # One row per cited source, joined against the brand -> domain map once per result set
+    citations = citation_table(_results)
+    counts = brand_citations(citations, [brand, competitor]).groupby(['provider_name', 'brand']).size()
+    url_domain_df = pd.DataFrame({
+        'Provider': data['providers'],
+        'Brand Domain Mentions': [int(counts.get((provider, brand), 0)) for provider in data['providers']],
+        'Competitor Domain Mentions': [int(counts.get((provider, competitor), 0)) for provider in data['providers']]
+    })
+    data['url_domain_df'] = url_domain_df
+    data['domain_fig'] = grouped_bar_chart(
+        [(brand, url_domain_df['Provider'], url_domain_df['Brand Domain Mentions'], '#3b82f6'),
+         (competitor, url_domain_df['Provider'], url_domain_df['Competitor Domain Mentions'], '#ec4899')],
+        'Domain Citations in AI Search Results', 'AI Search Provider', 'Number of URL Citations'
+    ).to_dict()
+    top_domains_df = top_domains(citations)
+    top_domains_df.columns = ['Domain', 'Citations', 'Responses', 'Best Rank', 'Average Rank', 'Share of Citations']
+    data['top_domains_df'] = top_domains_df
+    return data
+
 
 st.set_page_config(
     page_title="AI Search Analytics",
@@ -258,6 +459,19 @@ tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
 ])
 
 # Initialize session state variables if they don't exist
+if 'raw_results' not in st.session_state:
+    st.session_state.raw_results = None
+if 'analyzed_for' not in st.session_state:
+    st.session_state.analyzed_for = None
+if 'run_total' not in st.session_state:
+    st.session_state.run_total = 0
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = None
+if 'client_id' not in st.session_state:
+    # Identifies this session in the shared provider queues, which share slots fairly between sessions
+    st.session_state.client_id = uuid.uuid4().hex
+if 'stored_runs' not in st.session_state:
+    st.session_state.stored_runs = set()
 if 'results' not in st.session_state:
     st.session_state.results = None
 if 'analysis_prompt' not in st.session_state:
@@ -299,6 +513,17 @@ with tab1:
             step=1,
             help="Number of times to repeat each query for more reliable results"
         )
+        use_cache = st.checkbox(
+            "Reuse cached responses",
+            value=True,
+            help="Serve queries that were already asked with the same model from the local response cache instead of calling the provider again"
+        )
+        sentiment_backend = st.selectbox(
+            "Sentiment Model",
+            list(SENTIMENT_BACKENDS),
+            index=list(SENTIMENT_BACKENDS).index(SENTIMENT_BACKEND),
+            help="textblob: English only. lexicon: fast Swedish and English word lexicon."
+        )
         
         # Add some information cards
         st.markdown("""
@@ -311,33 +536,176 @@ with tab1:
     # Center the run button
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        if st.button("Run Analysis", use_container_width=True):
-            queries = [q.strip() for q in queries_raw.splitlines() if q.strip()]
+        run_clicked = st.button("Run Analysis", use_container_width=True)
+        queued, wait_seconds = queue_summary()
+        if queued:
+            st.caption(f"⏳ {queued} requests from other runs are queued; estimated wait ~{wait_seconds:.0f} s")
+
+        # Runs are journaled unit by unit, so one cut short by a stop or a crash can pick up where it left off
+        journal = get_default_journal()
+        resume_run_id = None
+        unfinished_runs = journal.unfinished_runs()
+        if unfinished_runs:
+            with st.expander(f"⏯️ {len(unfinished_runs)} unfinished run(s)"):
+                unfinished_run = st.selectbox(
+                    "Unfinished run",
+                    unfinished_runs,
+                    format_func=lambda run: f"{datetime.fromtimestamp(run[1]):%Y-%m-%d %H:%M} ({run[2]} of {run[3]} responses)"
+                )
+                if st.button("Resume Run", use_container_width=True, help="Query only the units this run is still missing"):
+                    resume_run_id = unfinished_run[0]
+
+        if run_clicked or resume_run_id:
+            if resume_run_id:
+                run_id = resume_run_id
+                queries, run_repeat_count = journal.run(run_id)
+            else:
+                run_id = uuid.uuid4().hex
+                queries = [q.strip() for q in queries_raw.splitlines() if q.strip()]
+                run_repeat_count = repeat_count
             if not queries:
                 st.error("Please enter at least one query.")
                 st.stop()
 
-            with st.spinner("🔄 Analyzing across AI search providers... This may take ~60 seconds"):
-                results = asyncio.run(run_all(brand, competitor, queries, repeat_count))
-                results = add_sentiment_analysis(results)
-                st.session_state.results = results
-                st.session_state.show_results = True
-                st.success("✅ Analysis completed! Check the results in the tabs above.")
+            # Rows land in session state as they complete, so stopping the run keeps everything finished so far
+            st.session_state.raw_results = []
+            st.session_state.analyzed_for = None
+            st.session_state.show_results = True
+            st.session_state.run_total = unit_count(queries, run_repeat_count)
+            run_priority = PRIORITY_BATCH if st.session_state.run_total > INTERACTIVE_MAX_UNITS else PRIORITY_INTERACTIVE
+            st.session_state.run_id = run_id
+            st.button("Stop", use_container_width=True, help="Stop the run and analyze the responses received so far")
+
+            progress = st.progress(0.0, text="🔄 Querying AI search providers...")
+            partial_metrics = st.empty()
+            partial_table = st.empty()
+
+            # Calls run on the process-wide loop so every session reuses the pooled provider connections;
+            # a Stop click interrupts this loop and closes the stream, cancelling the calls in flight
+            def redraw(rows, provider_counts):
+                done, total = len(rows), st.session_state.run_total
+                queued, wait_seconds = queue_summary(run_priority)
+                queue_text = f" · {queued} requests queued, ~{wait_seconds:.0f} s wait" if queued else ""
+                progress.progress(min(done / total, 1.0), text=f"🔄 {done} of {total} responses received{queue_text}")
+                if provider_counts:
+                    rates_df = pd.DataFrame(
+                        [(provider, round(b / n * 100, 1), round(c / n * 100, 1))
+                         for provider, (n, b, c) in sorted(provider_counts.items())],
+                        columns=['Provider', f'{brand} Mention Rate', f'{competitor} Mention Rate']
+                    )
+                    partial_metrics.dataframe(rates_df, hide_index=True, use_container_width=True)
+                partial_table.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+            def collect_results():
+                partial_rows = []
+                # provider -> [answered, brand mentions, competitor mentions], updated per row instead of regrouping
+                provider_counts = {}
+                last_redraw = 0.0
+                # Built once per run; per row they would recompile the brand patterns and reread the domain file
+                matcher = build_matcher(brand, competitor)
+                domain_index = brand_domain_index([brand, competitor])
+                with closing(http_pool.iterate(stream_run(queries, run_repeat_count, use_cache=use_cache, run_id=run_id,
+                                                          client_id=st.session_state.client_id,
+                                                          priority=run_priority))) as stream:
+                    for raw_result in stream:
+                        st.session_state.raw_results.append(raw_result)
+                        row = analyze_results([raw_result], brand, competitor, matcher=matcher,
+                                              domain_index=domain_index)[0]
+                        # Searchable as soon as it arrives, so a stopped run keeps what it received
+                        index_results([row], run_id)
+                        partial_rows.append({name: row[name] for name in
+                                             ('provider_name', 'query_text', 'brand_mention', 'competitor_mention', 'error')})
+                        if not row['error']:
+                            counts = provider_counts.setdefault(row['provider_name'], [0, 0, 0])
+                            counts[0] += 1
+                            counts[1] += row['brand_mention']
+                            counts[2] += row['competitor_mention']
+
+                        # Redrawing on every row makes a large run quadratic, so the view refreshes on a timer
+                        if time.perf_counter() - last_redraw >= PARTIAL_REFRESH_SECONDS:
+                            redraw(partial_rows, provider_counts)
+                            last_redraw = time.perf_counter()
+                redraw(partial_rows, provider_counts)
+
+            collect_results()
+            raw_results = st.session_state.raw_results
+            st.success("✅ Analysis completed! Check the results in the tabs above.")
+            cache_hits = sum(1 for r in raw_results if r.cache_hit)
+            st.caption(f"Response cache: {cache_hits} hits, {len(raw_results) - cache_hits} misses")
+
+    if st.session_state.raw_results is not None and len(st.session_state.raw_results) < st.session_state.run_total:
+        st.info(f"⏹️ Run stopped: showing the {len(st.session_state.raw_results)} of {st.session_state.run_total} responses received.")
+
+# Brand analysis runs over the stored responses, so changing the brands re-analyzes without new API calls
+if st.session_state.raw_results is not None and st.session_state.analyzed_for != (brand, competitor, sentiment_backend):
+    st.session_state.results = analyze(st.session_state.raw_results, brand, competitor, sentiment_backend)
+    st.session_state.analyzed_for = (brand, competitor, sentiment_backend)
+    # Built once per result set; every later rerun (filters, tabs, widgets) reuses the frames
+    results_df = pd.DataFrame(st.session_state.results)
+    # Queries that still failed after retries are kept out of the metrics instead of counting as "no mention"
+    failed_mask = results_df['error'].notna()
+    st.session_state.failed_df = results_df.loc[failed_mask, ["provider_name", "query_text", "error"]]
+    st.session_state.results_df = results_df[~failed_mask]
+    st.session_state.results_fingerprint = results_fingerprint(
+        st.session_state.run_id, st.session_state.analyzed_for, len(results_df))
+    # Every analyzed row becomes searchable across runs; rows already indexed for this run are skipped
+    index_results(st.session_state.results, st.session_state.run_id)
+
+    # Keep every complete run on disk once per brand pair; switching only the sentiment model does not re-save.
+    # A stopped run is saved once it has been resumed to the end.
+    run_store = get_default_run_store()
+    stored_key = (st.session_state.run_id, brand, competitor)
+    run_complete = len(st.session_state.raw_results) >= st.session_state.run_total
+    if run_store is not None and run_complete and stored_key not in st.session_state.stored_runs:
+        try:
+            run_store.append(st.session_state.results, run_id=st.session_state.run_id)
+            st.session_state.stored_runs.add(stored_key)
+        except Exception as e:
+            print(f"Error saving run: {e}")
+
+# Ranked full-text search over the responses of every run analyzed so far
+search_index = get_default_search_index()
+if search_index is not None:
+    with tab1:
+        with st.expander("🔎 Search past responses"):
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                history_query = st.text_input("Search text", placeholder="e.g. fee levels", key="history_search",
+                                              help="Finds responses and brand contexts containing every word; "
+                                                   "the last word also matches as a prefix.")
+            with col2:
+                history_provider = st.selectbox("Provider", ["All"] + search_index.providers(), key="history_provider")
+            if history_query.strip():
+                try:
+                    hits = search_index.search(history_query, limit=50,
+                                               provider=None if history_provider == "All" else history_provider)
+                except ValueError as e:
+                    hits = []
+                    st.warning(f"Search failed: {e}")
+                st.caption(f"{len(hits)} best matches of {search_index.count()} indexed responses")
+                for hit in hits:
+                    st.markdown(f"**{hit['provider_name']}** · {hit['brand_name']} · _{hit['query_text']}_  \n"
+                                f"{hit['snippet']}")
 
 # Only show other tabs if we have results
 if st.session_state.show_results and st.session_state.results is not None:
-    df = pd.DataFrame(st.session_state.results)
+    df = st.session_state.results_df
+    failed_df = st.session_state.failed_df
+    if not failed_df.empty:
+        with tab1:
+            st.warning(f"⚠️ {len(failed_df)} of {len(failed_df) + len(df)} queries failed and are excluded from the analysis.")
+            st.dataframe(failed_df, use_container_width=True)
+    if df.empty:
+        st.stop()
+    data = dashboard_data(st.session_state.results_fingerprint, df, st.session_state.results, brand, competitor)
     
     # Tab 2: Brand & Competitor Analysis
     with tab2:
         st.markdown('<div class="section-header">Brand Performance Overview</div>', unsafe_allow_html=True)
         
-        # Calculate overall metrics
-        total_queries = len(df)
-        brand_mentions = df['brand_mention'].sum()
-        competitor_mentions = df['competitor_mention'].sum()
-        brand_rate = (brand_mentions / total_queries * 100)
-        competitor_rate = (competitor_mentions / total_queries * 100)
+        total_queries = data['total_queries']
+        brand_rate = data['brand_rate']
+        competitor_rate = data['competitor_rate']
         
         # Top level metrics
         col1, col2, col3, col4 = st.columns(4)
@@ -377,52 +745,8 @@ if st.session_state.show_results and st.session_state.results is not None:
         
         st.markdown("### Provider Breakdown")
         
-        # Provider analysis
-        summary_df = df.groupby('provider_name').agg({
-            'brand_mention': ['count', 'sum'],
-            'competitor_mention': ['sum']
-        }).reset_index()
-        summary_df.columns = ['Provider', 'Total Queries', 'Brand Mentions', 'Competitor Mentions']
-        summary_df['Brand Mention Rate'] = (summary_df['Brand Mentions'] / summary_df['Total Queries'] * 100).round(1)
-        summary_df['Competitor Mention Rate'] = (summary_df['Competitor Mentions'] / summary_df['Total Queries'] * 100).round(1)
-        
-        # Enhanced chart
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            name=brand,
-            x=summary_df['Provider'],
-            y=summary_df['Brand Mention Rate'],
-            marker_color='#3b82f6',
-            text=summary_df['Brand Mention Rate'].apply(lambda x: f'{x}%'),
-            textposition='auto'
-        ))
-        fig.add_trace(go.Bar(
-            name=competitor,
-            x=summary_df['Provider'],
-            y=summary_df['Competitor Mention Rate'],
-            marker_color='#ec4899',
-            text=summary_df['Competitor Mention Rate'].apply(lambda x: f'{x}%'),
-            textposition='auto'
-        ))
-        fig.update_layout(
-            title={
-                'text': 'Brand vs Competitor Mention Rates by AI Search Provider',
-                'x': 0.5,
-                'font': {'size': 18, 'color': '#1f2937'}
-            },
-            xaxis_title='AI Search Provider',
-            yaxis_title='Mention Rate (%)',
-            barmode='group',
-            showlegend=True,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font={'color': '#1f2937'},
-            legend={'orientation': 'h', 'yanchor': 'bottom', 'y': 1.02, 'xanchor': 'right', 'x': 1}
-        )
-        fig.update_xaxes(showgrid=False, tickfont={'color': '#1f2937'})
-        fig.update_yaxes(showgrid=True, gridcolor='#e1e8ed', tickfont={'color': '#1f2937'})
-        
-        st.plotly_chart(fig, use_container_width=True)
+        summary_df = data['summary_df']
+        st.plotly_chart(data['mention_fig'], use_container_width=True)
         
         # Data table with better formatting
         st.markdown("### Detailed Results")
@@ -434,14 +758,28 @@ if st.session_state.show_results and st.session_state.results is not None:
             use_container_width=True
         )
 
+        st.markdown("### Share of Voice")
+
+        voice_df = data['voice_df']
+        if voice_df is None:
+            st.info("💡 Neither brand is mentioned in any response.")
+        else:
+            st.plotly_chart(data['voice_fig'], use_container_width=True)
+            st.dataframe(
+                voice_df.style.format({
+                    'Average Rank': '{:.1f}',
+                    'Share of Voice': '{:.1f}%'
+                }),
+                hide_index=True,
+                use_container_width=True
+            )
+
     # Tab 3: Sentiment Analysis
     with tab3:
         st.markdown('<div class="section-header">Brand Sentiment Analysis</div>', unsafe_allow_html=True)
         
-        if 'sentiment' in df.columns:
-            sentiment_counts = df['sentiment'].value_counts().reindex([
-                'Very Negative', 'Negative', 'Neutral', 'Positive', 'Very Positive'
-            ], fill_value=0)
+        if data['has_sentiment']:
+            sentiment_counts = data['sentiment_counts']
             
             # Calculate sentiment metrics
             total_sentiments = sentiment_counts.sum()
@@ -488,45 +826,17 @@ if st.session_state.show_results and st.session_state.results is not None:
                 </div>
                 """, unsafe_allow_html=True)
             
-            # Enhanced sentiment chart
-            colors = {
-                'Very Negative': '#dc2626',
-                'Negative': '#f87171', 
-                'Neutral': '#9ca3af',
-                'Positive': '#34d399',
-                'Very Positive': '#10b981'
-            }
-            
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=sentiment_counts.index,
-                    y=sentiment_counts.values,
-                    marker_color=[colors[sentiment] for sentiment in sentiment_counts.index],
-                    text=sentiment_counts.values,
-                    textposition='auto'
-                )
-            ])
-            
-            fig.update_layout(
-                title={
-                    'text': f'Sentiment Distribution for {brand} Mentions',
-                    'x': 0.5,
-                    'font': {'size': 18, 'color': '#1f2937'}
-                },
-                xaxis_title='Sentiment Category',
-                yaxis_title='Number of Mentions',
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                font={'color': '#1f2937'},
-                showlegend=False
-            )
-            fig.update_xaxes(showgrid=False, tickfont={'color': '#1f2937'})
-            fig.update_yaxes(showgrid=True, gridcolor='#e1e8ed', tickfont={'color': '#1f2937'})
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(data['sentiment_fig'], use_container_width=True)
             
             # Sentiment breakdown table
             col1, col2 = st.columns([2, 1])
+            with col1:
+                st.markdown("### Polarity by Provider")
+                st.dataframe(
+                    data['polarity_df'].style.format({'Average Polarity': '{:+.2f}'}),
+                    hide_index=True,
+                    use_container_width=True
+                )
             with col2:
                 st.markdown("### Summary")
                 sentiment_df = sentiment_counts.reset_index()
@@ -544,32 +854,7 @@ if st.session_state.show_results and st.session_state.results is not None:
     with tab4:
         st.markdown('<div class="section-header">URL Domain Analysis</div>', unsafe_allow_html=True)
         
-        # Count domain mentions in URLs
-        brand_domain = brand.lower()
-        competitor_domain = competitor.lower()
-        
-        url_domain_counts = {
-            'Provider': [],
-            'Brand Domain Mentions': [],
-            'Competitor Domain Mentions': []
-        }
-        
-        for provider in df['provider_name'].unique():
-            provider_urls = df[df['provider_name'] == provider]['search_urls'].explode()
-            brand_count = sum(1 for url in provider_urls if (
-                (isinstance(url, tuple) and brand_domain in url[1].lower()) or
-                (isinstance(url, str) and brand_domain in url.lower())
-            ))
-            competitor_count = sum(1 for url in provider_urls if (
-                (isinstance(url, tuple) and competitor_domain in url[1].lower()) or
-                (isinstance(url, str) and competitor_domain in url.lower())
-            ))
-        
-            url_domain_counts['Provider'].append(provider)
-            url_domain_counts['Brand Domain Mentions'].append(brand_count)
-            url_domain_counts['Competitor Domain Mentions'].append(competitor_count)
-        
-        url_domain_df = pd.DataFrame(url_domain_counts)
+        url_domain_df = data['url_domain_df']
         
         # Calculate totals for metrics
         total_brand_domains = url_domain_df['Brand Domain Mentions'].sum()
@@ -615,46 +900,13 @@ if st.session_state.show_results and st.session_state.results is not None:
         
         st.markdown("### Domain Citations by Provider")
         
-        # Enhanced chart for domain mentions
-        fig2 = go.Figure()
-        fig2.add_trace(go.Bar(
-            name=brand,
-            x=url_domain_df['Provider'],
-            y=url_domain_df['Brand Domain Mentions'],
-            marker_color='#3b82f6',
-            text=url_domain_df['Brand Domain Mentions'],
-            textposition='auto'
-        ))
-        fig2.add_trace(go.Bar(
-            name=competitor,
-            x=url_domain_df['Provider'],
-            y=url_domain_df['Competitor Domain Mentions'],
-            marker_color='#ec4899',
-            text=url_domain_df['Competitor Domain Mentions'],
-            textposition='auto'
-        ))
-        fig2.update_layout(
-            title={
-                'text': 'Domain Citations in AI Search Results',
-                'x': 0.5,
-                'font': {'size': 18, 'color': '#1f2937'}
-            },
-            xaxis_title='AI Search Provider',
-            yaxis_title='Number of URL Citations',
-            barmode='group',
-            showlegend=True,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font={'color': '#1f2937'},
-            legend={'orientation': 'h', 'yanchor': 'bottom', 'y': 1.02, 'xanchor': 'right', 'x': 1}
-        )
-        fig2.update_xaxes(showgrid=False, tickfont={'color': '#1f2937'})
-        fig2.update_yaxes(showgrid=True, gridcolor='#e1e8ed', tickfont={'color': '#1f2937'})
-        
-        st.plotly_chart(fig2, use_container_width=True)
+        st.plotly_chart(data['domain_fig'], use_container_width=True)
         
         st.markdown("### Detailed Breakdown")
         st.dataframe(url_domain_df, use_container_width=True)
+
+        st.markdown("### Top Cited Domains")
+        st.dataframe(data['top_domains_df'], hide_index=True, use_container_width=True)
         
         st.info("💡 URL citations indicate how often each brand's domain appears in the source links provided by AI search engines.")
 
@@ -662,17 +914,13 @@ if st.session_state.show_results and st.session_state.results is not None:
     with tab5:
         st.markdown('<div class="section-header">AI-Powered Strategic Recommendations</div>', unsafe_allow_html=True)
         
-        # Calculate key metrics for the prompt
-        total_queries = len(df)
-        brand_mention_rate = (df['brand_mention'].sum() / total_queries * 100).round(1)
-        competitor_mention_rate = (df['competitor_mention'].sum() / total_queries * 100).round(1)
-        
-        # Calculate total domain mentions
+        # Key metrics for the prompt, from the cached aggregates
+        total_queries = data['total_queries']
+        brand_mention_rate = round(data['brand_rate'], 1)
+        competitor_mention_rate = round(data['competitor_rate'], 1)
         total_brand_domains = url_domain_df['Brand Domain Mentions'].sum()
         total_competitor_domains = url_domain_df['Competitor Domain Mentions'].sum()
-        
-        # Calculate sentiment distribution
-        sentiment_distribution = df['sentiment'].value_counts().to_dict()
+        sentiment_distribution = data['sentiment_distribution']
         
         # Create the analysis prompt
         analysis_prompt = f"""You are a highly specialized marketing expert with a deep understanding of **large language model (LLM)-powered search and generative AI in search results**. You are renowned for your ability to analyze search data and provide highly specific and actionable recommendations that leverage the unique characteristics of AI search.
@@ -688,7 +936,7 @@ Based on the following search analysis data for {brand}:
 
 **2. Overall Search Context:**
    - Total queries analyzed: {total_queries}
-   - Search providers (specify if any are known to heavily utilize LLMs): {', '.join(df['provider_name'].unique())}
+   - Search providers (specify if any are known to heavily utilize LLMs): {', '.join(data['providers'])}
 
 Please provide specific, actionable recommendations for how {brand} could improve their marketing strategy to:
 
@@ -721,7 +969,7 @@ For each recommendation, provide:
         with col2:
             if st.button("Generate Strategic Analysis", use_container_width=True):
                 with st.spinner("🤖 AI is analyzing your data and generating strategic recommendations..."):
-                    analysis_result = asyncio.run(run_analysis(st.session_state.analysis_prompt))
+                    analysis_result = http_pool.run(run_analysis(st.session_state.analysis_prompt))
                     st.session_state.analysis_result = analysis_result
                     st.success("✅ Strategic analysis completed!")
                     st.rerun()
@@ -750,7 +998,7 @@ For each recommendation, provide:
         with col1:
             provider_filter = st.selectbox(
                 "Filter by Provider",
-                ["All"] + list(df['provider_name'].unique()),
+                ["All"] + data['providers'],
                 key="provider_filter"
             )
         with col2:
@@ -760,57 +1008,93 @@ For each recommendation, provide:
                 key="brand_filter"
             )
         with col3:
-            if 'sentiment' in df.columns:
+            sentiment_filter = "All"
+            if data['has_sentiment']:
                 sentiment_filter = st.selectbox(
                     "Filter by Sentiment",
-                    ["All"] + list(df['sentiment'].dropna().unique()),
+                    ["All"] + data['sentiment_options'],
                     key="sentiment_filter"
                 )
+        search_query = st.text_input(
+            "Search responses",
+            placeholder="e.g. courtage isk",
+            key="results_search",
+            help="Finds responses containing every word; the last word also matches as a prefix."
+        )
         
-        # Apply filters
-        filtered_df = df.copy()
+        # One boolean mask over the cached frame instead of copying it per filter
+        mask = np.ones(len(df), dtype=bool)
         if provider_filter != "All":
-            filtered_df = filtered_df[filtered_df['provider_name'] == provider_filter]
+            mask &= (df['provider_name'] == provider_filter).to_numpy()
         if brand_filter == "With Brand Mention":
-            filtered_df = filtered_df[filtered_df['brand_mention'] == 1]
+            mask &= (df['brand_mention'] == 1).to_numpy()
         elif brand_filter == "Without Brand Mention":
-            filtered_df = filtered_df[filtered_df['brand_mention'] == 0]
-        if 'sentiment' in df.columns and 'sentiment_filter' in locals() and sentiment_filter != "All":
-            filtered_df = filtered_df[filtered_df['sentiment'] == sentiment_filter]
+            mask &= (df['brand_mention'] == 0).to_numpy()
+        if sentiment_filter != "All":
+            mask &= (df['sentiment'] == sentiment_filter).to_numpy()
+        if search_query.strip():
+            found = np.zeros(len(df), dtype=bool)
+            found[response_index(st.session_state.results_fingerprint, df).search(search_query)] = True
+            mask &= found
+        positions = np.flatnonzero(mask)
         
-        st.markdown(f"**Showing {len(filtered_df)} of {len(df)} results**")
+        # Only the current page is rendered, so the tab costs the same for any run size
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            page_size = st.selectbox("Rows per page", PAGE_SIZES, index=PAGE_SIZES.index(RESULTS_PAGE_SIZE),
+                                     key="results_page_size")
+        page_count = max(1, -(-len(positions) // page_size))
+        if st.session_state.get("results_page", 1) > page_count:
+            st.session_state.results_page = page_count
+        with col2:
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1,
+                                   key="results_page")
+        page_positions = positions[(page - 1) * page_size:page * page_size]
+        page_df = df.iloc[page_positions]
+        
+        if len(positions):
+            st.markdown(f"**Showing {(page - 1) * page_size + 1}-{(page - 1) * page_size + len(page_df)} "
+                        f"of {len(positions)} matching results ({len(df)} total)**")
+        else:
+            st.markdown(f"**No results match the filters ({len(df)} total)**")
         
-        # Summary table
+        # Summary table with response previews; the full text loads for selected rows only
         columns_to_show = ["provider_name", "query_text", "brand_mention", "competitor_mention"]
-        if 'sentiment' in filtered_df.columns:
+        if 'sentiment' in page_df.columns:
             columns_to_show.append("sentiment")
-        columns_to_show.append("response_text")
+        table_df = page_df[columns_to_show].assign(response_preview=page_df['response_text'].str.slice(0, PREVIEW_CHARS))
         
-        st.dataframe(
-            filtered_df[columns_to_show],
+        selection = st.dataframe(
+            table_df,
             use_container_width=True,
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="multi-row",
+            key=f"results_table_{page}_{page_size}",
             column_config={
                 "provider_name": "Provider",
                 "query_text": "Query",
                 "brand_mention": st.column_config.CheckboxColumn("Brand Mentioned"),
                 "competitor_mention": st.column_config.CheckboxColumn("Competitor Mentioned"),
                 "sentiment": "Sentiment",
-                "response_text": st.column_config.TextColumn("Response", width="large")
+                "response_preview": st.column_config.TextColumn("Response", width="large")
             }
         )
         
         st.markdown("### Detailed Responses")
+        selected_rows = selection.selection.rows
+        if not selected_rows:
+            st.caption("Select rows in the table above to load their full responses and sources.")
         
-        # Expanders for details with better formatting
-        for idx, row in filtered_df.iterrows():
-            # Create a more descriptive title
+        for table_row in selected_rows:
+            row = page_df.iloc[table_row]
             brand_status = "✅ Brand" if row['brand_mention'] else "❌ No Brand"
             competitor_status = "✅ Competitor" if row['competitor_mention'] else "❌ No Competitor"
             sentiment_status = f"😊 {row.get('sentiment', 'N/A')}" if 'sentiment' in row else ""
             
             title = f"{row['provider_name']} | {brand_status} | {competitor_status} | {sentiment_status} | {row['query_text'][:50]}..."
             
-            with st.expander(title):
+            with st.expander(title, expanded=True):
                 # Create columns for better layout
                 col1, col2 = st.columns([1, 3])
                 
@@ -841,7 +1125,13 @@ For each recommendation, provide:
                     if row.get("search_urls"):
                         st.markdown("**Source URLs:**")
                         for i, url in enumerate(row["search_urls"], 1):
-                            if isinstance(url, tuple):
-                                st.markdown(f"{i}. [{url[0]}]({url[1]})")
+                            if isinstance(url, (tuple, list)):
+                                st.markdown(f"{i}. [{url[1]}]({url[0]})")
                             else:
                                 st.markdown(f"{i}. {url}")
+                    
+                    # The provider payload is read from the raw store only on request
+                    raw_store = get_default_raw_store()
+                    if row.get("raw_id") and raw_store and st.toggle("Show raw provider payload",
+                                                                     key=f"raw_{row['raw_id']}_{page_positions[table_row]}"):
+                        st.json(raw_store.get(row['raw_id']), expanded=False)
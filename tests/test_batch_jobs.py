@@ -0,0 +1,309 @@
+# Batch API runs against local fakes of OpenAI's Files and Batches endpoints and Anthropic's Message Batches
+import asyncio
+import json
+
+import httpx
+import pytest
+from anthropic import AsyncAnthropic
+from openai import AsyncOpenAI
+
+from llm_integrations.batch_jobs import BatchUnsupportedError
+from llm_integrations.claude_integration import ClaudeIntegration
+from llm_integrations.openai_integration import OpenAIIntegration
+from utils.raw_store import RawStore
+from utils.run_journal import RunJournal
+
+
+def response_body(text):
+    """Responses API payload with one web search call and one cited answer."""
+    return {
+        "id": "resp_test", "object": "response", "created_at": 0, "model": "gpt-test", "status": "completed",
+        "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+        "output": [
+            {"type": "web_search_call", "id": "ws_test", "status": "completed"},
+            {"type": "message", "id": "msg_test", "role": "assistant", "status": "completed",
+             "content": [{"type": "output_text", "text": text, "annotations": [
+                 {"type": "url_citation", "url": "https://avanza.se/", "title": "Avanza",
+                  "start_index": 0, "end_index": 6}]}]},
+        ],
+    }
+
+
+def claude_message(text):
+    """Messages API payload with one cited answer."""
+    return {"id": "msg_test", "type": "message", "role": "assistant", "model": "claude-test",
+            "stop_reason": "end_turn", "stop_sequence": None, "usage": {"input_tokens": 1, "output_tokens": 1},
+            "content": [{"type": "text", "text": text, "citations": [
+                {"type": "web_search_result_location", "url": "https://avanza.se/", "title": "Avanza",
+                 "encrypted_index": "x", "cited_text": "Avanza"}]}]}
+
+
+class FakeBatchServer:
+    """OpenAI file upload, batch create/retrieve/cancel and file content, kept in memory.
+
+    Queries in `failures` come back in the error file, queries in `missing` in neither file and
+    queries in `malformed` in the output file without a response body. A batch completes on its `polls_to_finish`-th retrieve; with `retrieve_status` set, every
+    retrieve fails with that HTTP status instead.
+    """
+
+    def __init__(self, failures=(), missing=(), malformed=(), polls_to_finish=1):
+        self.failures = set(failures)
+        self.missing = set(missing)
+        self.malformed = set(malformed)
+        self.polls_to_finish = polls_to_finish
+        self.retrieve_status = None
+        self.files = {}
+        self.batches = {}
+        self.retrieves = 0
+
+    def batch_json(self, batch):
+        return {key: value for key, value in batch.items() if key != "polls"}
+
+    def complete(self, batch):
+        output, errors = [], []
+        lines = self.files[batch["input_file_id"]].splitlines()
+        for line in lines:
+            request = json.loads(line)
+            query_text = request["body"]["input"]
+            if query_text in self.missing:
+                continue
+            if query_text in self.failures:
+                errors.append({"custom_id": request["custom_id"], "response": {
+                    "status_code": 400, "body": {"error": {"message": f"rejected {query_text}"}}}})
+            elif query_text in self.malformed:
+                output.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": {}}})
+            else:
+                output.append({"custom_id": request["custom_id"], "response": {
+                    "status_code": 200, "body": response_body(f"Answer to {query_text}")}})
+        for key, entries in (("output_file_id", output), ("error_file_id", errors)):
+            if entries:
+                file_id = f"file-{len(self.files)}"
+                self.files[file_id] = "\n".join(json.dumps(entry) for entry in entries)
+                batch[key] = file_id
+        batch["status"] = "completed"
+        batch["request_counts"] = {"total": len(lines),
+                                   "completed": len(output), "failed": len(errors)}
+
+    def handler(self, request):
+        path = request.url.path.removeprefix("/v1")
+        if request.method == "POST" and path == "/files":
+            # The JSONL upload is the only multipart part whose lines are JSON requests
+            lines = [line for line in request.content.decode().splitlines() if line.startswith('{"custom_id"')]
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = "\n".join(lines)
+            return httpx.Response(200, json={"id": file_id, "object": "file", "bytes": 0, "created_at": 0,
+                                             "filename": "queries.jsonl", "purpose": "batch", "status": "processed"})
+        if request.method == "POST" and path == "/batches":
+            body = json.loads(request.content)
+            batch_id = f"batch_{len(self.batches)}"
+            self.batches[batch_id] = dict(id=batch_id, object="batch", endpoint=body["endpoint"],
+                                          input_file_id=body["input_file_id"], completion_window="24h",
+                                          created_at=0, status="in_progress", polls=0)
+            return httpx.Response(200, json=self.batch_json(self.batches[batch_id]))
+        if path.startswith("/batches/"):
+            batch = self.batches[path.split("/")[2]]
+            if path.endswith("/cancel"):
+                batch["status"] = "cancelling"
+            else:
+                self.retrieves += 1
+                if self.retrieve_status:
+                    return httpx.Response(self.retrieve_status, json={"error": {"message": "unavailable"}})
+                batch["polls"] += 1
+                if batch["status"] == "in_progress" and batch["polls"] >= self.polls_to_finish:
+                    self.complete(batch)
+            return httpx.Response(200, json=self.batch_json(batch))
+        if request.method == "GET" and path.startswith("/files/") and path.endswith("/content"):
+            return httpx.Response(200, text=self.files[path.split("/")[2]])
+        return httpx.Response(404, json={"error": {"message": f"no route for {request.method} {path}"}})
+
+
+def fake_provider(server, tmp_path):
+    provider = OpenAIIntegration(model_name="gpt-test", api_key="test-key", raw_store=RawStore(str(tmp_path / "raw")))
+    provider.client = AsyncOpenAI(api_key="test-key", max_retries=0, base_url="https://openai.test/v1",
+                                  http_client=httpx.AsyncClient(transport=httpx.MockTransport(server.handler)))
+    return provider
+
+
+def test_partial_failures_become_failed_rows(tmp_path):
+    server = FakeBatchServer(failures={"fees"}, missing={"apps"}, malformed={"isk"})
+    provider = fake_provider(server, tmp_path)
+    units = [("brokers", 0), ("fees", 0), ("apps", 0), ("brokers", 1), ("isk", 0)]
+
+    results = asyncio.run(provider.batch_api_query(units))
+
+    assert [(r.query_text, r.attempt) for r in results] == units
+    assert results[0].response_text == "Answer to brokers" and results[0].error is None
+    assert results[0].search_urls == ["https://avanza.se/"]
+    assert results[3].response_text == "Answer to brokers" and results[3].raw_id
+    assert results[1].error.startswith("BatchRequestError") and "rejected fees" in results[1].error
+    assert results[2].error == "BatchRequestError: missing from batch results"
+    assert results[4].error.startswith("BatchRequestError: unreadable result")
+    assert len(server.batches) == 1
+
+
+def test_resume_reattaches_to_open_batch(tmp_path):
+    server = FakeBatchServer()
+    journal = RunJournal(str(tmp_path / "journal.sqlite"))
+    units = [("brokers", 0), ("fees", 0)]
+
+    # The first run submits, then loses the provider before the job ends
+    server.retrieve_status = 400
+    first = asyncio.run(fake_provider(server, tmp_path).batch_api_query(units, "run-1", journal))
+    assert all(result.error for result in first)
+    assert list(journal.open_batches("run-1", "OpenAI")) == ["batch_0"]
+
+    # The resumed run collects the same job instead of paying for a second one
+    server.retrieve_status = None
+    resumed = asyncio.run(fake_provider(server, tmp_path).batch_api_query(units, "run-1", journal))
+    assert [result.response_text for result in resumed] == ["Answer to brokers", "Answer to fees"]
+    assert len(server.batches) == 1
+    assert journal.open_batches("run-1", "OpenAI") == {}
+    journal.close()
+
+
+def test_resume_submits_only_units_missing_from_open_batch(tmp_path):
+    server = FakeBatchServer()
+    journal = RunJournal(str(tmp_path / "journal.sqlite"))
+    server.retrieve_status = 400
+    asyncio.run(fake_provider(server, tmp_path).batch_api_query([("brokers", 0)], "run-1", journal))
+
+    server.retrieve_status = None
+    resumed = asyncio.run(fake_provider(server, tmp_path).batch_api_query([("brokers", 0), ("fees", 0)],
+                                                                         "run-1", journal))
+    assert [result.response_text for result in resumed] == ["Answer to brokers", "Answer to fees"]
+    assert len(server.batches) == 2
+    assert journal.open_batches("run-1", "OpenAI") == {}
+    journal.close()
+
+
+def test_cancelling_the_wait_cancels_the_batch(tmp_path):
+    server = FakeBatchServer(polls_to_finish=10 ** 6)
+    provider = fake_provider(server, tmp_path)
+
+    async def cancel_while_polling():
+        task = asyncio.ensure_future(provider.batch_api_query([("brokers", 0)]))
+        while not server.retrieves:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_while_polling())
+    assert server.batches["batch_0"]["status"] == "cancelling"
+
+
+def test_providers_without_batch_api_refuse_batch_jobs(tmp_path):
+    provider = fake_provider(FakeBatchServer(), tmp_path)
+    provider.supports_batch_api = False
+    with pytest.raises(BatchUnsupportedError, match="OpenAI has no batch API"):
+        asyncio.run(provider.batch_api_query([("brokers", 0)]))
+
+
+class FakeClaudeBatchServer:
+    """Anthropic message batch create/retrieve/cancel and results file, kept in memory.
+
+    Queries in `failures` come back errored, queries in `missing` not at all and queries in
+    `malformed` as a succeeded message without content. A batch ends on its
+    `polls_to_finish`-th retrieve.
+    """
+
+    def __init__(self, failures=(), missing=(), malformed=(), polls_to_finish=1):
+        self.failures = set(failures)
+        self.missing = set(missing)
+        self.malformed = set(malformed)
+        self.polls_to_finish = polls_to_finish
+        self.batches = {}
+        self.results = {}
+        self.retrieves = 0
+
+    def batch_json(self, batch):
+        return {key: value for key, value in batch.items() if key not in ("polls", "requests")}
+
+    def result(self, request):
+        query_text = request["params"]["messages"][0]["content"]
+        if query_text in self.failures:
+            return {"type": "errored", "error": {"type": "error", "error": {
+                "type": "invalid_request_error", "message": f"rejected {query_text}"}}}
+        message = claude_message(f"Answer to {query_text}")
+        if query_text in self.malformed:
+            message["content"] = None
+        return {"type": "succeeded", "message": message}
+
+    def end(self, batch):
+        lines = [{"custom_id": request["custom_id"], "result": self.result(request)}
+                 for request in batch["requests"]
+                 if request["params"]["messages"][0]["content"] not in self.missing]
+        self.results[batch["id"]] = "\n".join(json.dumps(line) for line in lines)
+        succeeded = sum(line["result"]["type"] == "succeeded" for line in lines)
+        batch.update(processing_status="ended", ended_at="2025-01-01T01:00:00Z",
+                     results_url=f"https://anthropic.test/v1/messages/batches/{batch['id']}/results",
+                     request_counts=dict(batch["request_counts"], processing=0, succeeded=succeeded,
+                                         errored=len(lines) - succeeded))
+
+    def handler(self, request):
+        path = request.url.path.removeprefix("/v1/messages/batches")
+        if request.method == "POST" and path == "":
+            batch_id = f"msgbatch_{len(self.batches)}"
+            requests = json.loads(request.content)["requests"]
+            self.batches[batch_id] = dict(
+                id=batch_id, type="message_batch", processing_status="in_progress", polls=0, requests=requests,
+                created_at="2025-01-01T00:00:00Z", expires_at="2025-01-02T00:00:00Z",
+                request_counts=dict(processing=len(requests), succeeded=0, errored=0, canceled=0, expired=0))
+            return httpx.Response(200, json=self.batch_json(self.batches[batch_id]))
+        batch_id, _, action = path.removeprefix("/").partition("/")
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return httpx.Response(404, json={"type": "error", "error": {"type": "not_found_error",
+                                                                       "message": f"no route for {path}"}})
+        if action == "cancel":
+            batch["processing_status"] = "canceling"
+        elif action == "results":
+            return httpx.Response(200, text=self.results[batch_id])
+        else:
+            self.retrieves += 1
+            batch["polls"] += 1
+            if batch["processing_status"] == "in_progress" and batch["polls"] >= self.polls_to_finish:
+                self.end(batch)
+        return httpx.Response(200, json=self.batch_json(batch))
+
+
+def fake_claude_provider(server, tmp_path):
+    provider = ClaudeIntegration(model_name="claude-test", api_key="test-key",
+                                 raw_store=RawStore(str(tmp_path / "raw")))
+    provider.client = AsyncAnthropic(api_key="test-key", max_retries=0, base_url="https://anthropic.test",
+                                     http_client=httpx.AsyncClient(transport=httpx.MockTransport(server.handler)))
+    return provider
+
+
+def test_claude_batch_failures_become_failed_rows(tmp_path):
+    server = FakeClaudeBatchServer(failures={"fees"}, missing={"apps"}, malformed={"isk"})
+    provider = fake_claude_provider(server, tmp_path)
+    units = [("brokers", 0), ("fees", 0), ("apps", 0), ("isk", 0), ("brokers", 1)]
+
+    results = asyncio.run(provider.batch_api_query(units))
+
+    assert [(r.query_text, r.attempt) for r in results] == units
+    assert results[0].response_text == "Answer to brokers" and results[0].error is None
+    assert results[0].search_urls == ["https://avanza.se/"]
+    assert results[4].response_text == "Answer to brokers" and results[4].raw_id
+    assert results[1].error.startswith("BatchRequestError: errored") and "rejected fees" in results[1].error
+    assert results[2].error == "BatchRequestError: missing from batch results"
+    # The unreadable answer fails only its own row
+    assert results[3].error.startswith("BatchRequestError: unreadable result")
+    assert len(server.batches) == 1 and server.retrieves >= 1
+
+
+def test_cancelling_the_wait_cancels_the_claude_batch(tmp_path):
+    server = FakeClaudeBatchServer(polls_to_finish=10 ** 6)
+    provider = fake_claude_provider(server, tmp_path)
+
+    async def cancel_while_polling():
+        task = asyncio.ensure_future(provider.batch_api_query([("brokers", 0)]))
+        while not server.retrieves:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_while_polling())
+    assert server.batches["msgbatch_0"]["processing_status"] == "canceling"
@@ -0,0 +1,22 @@
+from citations import citation_host, citation_metrics, citation_table, top_domains
+
+REDIRECT = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/abc"
+
+
+def test_gemini_redirect_host_comes_from_a_domain_title():
+    assert citation_host(REDIRECT, "www.Avanza.se") == "avanza.se"
+    assert citation_host(REDIRECT, "Avanza Bank") == ""
+    assert citation_host(REDIRECT) == ""
+    assert citation_host("https://www.google.com/search?q=isk", "Google") == "google.com"
+
+
+def test_unknown_hosts_are_left_out_of_domains():
+    results = [dict(provider_name="Gemini", query_text="isk",
+                    search_urls=[(REDIRECT, "avanza.se"), (REDIRECT, "Avanza Bank"), (REDIRECT, "Nordnet")]),
+               dict(provider_name="Perplexity", query_text="isk", search_urls=["https://nordnet.se/isk"])]
+    ranking = top_domains(citation_table(results))
+
+    assert sorted(ranking["domain"]) == ["avanza.se", "nordnet.se"]
+    assert ranking["share"].sum() == 100
+    metrics = citation_metrics(results[0]["search_urls"], "Avanza", "Nordnet", brand_domains={})
+    assert metrics == dict(url_domains=["avanza.se"], brand_domain_mentions=1, competitor_domain_mentions=0)
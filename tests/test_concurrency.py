@@ -0,0 +1,82 @@
+# fetch_all must overlap provider calls: a run takes as long as its slowest call, not the sum of them.
+# The real integrations run against mock endpoints, so a blocking SDK call would serialize the run.
+import asyncio
+import functools
+import json
+import time
+
+import httpx
+
+import demo_runner
+from llm_integrations import claude_integration, gemini_integration, http_pool, openai_integration, perplexity_integration
+from test_batch_jobs import claude_message, response_body
+from utils.raw_store import RawStore
+
+DELAY_SECONDS = 0.2
+INTEGRATIONS = [openai_integration.OpenAIIntegration, claude_integration.ClaudeIntegration,
+                gemini_integration.GeminiIntegration, perplexity_integration.PerplexityIntegration]
+
+
+def gemini_response(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]},
+                            "groundingMetadata": {"groundingChunks": [
+                                {"web": {"uri": "https://avanza.se/", "title": "avanza.se"}}]}}]}
+
+
+def perplexity_response(text):
+    return {"choices": [{"message": {"role": "assistant", "content": text}}], "citations": ["https://avanza.se/"]}
+
+
+class SlowProviders:
+    """One mock endpoint per provider API, each answering after DELAY_SECONDS; tracks peak concurrency."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+
+    async def handler(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(DELAY_SECONDS)
+        finally:
+            self.in_flight -= 1
+        body = json.loads(request.content)
+        path = request.url.path
+        if path.endswith("/responses"):
+            return httpx.Response(200, json=response_body(f"OpenAI on {body['input']}"))
+        if path.endswith("/messages"):
+            return httpx.Response(200, json=claude_message(f"Claude on {body['messages'][0]['content']}"))
+        if path.endswith(":generateContent"):
+            return httpx.Response(200, json=gemini_response(f"Gemini on {body['contents'][0]['parts'][0]['text']}"))
+        if path.endswith("/chat/completions"):
+            return httpx.Response(200, json=perplexity_response(f"Perplexity on {body['messages'][1]['content']}"))
+        return httpx.Response(404, json={"error": {"message": f"no route for {path}"}})
+
+
+def test_fetch_all_overlaps_real_provider_calls(tmp_path, monkeypatch):
+    server = SlowProviders()
+    transport = httpx.MockTransport(server.handler)
+    # Fresh shared clients whose connections all go to the mock endpoints
+    monkeypatch.setattr(http_pool, "_clients", {})
+    for module in (openai_integration, claude_integration, perplexity_integration):
+        monkeypatch.setattr(module, "http_client", lambda **kwargs: httpx.AsyncClient(transport=transport, **kwargs))
+    monkeypatch.setattr(gemini_integration, "client_args", lambda **kwargs: dict(transport=transport, **kwargs))
+    raw_store = RawStore(str(tmp_path))
+    monkeypatch.setattr(demo_runner, "PROVIDER_CLASSES", [
+        functools.partial(integration, model_name="test-model", api_key="test-key", raw_store=raw_store)
+        for integration in INTEGRATIONS])
+    queries = [f"query {index}" for index in range(3)]
+
+    start = time.perf_counter()
+    results = asyncio.run(demo_runner.fetch_all(queries, repeat_count=2, use_cache=False))
+    elapsed = time.perf_counter() - start
+
+    assert [result.error for result in results] == [None] * 24
+    assert {result.response_text for result in results} >= {"OpenAI on query 0", "Claude on query 1",
+                                                            "Gemini on query 2", "Perplexity on query 0"}
+    assert server.requests == 24 and server.peak == 24
+    # 24 calls take 4.8 s one after another; run concurrently they finish in about one delay
+    assert elapsed < DELAY_SECONDS * 3
@@ -0,0 +1,117 @@
+# Results sheet export against an in-memory spreadsheet that applies the batch_update requests
+import pytest
+
+from utils.gsheet_interactions import create_or_update_results_sheet
+
+
+class FakeSpreadsheet:
+    """Stand-in for a gspread Spreadsheet that applies addSheet and updateCells requests.
+
+    `calls` counts batch_update round trips.
+    """
+
+    def __init__(self):
+        self.sheets = {}
+        self.calls = 0
+
+    def batch_update(self, body):
+        self.calls += 1
+        for request in body["requests"]:
+            if "addSheet" in request:
+                properties = request["addSheet"]["properties"]
+                grid = properties["gridProperties"]
+                if properties["title"] in (sheet["title"] for sheet in self.sheets.values()):
+                    raise ValueError(f"A sheet with the name \"{properties['title']}\" already exists")
+                self.sheets[properties["sheetId"]] = dict(
+                    title=properties["title"], bold=set(), frozen_rows=grid.get("frozenRowCount", 0),
+                    cells=[[None] * grid["columnCount"] for _ in range(grid["rowCount"])])
+            elif "updateCells" in request:
+                update = request["updateCells"]
+                sheet = self.sheets[update["start"]["sheetId"]]
+                for offset, row in enumerate(update["rows"]):
+                    row_index = update["start"]["rowIndex"] + offset
+                    for column, cell in enumerate(row["values"]):
+                        # Writing outside the grid fails in the real API too
+                        value = cell.get("userEnteredValue", {})
+                        sheet["cells"][row_index][column] = value.get("numberValue", value.get("stringValue"))
+                        if cell.get("userEnteredFormat", {}).get("textFormat", {}).get("bold"):
+                            sheet["bold"].add(row_index)
+            else:
+                raise ValueError(f"Unsupported request: {list(request)}")
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def only_sheet(self):
+        assert len(self.sheets) == 1
+        return next(iter(self.sheets.values()))
+
+
+def result(provider, query, brand_mention, competitor_mention, error=None):
+    return dict(provider_name=provider, query_text=query, brand_mention=brand_mention,
+                competitor_mention=competitor_mention, error=error)
+
+
+def export(results, **kwargs):
+    spreadsheet = FakeSpreadsheet()
+    assert create_or_update_results_sheet(spreadsheet, results, "Avanza", "Nordnet", **kwargs)
+    return spreadsheet, spreadsheet.only_sheet()
+
+
+def test_one_column_pair_per_provider():
+    results = [result("Perplexity", "fees", 1, 0), result("Gemini", "fees", 1, 1),
+               result("Perplexity", "apps", 0, 1), result("Gemini", "apps", 0, 0),
+               result("Perplexity", "fees", 1, 1)]
+    spreadsheet, sheet = export(results, repeat_count=2)
+
+    assert spreadsheet.calls == 1
+    assert sheet["cells"] == [
+        ["Query", "Avanza - Perplexity Mentions", "Avanza - Gemini Mentions",
+         "Nordnet - Perplexity Mentions", "Nordnet - Gemini Mentions", None],
+        ["fees", 2, 1, 1, 1, None],
+        ["apps", 0, 0, 1, 0, None],
+        [None] * 6,
+        ["SUMMARY", "Avanza Mentions", "Nordnet Mentions", "Total Responses", "Timestamp", "Repeats per Query"],
+        ["Total Mentions", 3, 3, 5, sheet["title"].removeprefix("Results "), 2],
+    ]
+
+
+def test_failed_rows_are_left_out():
+    results = [result("Perplexity", "fees", 1, 1), result("Gemini", "fees", 0, 0, error="TimeoutError: slow"),
+               result("Gemini", "apps", 0, 0, error="TimeoutError: slow")]
+    _, sheet = export(results)
+
+    assert sheet["cells"][0] == ["Query", "Avanza - Perplexity Mentions", "Nordnet - Perplexity Mentions", None, None]
+    assert sheet["cells"][1] == ["fees", 1, 1, None, None]
+    assert sheet["cells"][-1] == ["Total Mentions", 1, 1, 1, sheet["title"].removeprefix("Results ")]
+
+
+def test_sheet_is_sized_to_the_data_with_header_and_summary_bold():
+    results = [result(provider, f"query {index}", index % 2, 1)
+               for index in range(7) for provider in ("Perplexity", "Gemini", "OpenAI")]
+    _, sheet = export(results, repeat_count=1)
+
+    # Header, 7 queries, a blank row, summary labels and totals; query plus 3 + 3 provider columns
+    assert len(sheet["cells"]) == 11
+    assert {len(row) for row in sheet["cells"]} == {7}
+    assert sheet["bold"] == {0, 9}
+    assert sheet["frozen_rows"] == 1
+
+
+@pytest.mark.parametrize("chunk_rows, calls", [(4, 3), (5, 2), (10, 1)])
+def test_large_exports_are_chunked(chunk_rows, calls):
+    # 5 queries make a 9-row sheet
+    results = [result("Perplexity", f"query {index}", 1, 0) for index in range(5)]
+    spreadsheet, sheet = export(results, chunk_rows=chunk_rows)
+    unchunked = export(results)[1]
+
+    assert spreadsheet.calls == calls
+    assert sheet["cells"] == unchunked["cells"]
+    assert sheet["bold"] == unchunked["bold"] == {0, 7}
+
+
+def test_export_errors_are_reported_not_raised():
+    class QuotaExceeded(FakeSpreadsheet):
+        def batch_update(self, body):
+            raise RuntimeError("quota exceeded")
+
+    results = [result("Perplexity", "fees", 1, 0)]
+    assert create_or_update_results_sheet(QuotaExceeded(), results, "Avanza", "Nordnet") is False
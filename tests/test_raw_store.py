@@ -0,0 +1,46 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_integrations.base import BaseProvider
+from utils.raw_store import RawStore
+
+
+def test_concurrent_puts_of_one_payload(tmp_path):
+    store = RawStore(str(tmp_path))
+    payload = {"output_text": "Avanza and Nordnet are popular in Sweden." * 1000}
+    with ThreadPoolExecutor(16) as pool:
+        raw_ids = set(pool.map(lambda _: store.put(payload), range(64)))
+
+    assert len(raw_ids) == 1
+    assert store.get(raw_ids.pop()) == payload
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+class SlowRawStore(RawStore):
+    def put(self, payload):
+        time.sleep(0.1)
+        return super().put(payload)
+
+
+class StubProvider(BaseProvider):
+    provider_name = "Stub"
+    env_prefix = "STUB_RAW"
+
+    async def fetch(self, query_text):
+        return dict(response={"text": query_text}, response_text=query_text, search_urls=[])
+
+
+def test_raw_store_writes_do_not_block_the_event_loop(tmp_path):
+    provider = StubProvider("stub-model", raw_store=SlowRawStore(str(tmp_path)))
+
+    async def query_all():
+        return await asyncio.gather(*[provider.query(f"query {index}") for index in range(8)])
+
+    start = time.perf_counter()
+    results = asyncio.run(query_all())
+    elapsed = time.perf_counter() - start
+
+    assert all(provider.raw_store.get(result.raw_id) == {"text": result.query_text} for result in results)
+    # 8 writes take 0.8 s on the loop; off it they overlap
+    assert elapsed < 0.4
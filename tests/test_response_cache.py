@@ -0,0 +1,52 @@
+import time
+
+from llm_integrations.response_cache import ResponseCache
+
+
+def open_cache(tmp_path, **kwargs):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), **kwargs)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    return cache, statements
+
+
+def test_writes_under_the_limit_do_not_sum_the_table(tmp_path):
+    cache, statements = open_cache(tmp_path, ttl_seconds=0, max_mb=1)
+    for index in range(20):
+        cache.set(f"key {index}", {"response_text": "Avanza" * index})
+
+    assert not [statement for statement in statements if "SUM(size)" in statement]
+    assert cache._total_bytes == cache._count_bytes()
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted_past_the_limit(tmp_path):
+    cache, _ = open_cache(tmp_path, ttl_seconds=0, max_mb=1000 / (1024 * 1024))
+    for index in range(3):
+        cache.set(f"key {index}", "x" * 298)  # 300 bytes once JSON-encoded
+    cache.get("key 0")
+    cache.set("key 3", "x" * 298)
+
+    assert [cache.get(f"key {index}") is not None for index in range(4)] == [True, False, True, True]
+    assert cache._total_bytes == cache._count_bytes() == 900
+    cache.close()
+
+
+def test_total_follows_replaced_expired_and_cleared_entries(tmp_path):
+    cache, _ = open_cache(tmp_path, ttl_seconds=60, max_mb=1)
+    cache.set("fees", "x" * 100)
+    cache.set("fees", "x" * 10)
+    cache.set("apps", "x" * 50)
+    assert cache._total_bytes == cache._count_bytes() == 64
+
+    cache._conn.execute("UPDATE responses SET created_at = ? WHERE key = 'apps'", (time.time() - 120,))
+    assert cache.get("apps") is None
+    assert cache._total_bytes == cache._count_bytes() == 12
+
+    cache._conn.execute("UPDATE responses SET created_at = ?", (time.time() - 120,))
+    cache.set("isk", "x" * 20)
+    assert cache._total_bytes == cache._count_bytes() == 22
+
+    cache.clear()
+    assert cache._total_bytes == 0
+    cache.close()
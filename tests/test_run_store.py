@@ -0,0 +1,48 @@
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from utils import run_store
+from utils.run_store import RunStore
+
+
+def rows(count):
+    return [dict(provider_name="Gemini", model_name="demo", query_text=f"query {index}", attempt=0,
+                 brand_name="Avanza", competitor_name="Nordnet", brand_mention=1, response_text="Avanza.")
+            for index in range(count)]
+
+
+def test_compaction_that_crashed_before_publishing_leaves_loads_working(tmp_path, monkeypatch):
+    store = RunStore(str(tmp_path))
+    for _ in range(3):
+        store.append(rows(3), run_at=datetime(2025, 1, 1, tzinfo=timezone.utc))
+
+    def crash(source, destination):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(run_store.os, "replace", crash)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.undo()
+
+    assert list(tmp_path.rglob("*.tmp"))
+    assert len(store.load()) == 9
+    assert len(store.runs()) == 3
+
+
+def test_loads_during_compaction_see_every_row_once(tmp_path):
+    store = RunStore(str(tmp_path))
+    for _ in range(20):
+        store.append(rows(5), run_at=datetime(2025, 1, 1, tzinfo=timezone.utc))
+
+    counts = []
+    compacting = threading.Thread(target=store.compact)
+    compacting.start()
+    while compacting.is_alive():
+        counts.append(len(store.load(columns=["run_id"])))
+    compacting.join()
+
+    assert set(counts) <= {100}
+    assert len(list(tmp_path.rglob("*.parquet"))) == 1
+    assert len(store.load()) == 100
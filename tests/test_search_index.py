@@ -0,0 +1,52 @@
+import asyncio
+
+import demo_runner
+from llm_integrations.base import BaseProvider, ProviderResult
+from utils.search_index import SearchIndex
+
+
+class StubProvider(BaseProvider):
+    provider_name = "Stub"
+    env_prefix = "STUB_SEARCH"
+
+    def __init__(self, cache=None):
+        super().__init__("stub-model", cache=cache)
+        self.raw_store = None
+
+    async def fetch(self, query_text):
+        return dict(response={}, response_text=f"Avanza has low fees for {query_text}", search_urls=[])
+
+
+def test_rows_without_run_id_are_indexed_once(tmp_path, monkeypatch, capsys):
+    index = SearchIndex(str(tmp_path / "index.sqlite"))
+    monkeypatch.setattr(demo_runner, "get_default_search_index", lambda: index)
+    monkeypatch.setattr(demo_runner, "PROVIDER_CLASSES", [StubProvider])
+
+    for _ in range(2):
+        results = asyncio.run(demo_runner.run_all("Avanza", "Nordnet", ["isk", "kf"], use_cache=False))
+        assert len(results) == 2
+        assert "Response cache: 0 hits, 2 misses" in capsys.readouterr().out
+    assert index.count() == 2
+    assert {hit["query_text"] for hit in index.search("low fees")} == {"isk", "kf"}
+    index.close()
+
+
+def test_rows_are_searchable_as_they_arrive(tmp_path, monkeypatch):
+    index = SearchIndex(str(tmp_path / "index.sqlite"))
+    monkeypatch.setattr(demo_runner, "get_default_search_index", lambda: index)
+
+    async def raw_stream():
+        for query_text in ("isk", "kf"):
+            yield ProviderResult(provider_name="Stub", model_name="stub-model", query_text=query_text,
+                                 response_text=f"Avanza answers {query_text}")
+
+    async def first_row_count():
+        stream = demo_runner.analyze_stream(raw_stream(), "Avanza", "Nordnet", "run-1")
+        await anext(stream)
+        count = index.count()
+        await stream.aclose()
+        return count
+
+    assert asyncio.run(first_row_count()) == 1
+    assert index.search("kf") == []
+    index.close()
@@ -0,0 +1,46 @@
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_integrations import sentiment_analysis
+from llm_integrations.sentiment_analysis import LexiconBackend, SentimentAnalysis
+
+
+def test_negation_applies_to_contractions():
+    polarities = LexiconBackend().score_batch(["This is good.", "This isn't good.", "This isn’t good.",
+                                               "This is not good.", "Det är inte bra."])
+    assert polarities[0] == 0.6
+    assert polarities[1] == polarities[2] == polarities[3] == polarities[4] == -0.3
+
+
+def test_unknown_backend_setting_falls_back_to_default(monkeypatch):
+    monkeypatch.setenv("SENTIMENT_BACKEND", "vader")
+    try:
+        reloaded = importlib.reload(sentiment_analysis)
+        assert reloaded.SENTIMENT_BACKEND == reloaded.DEFAULT_SENTIMENT_BACKEND
+    finally:
+        monkeypatch.delenv("SENTIMENT_BACKEND")
+        importlib.reload(sentiment_analysis)
+
+
+def test_shared_analyzer_serves_concurrent_sessions():
+    analyzer = SentimentAnalysis("lexicon", workers=1, cache_size=50)
+    texts = [f"Avanza is good, review {index}" for index in range(200)]
+    expected = LexiconBackend().score_batch(texts)
+
+    # A small memo makes every call evict entries other threads are reading
+    with ThreadPoolExecutor(8) as pool:
+        runs = list(pool.map(lambda offset: analyzer.predict_polarity(texts[offset:] + texts[:offset]), range(0, 200, 5)))
+
+    for offset, polarities in zip(range(0, 200, 5), runs):
+        assert polarities == expected[offset:] + expected[:offset]
+    assert len(analyzer._polarities) <= 50
+
+
+def test_worker_pool_scores_like_one_process():
+    analyzer = SentimentAnalysis("lexicon", workers=2, parallel_min_texts=1, batch_size=2)
+    texts = ["This isn't good.", "Avanza är bäst.", "Fees are high.", "Nordnet är dyrt.", "Great app."]
+    try:
+        assert analyzer.predict_polarity(texts) == LexiconBackend().score_batch(texts)
+        assert analyzer._executor is not None
+    finally:
+        analyzer.close()
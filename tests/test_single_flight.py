@@ -0,0 +1,57 @@
+import asyncio
+
+from llm_integrations.rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE, request_context
+from llm_integrations.single_flight import SingleFlight
+
+
+def run_pair(first_priority, second_priority):
+    """Start the same key at `first_priority`, then at `second_priority` while it runs."""
+    group = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(asyncio.current_task())
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def caller(priority):
+        with request_context("client", priority):
+            return await group.do("key", call)
+
+    async def main():
+        first = asyncio.ensure_future(caller(first_priority))
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, caller(second_priority))
+
+    return asyncio.run(main()), len(calls)
+
+
+def test_less_or_equally_urgent_callers_join():
+    assert run_pair(PRIORITY_INTERACTIVE, PRIORITY_BATCH) == ([("answer", False), ("answer", True)], 1)
+    assert run_pair(PRIORITY_BATCH, PRIORITY_BATCH) == ([("answer", False), ("answer", True)], 1)
+
+
+def test_interactive_caller_does_not_wait_behind_batch_call():
+    assert run_pair(PRIORITY_BATCH, PRIORITY_INTERACTIVE) == ([("answer", False), ("answer", False)], 2)
+
+
+def test_caller_after_cancelled_call_starts_a_new_one():
+    group = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(asyncio.current_task())
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        first = asyncio.ensure_future(group.do("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        # Right after the cancel, before the cancelled call has finished
+        second = asyncio.ensure_future(group.do("key", call))
+        await asyncio.gather(first, return_exceptions=True)
+        return await second
+
+    assert asyncio.run(main()) == ("answer", False)
+    assert len(calls) == 2
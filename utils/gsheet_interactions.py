@@ -3,12 +3,15 @@ from datetime import datetime
 import gspread
 import pandas as pd
 import os
+import random
 from dotenv import load_dotenv
 
 load_dotenv()
 
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")  # Get from your .env file
 CREDENTIALS_FILE = "google_sheets_credentials.json"  # Path to your credentials file
+# Sheet rows per batch_update call; larger exports are written in several calls
+SHEETS_CHUNK_ROWS = int(os.getenv("SHEETS_CHUNK_ROWS", "5000"))
 
 def setup_google_sheets():
     """Setup and authenticate with Google Sheets API"""
@@ -86,114 +89,88 @@ def load_config_from_google_sheets(gc):
         print("Using default values instead.")
         return "Avanza", "Nordnet", ["What to use for investing in stocks in Sweden?"], None
 
-def create_or_update_results_sheet(spreadsheet, results, target_brand, competitor_brand, repeat_count):
-    """Save results to a new sheet in the Google Spreadsheet with raw values"""
-    # Create a timestamp for the sheet name
+def results_sheet_values(results, target_brand, competitor_brand, timestamp, repeat_count=None):
+    """Every cell of a results sheet as rows of values, plus the indices of the rows to bold.
+
+    `results` are analyzed rows (provider_name, query_text, brand_mention, competitor_mention);
+    failed rows are left out. Each provider in the results gets a target and a competitor column.
+    """
+    df = pd.DataFrame(list(results), columns=["provider_name", "query_text", "brand_mention",
+                                              "competitor_mention", "error"])
+    df = df[df["error"].isna()]
+    providers = list(dict.fromkeys(df["provider_name"]))
+    # Queries keep the order they were asked in
+    per_query = df.groupby(["query_text", "provider_name"], sort=False)[["brand_mention", "competitor_mention"]].sum()
+    target = per_query["brand_mention"].unstack("provider_name").reindex(columns=providers)
+    competitor = per_query["competitor_mention"].unstack("provider_name").reindex(columns=providers)
+    queries = list(dict.fromkeys(df["query_text"]))
+    table = pd.concat([target, competitor], axis=1).reindex(queries).fillna(0).astype(int)
+
+    headers = (["Query"]
+               + [f"{target_brand} - {provider} Mentions" for provider in providers]
+               + [f"{competitor_brand} - {provider} Mentions" for provider in providers])
+    values = [headers]
+    values += [[query, *counts] for query, counts in zip(table.index, table.to_numpy().tolist())]
+    summary_row = len(values) + 1  # Leave a blank row
+    values += [
+        [],
+        ["SUMMARY", f"{target_brand} Mentions", f"{competitor_brand} Mentions", "Total Responses", "Timestamp",
+         *(["Repeats per Query"] if repeat_count else [])],
+        ["Total Mentions", int(df["brand_mention"].sum()), int(df["competitor_mention"].sum()), len(df), timestamp,
+         *([repeat_count] if repeat_count else [])],
+    ]
+    return values, [0, summary_row]
+
+
+def _cell(value, bold=False):
+    cell = {}
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        cell["userEnteredValue"] = {"numberValue": value}
+    elif value is not None:
+        cell["userEnteredValue"] = {"stringValue": str(value)}
+    if bold:
+        cell["userEnteredFormat"] = {"textFormat": {"bold": True}}
+    return cell
+
+
+def update_cells_request(sheet_id, start_row, rows, bold_rows=()):
+    """An updateCells request writing `rows` of values, and bold where asked, from row `start_row`."""
+    return {"updateCells": {
+        "start": {"sheetId": sheet_id, "rowIndex": start_row, "columnIndex": 0},
+        "rows": [{"values": [_cell(value, start_row + offset in bold_rows) for value in row]}
+                 for offset, row in enumerate(rows)],
+        "fields": "userEnteredValue,userEnteredFormat.textFormat.bold",
+    }}
+
+
+def create_or_update_results_sheet(spreadsheet, results, target_brand, competitor_brand, repeat_count=None,
+                                   chunk_rows=SHEETS_CHUNK_ROWS):
+    """Save results to a new sheet in the Google Spreadsheet with raw values.
+
+    The sheet is sized to the data and its values and formats are sent with one `batch_update`;
+    sheets longer than `chunk_rows` rows are written in further calls of `chunk_rows` rows each,
+    keeping each request within the API size limit.
+    """
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
     sheet_name = f"Results {timestamp}"
-    
+
     try:
-        # Create a new sheet for results
-        results_sheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=20)
-        
-        # Prepare headers
-        headers = [
-            "Query", 
-            f"{target_brand} - Gemini Mentions", 
-            f"{target_brand} - Perplexity Mentions",
-            f"{competitor_brand} - Gemini Mentions", 
-            f"{competitor_brand} - Perplexity Mentions"
-        ]
-        
-        # Write headers
-        results_sheet.update('A1:E1', [headers])
-        
-        # Group results by query
-        query_results = {}
-        for result in results:
-            query = result['query']
-            model = result['model']
-            
-            if query not in query_results:
-                query_results[query] = {'gemini': None, 'perplexity': None}
-                
-            query_results[query][model] = result
-        
-        # Prepare data rows with raw values
-        data_rows = []
-        for query, models in query_results.items():
-            gemini_data = models.get('gemini', {})
-            perplexity_data = models.get('perplexity', {})
-            
-            # Extract raw data for each model (with fallbacks if data is missing)
-            gemini_mentions = sum(gemini_data.get('attempts', [])) if gemini_data else 0
-            gemini_competitor_mentions = sum(gemini_data.get('competitor_attempts', [])) if gemini_data else 0
-            
-            perplexity_mentions = sum(perplexity_data.get('attempts', [])) if perplexity_data else 0
-            perplexity_competitor_mentions = sum(perplexity_data.get('competitor_attempts', [])) if perplexity_data else 0
-            
-            data_rows.append([
-                query, 
-                gemini_mentions,
-                perplexity_mentions,
-                gemini_competitor_mentions,
-                perplexity_competitor_mentions
-            ])
-        
-        # Write data rows
-        if data_rows:
-            results_sheet.update(f'A2:E{len(data_rows)+1}', data_rows)
-        
-        # Add summary at the bottom with raw values
-        summary_row = len(data_rows) + 3  # Leave a blank row
-        results_sheet.update(f'A{summary_row}:A{summary_row+1}', [["SUMMARY"], ["Total Mentions"]])
-        
-        # Calculate overall statistics
-        total_responses = len(query_results) * repeat_count * 2  # *2 because we test two models
-        
-        # Calculate total mentions across all queries and models
-        total_target_mentions = 0
-        total_competitor_mentions = 0
-        
-        for query, models in query_results.items():
-            gemini_data = models.get('gemini', {})
-            perplexity_data = models.get('perplexity', {})
-            
-            # Add up target mentions
-            if gemini_data and 'attempts' in gemini_data:
-                total_target_mentions += sum(gemini_data['attempts'])
-            if perplexity_data and 'attempts' in perplexity_data:
-                total_target_mentions += sum(perplexity_data['attempts'])
-                
-            # Add up competitor mentions
-            if gemini_data and 'competitor_attempts' in gemini_data:
-                total_competitor_mentions += sum(gemini_data['competitor_attempts'])
-            if perplexity_data and 'competitor_attempts' in perplexity_data:
-                total_competitor_mentions += sum(perplexity_data['competitor_attempts'])
-        
-        # Write summary data with raw values
-        results_sheet.update(f'B{summary_row+1}:E{summary_row+1}', [[
-            total_target_mentions,
-            total_competitor_mentions,
-            total_responses,
-            timestamp
-        ]])
-        
-        # Add a row with labels for the summary data
-        results_sheet.update(f'B{summary_row}:E{summary_row}', [[
-            f"{target_brand} Mentions",
-            f"{competitor_brand} Mentions",
-            "Total Responses",
-            "Timestamp"
-        ]])
-        
-        # Format the sheet
-        results_sheet.format('A1:E1', {'textFormat': {'bold': True}})
-        results_sheet.format(f'A{summary_row}:E{summary_row}', {'textFormat': {'bold': True}})
-        
+        values, bold_rows = results_sheet_values(results, target_brand, competitor_brand, timestamp, repeat_count)
+        sheet_id = random.randrange(1, 2 ** 31)
+        add_sheet = {"addSheet": {"properties": {
+            "sheetId": sheet_id,
+            "title": sheet_name,
+            "gridProperties": {"rowCount": len(values), "columnCount": max(len(row) for row in values),
+                               "frozenRowCount": 1},
+        }}}
+        for start in range(0, len(values), chunk_rows):
+            requests = [add_sheet] if start == 0 else []
+            requests.append(update_cells_request(sheet_id, start, values[start:start + chunk_rows], bold_rows))
+            spreadsheet.batch_update({"requests": requests})
+
         print(f"Results saved to Google Sheet tab: '{sheet_name}'")
         return True
-    
+
     except Exception as e:
         print(f"Error saving results to Google Sheet: {e}")
-        return False
\ No newline at end of file
+        return False
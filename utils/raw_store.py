@@ -0,0 +1,68 @@
+# Content-addressed on-disk store for raw provider payloads, so result rows only carry an ID
+import gzip
+import hashlib
+import json
+import os
+import uuid
+
+RAW_STORE_PATH = os.getenv("RAW_STORE_PATH", "raw_store")
+RAW_STORE_ENABLED = os.getenv("RAW_STORE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+
+class RawStore:
+    """Gzipped JSON files named by the SHA-256 of their content, fanned out over 256 directories."""
+
+    def __init__(self, path=RAW_STORE_PATH):
+        self.path = path
+
+    def _file_path(self, raw_id):
+        return os.path.join(self.path, raw_id[:2], f"{raw_id}.json.gz")
+
+    def put(self, payload):
+        """Store a JSON-serializable payload and return its ID. Identical payloads are stored once."""
+        data = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        raw_id = hashlib.sha256(data).hexdigest()
+        file_path = self._file_path(raw_id)
+        if not os.path.exists(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # Write to a temporary name first so readers never see a partial file; the name is unique
+            # per call, as threads and tasks of one process may store the same payload at once
+            temporary_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+            with gzip.open(temporary_path, "wb", compresslevel=6) as f:
+                f.write(data)
+            os.replace(temporary_path, file_path)
+        return raw_id
+
+    def get(self, raw_id):
+        """The payload stored under `raw_id`, or None if it is unknown."""
+        if not raw_id:
+            return None
+        try:
+            with gzip.open(self._file_path(raw_id), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+
+_default_store = None
+
+
+def get_default_raw_store():
+    """Process-wide raw store, or None when RAW_STORE_ENABLED is false."""
+    global _default_store
+    if not RAW_STORE_ENABLED:
+        return None
+    if _default_store is None:
+        _default_store = RawStore()
+    return _default_store
+
+
+def main():
+    store = RawStore()
+    raw_id = store.put({"choices": [{"message": {"content": "Avanza and Nordnet are popular in Sweden."}}]})
+    print(raw_id)
+    print(store.get(raw_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Durable journal of completed (provider, query, attempt) units, so an interrupted run resumes instead of restarting
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from llm_integrations.base import ProviderResult
+
+RUN_JOURNAL_PATH = os.getenv("RUN_JOURNAL_PATH", "run_journal/journal.sqlite")
+
+
+class RunJournal:
+    """SQLite journal of runs and the result of every unit they completed."""
+
+    def __init__(self, path=RUN_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Streamlit reruns scripts on different threads, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Every committed unit must survive a crash of the process or the machine
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " queries TEXT NOT NULL,"
+            " repeat_count INTEGER NOT NULL,"
+            " total_units INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            " run_id TEXT NOT NULL,"
+            " provider_name TEXT NOT NULL,"
+            " query_text TEXT NOT NULL,"
+            " attempt INTEGER NOT NULL,"
+            " failed INTEGER NOT NULL,"
+            " result TEXT NOT NULL,"
+            " completed_at REAL NOT NULL,"
+            " PRIMARY KEY (run_id, provider_name, query_text, attempt))"
+        )
+        # Provider batch jobs still owed to a run, so a resumed run collects them instead of paying twice
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " batch_id TEXT PRIMARY KEY,"
+            " run_id TEXT NOT NULL,"
+            " provider_name TEXT NOT NULL,"
+            " requests TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " finished_at REAL)"
+        )
+        self._conn.commit()
+
+    def start_run(self, queries, repeat_count, total_units, run_id=None):
+        """Register a run and return its ID; an existing run ID keeps its original queries."""
+        run_id = run_id or uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, queries, repeat_count, total_units, created_at) VALUES (?, ?, ?, ?, ?)",
+                (run_id, json.dumps(queries), repeat_count, total_units, time.time()),
+            )
+            self._conn.commit()
+        return run_id
+
+    def run(self, run_id):
+        """(queries, repeat_count) of a registered run, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT queries, repeat_count FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def record(self, run_id, result):
+        """Durably store one unit's result. A failed unit is kept but still counts as missing."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO units (run_id, provider_name, query_text, attempt, failed, result, completed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, result.provider_name, result.query_text, result.attempt, int(bool(result.error)),
+                 json.dumps(result.as_dict(), default=str), time.time()),
+            )
+            self._conn.commit()
+
+    def completed_units(self, run_id):
+        """(provider_name, query_text, attempt) of every unit that finished without an error."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT provider_name, query_text, attempt FROM units WHERE run_id = ? AND failed = 0", (run_id,)
+            ).fetchall()
+        return set(rows)
+
+    def results(self, run_id, include_failed=False):
+        """Journaled results of a run as ProviderResult records."""
+        query = "SELECT result FROM units WHERE run_id = ?" + ("" if include_failed else " AND failed = 0")
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY completed_at", (run_id,)).fetchall()
+        return [ProviderResult(**json.loads(row[0])) for row in rows]
+
+    def finish_run(self, run_id):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def unfinished_runs(self):
+        """(run_id, created_at, completed units, total units) of runs that never finished, newest first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT runs.run_id, runs.created_at,"
+                " (SELECT COUNT(*) FROM units WHERE units.run_id = runs.run_id AND failed = 0), runs.total_units"
+                " FROM runs WHERE finished_at IS NULL ORDER BY created_at DESC"
+            ).fetchall()
+
+    def record_batch(self, run_id, provider_name, batch_id, requests):
+        """Durably store a submitted batch job and its {custom_id: (query_text, attempt)} requests."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batches (batch_id, run_id, provider_name, requests, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (batch_id, run_id, provider_name, json.dumps(requests), time.time()),
+            )
+            self._conn.commit()
+
+    def open_batches(self, run_id, provider_name):
+        """{batch_id: {custom_id: (query_text, attempt)}} of the run's batch jobs whose results were never read."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT batch_id, requests FROM batches WHERE run_id = ? AND provider_name = ? AND finished_at IS NULL"
+                " ORDER BY created_at", (run_id, provider_name)
+            ).fetchall()
+        return {batch_id: {custom_id: tuple(unit) for custom_id, unit in json.loads(requests).items()}
+                for batch_id, requests in rows}
+
+    def finish_batch(self, batch_id):
+        with self._lock:
+            self._conn.execute("UPDATE batches SET finished_at = ? WHERE batch_id = ?", (time.time(), batch_id))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_journal = None
+
+
+def get_default_journal():
+    """Process-wide journal shared by every run."""
+    global _default_journal
+    if _default_journal is None:
+        _default_journal = RunJournal()
+    return _default_journal
@@ -0,0 +1,203 @@
+# Partitioned Parquet dataset of every analyzed run, so history survives the Streamlit session
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RUN_STORE_PATH = os.getenv("RUN_STORE_PATH", "run_store")
+RUN_STORE_ENABLED = os.getenv("RUN_STORE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+PARTITION_COLUMNS = ["date", "provider_name", "brand_name"]
+RUN_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("run_at", pa.timestamp("ms", tz="UTC")),
+    ("date", pa.string()),
+    ("provider_name", pa.string()),
+    ("brand_name", pa.string()),
+    ("competitor_name", pa.string()),
+    ("model_name", pa.string()),
+    ("query_text", pa.string()),
+    ("attempt", pa.int32()),
+    ("cache_hit", pa.bool_()),
+    ("error", pa.string()),
+    ("raw_id", pa.string()),
+    ("response_text", pa.string()),
+    # Gemini cites (uri, title) pairs, so the citations are kept as JSON rather than a list of strings
+    ("search_urls", pa.string()),
+    ("url_domains", pa.list_(pa.string())),
+    ("brands_mentioned", pa.list_(pa.string())),
+    ("brand_mention", pa.int8()),
+    ("competitor_mention", pa.int8()),
+    ("brand_mention_count", pa.int32()),
+    ("competitor_mention_count", pa.int32()),
+    ("brand_first_offset", pa.int32()),
+    ("competitor_first_offset", pa.int32()),
+    ("brand_rank", pa.int32()),
+    ("competitor_rank", pa.int32()),
+    ("brand_domain_mentions", pa.int32()),
+    ("competitor_domain_mentions", pa.int32()),
+    ("brand_mention_context", pa.string()),
+    ("sentiment", pa.string()),
+    ("sentiment_polarity", pa.float64()),
+    ("latency_seconds", pa.float64()),
+])
+_PARTITIONING = ds.partitioning(pa.schema([RUN_SCHEMA.field(name) for name in PARTITION_COLUMNS]), flavor="hive")
+
+
+def to_table(analyzed_results, run_id, run_at):
+    """Arrow table of analyzed rows in the run store schema."""
+    columns = {name: [] for name in RUN_SCHEMA.names}
+    for result in analyzed_results:
+        for name in RUN_SCHEMA.names:
+            columns[name].append(result.get(name))
+    count = len(analyzed_results)
+    columns["run_id"] = [run_id] * count
+    columns["run_at"] = [run_at] * count
+    columns["date"] = [run_at.strftime("%Y-%m-%d")] * count
+    columns["search_urls"] = [json.dumps(urls) if urls is not None else None for urls in columns["search_urls"]]
+    return pa.table(columns, schema=RUN_SCHEMA)
+
+
+class RunStore:
+    """Append-only Parquet dataset partitioned by date, provider and brand (hive layout)."""
+
+    def __init__(self, path=RUN_STORE_PATH):
+        self.path = path
+        # Reads wait for a running compaction, which briefly has both the old files and the merged one
+        self._lock = threading.Lock()
+
+    def append(self, analyzed_results, run_id=None, run_at=None):
+        """Write one run's analyzed rows as new files and return the run ID."""
+        run_id = run_id or uuid.uuid4().hex
+        run_at = run_at or datetime.now(timezone.utc)
+        if not analyzed_results:
+            return run_id
+        ds.write_dataset(
+            to_table(analyzed_results, run_id, run_at),
+            self.path,
+            format="parquet",
+            partitioning=_PARTITIONING,
+            # Unique file names per write, so appends never replace earlier runs
+            basename_template=f"{run_id}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        return run_id
+
+    def _dataset(self):
+        if not os.path.exists(self.path):
+            return None
+        return ds.dataset(self.path, schema=RUN_SCHEMA, format="parquet", partitioning=_PARTITIONING)
+
+    def load(self, columns=None, start_date=None, end_date=None, providers=None, brands=None, run_ids=None):
+        """Rows matching the filters as a DataFrame, reading only the needed partitions and columns.
+
+        Dates are "YYYY-MM-DD" strings and both ends are inclusive.
+        """
+        conditions = []
+        if start_date:
+            conditions.append(ds.field("date") >= start_date)
+        if end_date:
+            conditions.append(ds.field("date") <= end_date)
+        if providers:
+            conditions.append(ds.field("provider_name").isin(list(providers)))
+        if brands:
+            conditions.append(ds.field("brand_name").isin(list(brands)))
+        if run_ids:
+            conditions.append(ds.field("run_id").isin(list(run_ids)))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        # Discovery lists the files, so it must not interleave with a compaction swapping them
+        with self._lock:
+            dataset = self._dataset()
+            if dataset is None:
+                return pd.DataFrame(columns=columns or RUN_SCHEMA.names)
+            return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def runs(self, start_date=None, end_date=None, brands=None):
+        """One row per stored run: when it ran, for which brand, and how many rows it has."""
+        df = self.load(columns=["run_id", "run_at", "brand_name", "competitor_name", "provider_name"],
+                       start_date=start_date, end_date=end_date, brands=brands)
+        if df.empty:
+            return pd.DataFrame(columns=["run_id", "run_at", "brand_name", "competitor_name", "providers", "rows"])
+        return df.groupby(["run_id", "brand_name", "competitor_name"], as_index=False).agg(
+            run_at=("run_at", "min"),
+            providers=("provider_name", "nunique"),
+            rows=("provider_name", "size"),
+        ).sort_values("run_at", ascending=False, ignore_index=True)
+
+    def compact(self, min_files=2):
+        """Merge each partition's small per-run files into one file and return how many were replaced.
+
+        Loads through this store wait for the swap; readers in other processes can see a partition's
+        rows twice for the moment between publishing the merged file and removing the old ones.
+        """
+        replaced = 0
+        for directory, _, file_names in os.walk(self.path):
+            parquet_files = sorted(name for name in file_names if name.endswith(".parquet"))
+            if len(parquet_files) < min_files:
+                continue
+            paths = [os.path.join(directory, name) for name in parquet_files]
+            # Partition values live in the directory names, so the files only hold the other columns
+            table = pa.concat_tables([pq.read_table(path, partitioning=None) for path in paths], promote_options="default")
+            table = table.sort_by([("run_at", "ascending")])
+
+            compacted_name = f"compacted-{uuid.uuid4().hex}.parquet"
+            # Staged under a "_" name, which dataset discovery skips, so a crash or a slow write never breaks load()
+            temporary_path = os.path.join(directory, f"_{compacted_name}.tmp")
+            pq.write_table(table, temporary_path, row_group_size=64 * 1024)
+            with self._lock:
+                os.replace(temporary_path, os.path.join(directory, compacted_name))
+                for path in paths:
+                    os.remove(path)
+            replaced += len(paths)
+        return replaced
+
+
+_default_store = None
+
+
+def get_default_run_store():
+    """Process-wide run store, or None when RUN_STORE_ENABLED is false."""
+    global _default_store
+    if not RUN_STORE_ENABLED:
+        return None
+    if _default_store is None:
+        _default_store = RunStore()
+    return _default_store
+
+
+def main():
+    store = RunStore("run_store_demo")
+    rows = [dict(provider_name=provider, model_name="demo", query_text=f"query {i}", attempt=0, cache_hit=False,
+                 response_text="Avanza and Nordnet.", search_urls=["https://www.avanza.se"], url_domains=["avanza.se"],
+                 brand_name="Avanza", competitor_name="Nordnet", brand_mention=1, competitor_mention=i % 2,
+                 brand_mention_count=1, sentiment="Neutral", sentiment_polarity=0.0)
+            for provider in ("Perplexity", "Gemini", "OpenAI") for i in range(50)]
+
+    start = time.perf_counter()
+    for _ in range(20):
+        store.append(rows)
+    print(f"Appended 20 runs in {time.perf_counter() - start:.2f} s")
+    print(store.runs().head())
+
+    start = time.perf_counter()
+    df = store.load(columns=["run_id", "brand_mention"], providers=["Gemini"], brands=["Avanza"])
+    print(f"Loaded {len(df)} Gemini rows (2 columns) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    print(f"Compacted {store.compact()} files")
+    start = time.perf_counter()
+    df = store.load(columns=["run_id", "brand_mention"], providers=["Gemini"], brands=["Avanza"])
+    print(f"Loaded {len(df)} Gemini rows after compaction in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# SQLite FTS5 index of every analyzed response, so past runs can be searched without exporting them
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from itertools import accumulate
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "search_index/responses.sqlite")
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() not in ("0", "false", "no")
+
+KEY_COLUMNS = ["run_id", "provider_name", "query_text", "attempt", "brand_name"]
+_TERM = re.compile(r"\w+")
+
+
+def match_expression(text):
+    """FTS5 query for plain search text: every word must match and the last one also matches as a prefix."""
+    terms = _TERM.findall(text or "")
+    if not terms:
+        return None
+    return " ".join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+def payload_key(row):
+    """Stable stand-in for the run ID of a row indexed without one: its raw_id, or a hash of its text."""
+    return "raw:" + (row.get("raw_id") or hashlib.sha256(row["response_text"].encode("utf-8")).hexdigest())
+
+
+class SearchIndex:
+    """Full-text index over response_text and brand_mention_context of analyzed results.
+
+    Rows are keyed by (run_id, provider, query, attempt, brand), so indexing a run again after a
+    resume or a re-analysis only adds the new rows. Rows indexed without a run ID are keyed by
+    their raw payload instead, so the same answers are indexed once however often they are seen.
+    Search is ranked with BM25.
+    """
+
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Streamlit reruns scripts on different threads, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # The index can always be rebuilt from the run store, so commits need not wait for the disk
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_id INTEGER PRIMARY KEY,"
+            " run_id TEXT NOT NULL,"
+            " provider_name TEXT NOT NULL,"
+            " query_text TEXT NOT NULL,"
+            " attempt INTEGER NOT NULL,"
+            " brand_name TEXT NOT NULL,"
+            " raw_id TEXT,"
+            " indexed_at REAL NOT NULL,"
+            " UNIQUE (run_id, provider_name, query_text, attempt, brand_name))"
+        )
+        # remove_diacritics lets "kapitalforsakring" find "kapitalförsäkring", as the brand matcher folds accents
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS responses USING fts5("
+            " response_text, brand_mention_context, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        self._conn.commit()
+
+    def add(self, analyzed_results, run_id=None):
+        """Index the answered rows of `analyzed_results` under `run_id` and return how many were new."""
+        added = 0
+        now = time.time()
+        with self._lock:
+            for row in analyzed_results:
+                if row.get("error") or not row.get("response_text"):
+                    continue
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO documents (run_id, provider_name, query_text, attempt, brand_name, raw_id,"
+                    " indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (run_id or payload_key(row), row["provider_name"], row["query_text"], row.get("attempt", 0),
+                     row.get("brand_name") or "", row.get("raw_id"), now),
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO responses (rowid, response_text, brand_mention_context) VALUES (?, ?, ?)",
+                        (cursor.lastrowid, row["response_text"], row.get("brand_mention_context") or ""),
+                    )
+                    added += 1
+            self._conn.commit()
+        return added
+
+    def search(self, text, limit=20, provider=None, brand=None, run_id=None, expression=None):
+        """Best matches for `text` as dicts with the row key, raw_id, BM25 score and a highlighted snippet.
+
+        `expression` takes a raw FTS5 query instead (e.g. 'courtage NEAR(avgift, 5)' or 'isk OR kf').
+        Lower scores rank higher, as SQLite's bm25() returns them. An invalid expression raises ValueError.
+        """
+        expression = expression or match_expression(text)
+        if not expression:
+            return []
+        filters, parameters = [], [expression]
+        for column, value in (("provider_name", provider), ("brand_name", brand), ("run_id", run_id)):
+            if value:
+                filters.append(f" AND documents.{column} = ?")
+                parameters.append(value)
+        parameters.append(limit)
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT documents.run_id, documents.provider_name, documents.query_text, documents.attempt,"
+                    " documents.brand_name, documents.raw_id, bm25(responses),"
+                    " snippet(responses, -1, '**', '**', ' … ', 16)"
+                    " FROM responses JOIN documents ON documents.doc_id = responses.rowid"
+                    " WHERE responses MATCH ?" + "".join(filters) + " ORDER BY bm25(responses) LIMIT ?",
+                    parameters,
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"Invalid search {expression!r}: {e}") from e
+        return [dict(zip([*KEY_COLUMNS, "raw_id", "score", "snippet"], row)) for row in rows]
+
+    def providers(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT provider_name FROM documents ORDER BY provider_name").fetchall()]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_search_index():
+    """Process-wide search index, or None when SEARCH_INDEX_ENABLED is false."""
+    global _default_index
+    if not SEARCH_INDEX_ENABLED:
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SearchIndex()
+        return _default_index
+
+
+def main():
+    """Index 100k synthetic responses in 1k-row batches, then time ranked searches."""
+    random.seed(0)
+    path = "search_index_demo.sqlite"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    index = SearchIndex(path)
+    # Zipf-like word frequencies, so rare terms are rare as in real responses
+    topic_words = ("avanza nordnet courtage avgifter avgift fees low isk fonder app mobile trading aktier sparande "
+                   "beginners recommended platform broker sweden investment account savings fee levels "
+                   "kapitalförsäkring månadsspar utdelning").split()
+    vocabulary = topic_words + [f"word{i}" for i in range(20000)]
+    random.shuffle(vocabulary)
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    start = time.perf_counter()
+    for batch in range(100):
+        run_id = uuid.uuid4().hex
+        rows = [dict(provider_name=random.choice(["Perplexity", "Gemini", "OpenAI"]), query_text=f"query {i}",
+                     attempt=0, brand_name="Avanza",
+                     response_text=" ".join(random.choices(vocabulary, cum_weights=cum_weights, k=200)),
+                     brand_mention_context=" ".join(random.choices(vocabulary, cum_weights=cum_weights, k=30)))
+                for i in range(1000)]
+        index.add(rows, run_id)
+    print(f"Indexed {index.count()} responses in {time.perf_counter() - start:.1f} s")
+
+    most_common = vocabulary[0]
+    for text in ("fee levels", "kapitalforsakring", "månadssp", "courtage avgift", most_common):
+        start = time.perf_counter()
+        hits = index.search(text, limit=20)
+        print(f"{text!r:>24}: top {len(hits)} in {(time.perf_counter() - start) * 1000:6.1f} ms")
+    start = time.perf_counter()
+    hits = index.search(None, expression="NEAR(courtage avgift, 50)", provider="Gemini")
+    print(f"{'NEAR query, one provider':>24}: top {len(hits)} in {(time.perf_counter() - start) * 1000:6.1f} ms")
+    print(hits[0]["snippet"] if hits else "no hits")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# In-memory inverted index over the responses of one result set, for instant search in the results tab
+import random
+import re
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+from brand_matcher import fold_text
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Casefolded, accent-folded word tokens, so "Courtage" finds "courtage" and "avgifter" finds "Avgifter"."""
+    folded, _ = fold_text(text or "")
+    return _TOKEN.findall(folded)
+
+
+class TextIndex:
+    """Token -> sorted row positions over a fixed list of texts.
+
+    A query matches rows containing every term; the last term also matches as a prefix,
+    so results narrow while the user types.
+    """
+
+    def __init__(self, texts):
+        postings = {}
+        for position, text in enumerate(texts):
+            for token in set(tokenize(text)):
+                postings.setdefault(token, []).append(position)
+        self._postings = {token: np.array(positions, dtype=np.int64) for token, positions in postings.items()}
+        self._vocabulary = sorted(self._postings)
+        self.size = len(texts)
+
+    def _prefix_postings(self, prefix):
+        start = bisect_left(self._vocabulary, prefix)
+        end = bisect_left(self._vocabulary, prefix + "\U0010ffff", start)
+        matches = [self._postings[token] for token in self._vocabulary[start:end]]
+        if not matches:
+            return np.array([], dtype=np.int64)
+        return matches[0] if len(matches) == 1 else np.unique(np.concatenate(matches))
+
+    def search(self, query):
+        """Sorted row positions matching `query`; every row for an empty query."""
+        terms = tokenize(query)
+        if not terms:
+            return np.arange(self.size)
+        *whole, last = terms
+        # Intersect the rarest postings first so the running result stays small
+        postings = sorted((self._postings.get(term, np.array([], dtype=np.int64)) for term in set(whole)), key=len)
+        postings.append(self._prefix_postings(last))
+        result = postings[0]
+        for positions in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, positions, assume_unique=True)
+        return result
+
+
+def main():
+    """Benchmark index search against scanning every response with a substring match."""
+    random.seed(0)
+    vocabulary = ("avanza nordnet courtage avgifter fees low isk fonder app mobile trading aktier sparande "
+                  "beginners recommended platform broker sweden investment account savings").split()
+    texts = [" ".join(random.choice(vocabulary) for _ in range(300)) + f" ref{index}" for index in range(20000)]
+
+    start = time.perf_counter()
+    index = TextIndex(texts)
+    print(f"Indexed {len(texts)} responses in {time.perf_counter() - start:.2f} s")
+
+    for query in ("courtage", "ref1234", "low fees isk", "ref12"):
+        terms = tokenize(query)
+        start = time.perf_counter()
+        expected = [position for position, text in enumerate(texts)
+                    if all(term in tokenize(text) for term in terms[:-1])
+                    and any(token.startswith(terms[-1]) for token in tokenize(text))]
+        scan_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        found = index.search(query)
+        index_seconds = time.perf_counter() - start
+        assert list(found) == expected
+        print(f"{query!r:>14}: {len(found):>5} matches, scan {scan_seconds * 1000:7.1f} ms, "
+              f"index {index_seconds * 1000:5.2f} ms")
+
+
+if __name__ == "__main__":
+    main()